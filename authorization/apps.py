@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class AuthorizationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'authorization'
+
+    def ready(self) -> None:
+        from django.contrib.auth import get_user_model
+
+        from . import authentication
+
+        for signal in (post_save, post_delete):
+            signal.connect(authentication.user_saved, sender=get_user_model())
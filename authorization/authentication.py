@@ -0,0 +1,104 @@
+import hashlib
+import time
+from typing import Any, Iterable
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from researchdt.cache import LocalLRU, delete_many, getKey, setKey
+
+# TOKEN_CACHE_SIZE/TOKEN_CACHE_TTL: tokens of this process whose signature
+# was verified recently, and for how many seconds (never past their `exp`).
+# USER_CACHE_TTL: seconds the fields permission checks read are cached for a
+# user. A save or delete of the user drops them, a queryset update does not
+# and is picked up once they expire.
+DEFAULTS = {
+    'TOKEN_CACHE_SIZE': 4096,
+    'TOKEN_CACHE_TTL': 5 * 60,
+    'USER_CACHE_TTL': 30,
+}
+
+# Columns an authenticated user is built from, every other column is deferred
+# and loaded from the database on first access.
+AUTH_USER_FIELDS = ('id', 'is_active', 'is_staff', 'is_superuser')
+
+
+def get_options() -> dict[str, Any]:
+    return {**DEFAULTS, **getattr(settings, 'AUTH_CACHE', {})}
+
+
+_tokens = LocalLRU(get_options()['TOKEN_CACHE_SIZE'])
+
+
+def _userKey(user_id: Any) -> str:
+    return 'auth-user:%s' % user_id
+
+
+def reset_token_cache() -> None:
+    _tokens.clear()
+
+
+def invalidate_auth_users(user_ids: Iterable[Any]) -> None:
+    """Drop the cached fields of the users, again once the transaction commits."""
+    keys = [_userKey(user_id) for user_id in user_ids]
+    delete_many(keys)
+    if connection.in_atomic_block:
+        # A request reading before the commit may cache the old row again.
+        transaction.on_commit(lambda: delete_many(keys))
+
+
+def user_saved(sender: Any, instance: Any, **kwargs: Any) -> None:
+    """`post_save`/`post_delete` receiver for `User`."""
+    invalidate_auth_users([instance.pk])
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    `JWTAuthentication` that skips the work repeated on every request of a
+    client. A token whose signature was verified recently is taken from an
+    in-process LRU, and the user is resolved from a short-lived cache of the
+    columns permission checks read. `request.user` is a `User` with every
+    other column deferred: nothing is read from the database unless a view
+    touches one of them.
+    """
+
+    def get_validated_token(self, raw_token: bytes) -> Any:
+        key = hashlib.sha256(raw_token).hexdigest()
+        found, token = _tokens.get(key)
+        if found:
+            return token
+
+        token = super().get_validated_token(raw_token)
+        options = get_options()
+        remaining = token.get('exp', 0) - time.time()
+        if remaining > 0:
+            _tokens.set(key, token, min(options['TOKEN_CACHE_TTL'], remaining))
+        return token
+
+    def get_user(self, validated_token: Any) -> Any:
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user_model = get_user_model()
+        values = getKey(_userKey(user_id))
+        if values is None:
+            values = user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).values_list(
+                *AUTH_USER_FIELDS).first()
+            if values is None:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            setKey(_userKey(user_id), values, timeout=get_options()['USER_CACHE_TTL'])
+
+        loaded = dict(zip(AUTH_USER_FIELDS, values))
+        # from_db() expects the loaded columns in model order.
+        names = [field.attname for field in user_model._meta.concrete_fields if field.attname in loaded]
+        user = user_model.from_db(DEFAULT_DB_ALIAS, names, [loaded[name] for name in names])
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
@@ -0,0 +1,353 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Optional
+
+import jwt
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.exceptions import TokenBackendError
+from rest_framework_simplejwt.settings import api_settings
+
+try:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+except ImportError:  # pragma: no cover - optional dependency
+    serialization = None
+
+logger = logging.getLogger(__name__)
+
+# ENABLED: sign tokens with the keyring instead of SECRET_KEY (needs
+# cryptography). ALGORITHM: EdDSA (Ed25519) or RS256 for new keys.
+# DIRECTORY: where the keyring and the private keys are stored.
+# ROTATE_AFTER: age in seconds of the signing key after which
+# `manage.py rotate_signing_keys` creates the next one. PUBLISH_AHEAD: seconds
+# a new key is in the JWKS document before it signs, so verifiers can fetch it
+# first. REFRESH_INTERVAL: seconds between reloads of the keyring by each
+# process. LEGACY_HS256: still accept tokens signed with SECRET_KEY (they have
+# no "kid"), turn it off once the ones issued before the switch expired.
+DEFAULTS = {
+    'ENABLED': False,
+    'ALGORITHM': 'EdDSA',
+    'DIRECTORY': 'keys',
+    'ROTATE_AFTER': 30 * 24 * 60 * 60,
+    'PUBLISH_AHEAD': 60 * 60,
+    'REFRESH_INTERVAL': 60,
+    'RSA_KEY_SIZE': 3072,
+    'LEGACY_HS256': True,
+}
+
+ALGORITHMS = ('EdDSA', 'RS256')
+KEYRING_NAME = 'keyring.json'
+
+
+def get_options() -> dict[str, Any]:
+    return {**DEFAULTS, **getattr(settings, 'SIGNING_KEYS', {})}
+
+
+def _require_cryptography() -> None:
+    if serialization is None:
+        raise ImproperlyConfigured('Signing keys need cryptography, install it with "pip install cryptography".')
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64int(value: int) -> str:
+    return _b64url(value.to_bytes((value.bit_length() + 7) // 8 or 1, 'big'))
+
+
+def public_jwk(public_key: Any) -> dict[str, str]:
+    """Return the public JWK members of a key, without "kid"/"alg"/"use"."""
+    if isinstance(public_key, ed25519.Ed25519PublicKey):
+        raw = public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        return {'kty': 'OKP', 'crv': 'Ed25519', 'x': _b64url(raw)}
+    numbers = public_key.public_numbers()
+    return {'kty': 'RSA', 'n': _b64int(numbers.n), 'e': _b64int(numbers.e)}
+
+
+def key_thumbprint(jwk: dict[str, str]) -> str:
+    """RFC 7638 thumbprint of a public JWK, used as its "kid"."""
+    required = {'OKP': ('crv', 'kty', 'x'), 'RSA': ('e', 'kty', 'n')}[jwk['kty']]
+    canonical = json.dumps({member: jwk[member] for member in required}, separators=(',', ':'), sort_keys=True)
+    return _b64url(hashlib.sha256(canonical.encode('utf-8')).digest())
+
+
+def _generate_private_key(algorithm: str, options: dict[str, Any]) -> Any:
+    if algorithm == 'EdDSA':
+        return ed25519.Ed25519PrivateKey.generate()
+    if algorithm == 'RS256':
+        return rsa.generate_private_key(public_exponent=65537, key_size=options['RSA_KEY_SIZE'])
+    raise ImproperlyConfigured('Unsupported signing key algorithm %r, use one of %s.' % (algorithm, ', '.join(ALGORITHMS)))
+
+
+def _token_lifetime() -> float:
+    """Longest time a signed token stays valid, a retired key is kept that long."""
+    return max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME).total_seconds()
+
+
+def read_keyring(directory: str) -> dict[str, Any]:
+    path = os.path.join(directory, KEYRING_NAME)
+    if not os.path.exists(path):
+        return {'keys': []}
+    with open(path, encoding='utf-8') as keyring:
+        return json.load(keyring)
+
+
+def _write_keyring(directory: str, keyring: dict[str, Any]) -> None:
+    path = os.path.join(directory, KEYRING_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as target:
+        json.dump(keyring, target, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def _write_private_key(path: str, private_key: Any) -> None:
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    descriptor = os.open(path + '.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, 'wb') as target:
+        target.write(pem)
+    os.replace(path + '.tmp', path)
+
+
+def _load_private_key(directory: str, kid: str) -> Any:
+    with open(os.path.join(directory, '%s.pem' % kid), 'rb') as source:
+        return serialization.load_pem_private_key(source.read(), password=None)
+
+
+def rotate_signing_keys(directory: Optional[str] = None, force: bool = False, now: Optional[float] = None) -> Optional[dict[str, Any]]:
+    """
+    Add the next signing key when the current one is older than ROTATE_AFTER
+    (or `force`), and drop keys no unexpired token can be signed with. The
+    first key signs right away, later ones after PUBLISH_AHEAD. Return the
+    keyring entry of a new key, None when no key was added.
+    """
+    _require_cryptography()
+    options = get_options()
+    directory = str(directory or options['DIRECTORY'])
+    now = time.time() if now is None else now
+    os.makedirs(directory, exist_ok=True)
+
+    keyring = read_keyring(directory)
+    keys = keyring['keys']
+    entry = None
+    if force or not keys or now - keys[-1]['created_at'] >= options['ROTATE_AFTER']:
+        private_key = _generate_private_key(options['ALGORITHM'], options)
+        kid = key_thumbprint(public_jwk(private_key.public_key()))
+        _write_private_key(os.path.join(directory, '%s.pem' % kid), private_key)
+        entry = {
+            'kid': kid,
+            'alg': options['ALGORITHM'],
+            'created_at': now,
+            'active_from': now + options['PUBLISH_AHEAD'] if keys else now,
+        }
+        keys.append(entry)
+
+    # A key stops signing when its successor becomes active, its tokens
+    # expire at most one token lifetime later.
+    lifetime = _token_lifetime()
+    retired = [key for (key, successor) in zip(keys, keys[1:]) if successor['active_from'] + lifetime < now]
+    keyring['keys'] = [key for key in keys if key not in retired]
+    _write_keyring(directory, keyring)
+    for key in retired:
+        try:
+            os.remove(os.path.join(directory, '%s.pem' % key['kid']))
+        except FileNotFoundError:
+            pass
+    return entry
+
+
+class KeyCache:
+    """
+    The keyring of this process, indexed by "kid". A background thread
+    reloads it every REFRESH_INTERVAL, a token with an unknown "kid" makes it
+    reload at once (at most once a second).
+    """
+
+    def __init__(self, directory: str, interval: float) -> None:
+        self.directory = directory
+        self.interval = interval
+        self._entries: list[dict[str, Any]] = []
+        # kid -> (alg, private key, public key)
+        self._keys: dict[str, tuple[str, Any, Any]] = {}
+        self._mtime: Optional[float] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def reload(self) -> None:
+        path = os.path.join(self.directory, KEYRING_NAME)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        with self._lock:
+            self._loaded_at = time.monotonic()
+            if mtime == self._mtime:
+                return
+        entries = read_keyring(self.directory)['keys']
+        with self._lock:
+            known = dict(self._keys)
+        keys = {}
+        for entry in entries:
+            if entry['kid'] in known:
+                keys[entry['kid']] = known[entry['kid']]
+            else:
+                private_key = _load_private_key(self.directory, entry['kid'])
+                keys[entry['kid']] = (entry['alg'], private_key, private_key.public_key())
+        with self._lock:
+            self._entries, self._keys, self._mtime = entries, keys, mtime
+
+    def ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name='signing-keys', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.interval):
+            try:
+                self.reload()
+            except Exception:
+                logger.exception('Reloading the signing keyring failed.')
+
+    def signing_key(self, now: Optional[float] = None) -> tuple[str, str, Any]:
+        """Return `(kid, alg, private key)` of the newest active key."""
+        now = time.time() if now is None else now
+        with self._lock:
+            active = [entry for entry in self._entries if entry['active_from'] <= now]
+            if active:
+                kid = active[-1]['kid']
+                return kid, self._keys[kid][0], self._keys[kid][1]
+        raise ImproperlyConfigured('No signing key in %s, run "manage.py rotate_signing_keys".' % self.directory)
+
+    def verification_key(self, kid: str) -> Optional[tuple[str, Any]]:
+        """Return `(alg, public key)` of a key, None for an unknown "kid"."""
+        with self._lock:
+            found = self._keys.get(kid)
+            stale = time.monotonic() - self._loaded_at >= 1
+        if found is None and stale:
+            self.reload()
+            with self._lock:
+                found = self._keys.get(kid)
+        if found is None:
+            return None
+        return found[0], found[2]
+
+    def jwks(self) -> dict[str, Any]:
+        """The JWKS document of the keyring, keys not signing yet included."""
+        with self._lock:
+            keys = [(entry['kid'], *self._keys[entry['kid']]) for entry in self._entries]
+        return {'keys': [
+            {**public_jwk(public_key), 'kid': kid, 'alg': algorithm, 'use': 'sig'}
+            for (kid, algorithm, _, public_key) in keys
+        ]}
+
+
+class KeyringTokenBackend(TokenBackend):
+    """Signs with the active keyring key and puts its "kid" in the token header."""
+
+    def __init__(self, keys: KeyCache, legacy_hs256: bool = True) -> None:
+        super().__init__(
+            'HS256', api_settings.SIGNING_KEY, audience=api_settings.AUDIENCE,
+            issuer=api_settings.ISSUER, leeway=api_settings.LEEWAY)
+        self.keys = keys
+        self.legacy_hs256 = legacy_hs256
+
+    def encode(self, payload: dict[str, Any]) -> str:
+        kid, algorithm, private_key = self.keys.signing_key()
+        jwt_payload = payload.copy()
+        if self.audience is not None:
+            jwt_payload['aud'] = self.audience
+        if self.issuer is not None:
+            jwt_payload['iss'] = self.issuer
+        return jwt.encode(jwt_payload, private_key, algorithm=algorithm, headers={'kid': kid})
+
+    def decode(self, token: Any, verify: bool = True) -> dict[str, Any]:
+        try:
+            kid = jwt.get_unverified_header(token).get('kid')
+        except jwt.InvalidTokenError:
+            raise TokenBackendError(_('Token is invalid or expired'))
+        if kid is None:
+            if not self.legacy_hs256:
+                raise TokenBackendError(_('Token is invalid or expired'))
+            return super().decode(token, verify=verify)
+
+        found = self.keys.verification_key(kid)
+        if found is None:
+            raise TokenBackendError(_('Token is invalid or expired'))
+        algorithm, public_key = found
+        try:
+            return jwt.decode(
+                token,
+                public_key,
+                algorithms=[algorithm],
+                audience=self.audience,
+                issuer=self.issuer,
+                leeway=self.leeway,
+                options={
+                    'verify_aud': self.audience is not None,
+                    'verify_signature': verify,
+                },
+            )
+        except jwt.InvalidTokenError:
+            raise TokenBackendError(_('Token is invalid or expired'))
+
+
+_keys: Optional[KeyCache] = None
+_backend: Optional[KeyringTokenBackend] = None
+_keys_pid: Optional[int] = None
+_keys_lock = threading.Lock()
+
+
+def get_key_cache() -> KeyCache:
+    """Return the key cache of this process, a forked worker gets its own."""
+    global _keys, _backend, _keys_pid
+    with _keys_lock:
+        if _keys is None or _keys_pid != os.getpid():
+            options = get_options()
+            _require_cryptography()
+            _keys = KeyCache(str(options['DIRECTORY']), options['REFRESH_INTERVAL'])
+            _backend = KeyringTokenBackend(_keys, options['LEGACY_HS256'])
+            _keys_pid = os.getpid()
+            _keys.reload()
+            _keys.ensure_started()
+        return _keys
+
+
+def get_token_backend() -> TokenBackend:
+    """The backend tokens are signed and verified with."""
+    if not get_options()['ENABLED']:
+        return import_string('rest_framework_simplejwt.state.token_backend')
+    get_key_cache()
+    return _backend
+
+
+def jwks() -> dict[str, Any]:
+    if not get_options()['ENABLED']:
+        return {'keys': []}
+    return get_key_cache().jwks()
+
+
+def reset_key_cache() -> None:
+    """Stop the refresh thread of this process and forget the loaded keys."""
+    global _keys, _backend
+    with _keys_lock:
+        keys, _keys, _backend = _keys, None, None
+    if keys is not None:
+        keys.stop(timeout=1)
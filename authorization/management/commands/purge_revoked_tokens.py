@@ -0,0 +1,21 @@
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from authorization.revocation import get_options, purge_revoked_tokens
+
+
+class Command(BaseCommand):
+    help = 'Delete expired revoked tokens and load the others into the cache.'
+
+    def add_arguments(self, parser: Any) -> None:
+        parser.add_argument('--once', action='store_true', help='Purge once and exit.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        while True:
+            deleted, loaded = purge_revoked_tokens()
+            self.stdout.write('Deleted %d expired revoked tokens, %d still revoked.' % (deleted, loaded))
+            if options['once']:
+                return
+            time.sleep(get_options()['PURGE_INTERVAL'])
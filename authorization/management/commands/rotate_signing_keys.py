@@ -0,0 +1,24 @@
+from typing import Any
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from authorization.keys import rotate_signing_keys
+
+
+class Command(BaseCommand):
+    help = 'Add the next token signing key when the current one is due, and drop expired ones.'
+
+    def add_arguments(self, parser: Any) -> None:
+        parser.add_argument('--directory', help='Keyring directory, SIGNING_KEYS["DIRECTORY"] by default.')
+        parser.add_argument('--force', action='store_true', help='Add a key even if the current one is not due.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        try:
+            entry = rotate_signing_keys(options['directory'], force=options['force'])
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        if entry is None:
+            self.stdout.write('The signing key is not due for rotation.')
+        else:
+            self.stdout.write(self.style.SUCCESS('Added %s key %s.' % (entry['alg'], entry['kid'])))
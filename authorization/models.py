@@ -1,3 +1,14 @@
 from django.db import models
 
-# Create your models here.
+
+class RevokedToken(models.Model):
+    """A refresh token that must not be used again, kept until it would have expired."""
+    jti = models.CharField(max_length=64, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = 'Revoked Token'
+        verbose_name_plural = 'Revoked Tokens'
+
+    def __str__(self) -> str:
+        return self.jti
@@ -0,0 +1,75 @@
+from datetime import datetime
+from typing import Any, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from researchdt.cache import CachePipeline, getKey, setKey
+
+from .models import RevokedToken
+
+# Revoked refresh tokens, by "jti". Every revocation is a row of
+# RevokedToken and a cache key that expires with the token. The row is the
+# source of truth: a cache miss, which an evicting cache can cause for any
+# key, is answered by a primary key lookup. `manage.py purge_revoked_tokens`
+# deletes the expired rows and loads the others back into the cache every
+# PURGE_INTERVAL.
+DEFAULTS = {
+    'NAMESPACE': 'revoked',
+    'PURGE_INTERVAL': 60 * 60,
+    'CHUNK_SIZE': 10_000,
+}
+
+
+def get_options() -> dict[str, Any]:
+    return {**DEFAULTS, **getattr(settings, 'REVOCATION', {})}
+
+
+def _revokedKey(namespace: str, jti: str) -> str:
+    return '%s:%s' % (namespace, jti)
+
+
+def revoke_token(jti: str, expires_at: datetime) -> bool:
+    """Revoke a token until `expires_at`. Return False when it was already revoked."""
+    timeout = (expires_at - timezone.now()).total_seconds()
+    if timeout <= 0:
+        # Expired tokens are rejected anyway.
+        return True
+    _, created = RevokedToken.objects.get_or_create(jti=jti, defaults={'expires_at': expires_at})
+    setKey(_revokedKey(get_options()['NAMESPACE'], jti), 1, timeout=timeout)
+    return created
+
+
+def is_revoked(jti: str) -> bool:
+    namespace = get_options()['NAMESPACE']
+    if getKey(_revokedKey(namespace, jti)) is not None:
+        return True
+    expires_at = RevokedToken.objects.filter(jti=jti, expires_at__gt=timezone.now()).values_list(
+        'expires_at', flat=True).first()
+    if expires_at is None:
+        return False
+    setKey(_revokedKey(namespace, jti), 1, timeout=(expires_at - timezone.now()).total_seconds())
+    return True
+
+
+def purge_revoked_tokens(now: Optional[datetime] = None) -> tuple[int, int]:
+    """
+    Delete the rows of expired tokens and load the others into the cache.
+    Return the numbers of deleted and loaded tokens.
+    """
+    options = get_options()
+    namespace = options['NAMESPACE']
+    now = now or timezone.now()
+    deleted, _ = RevokedToken.objects.filter(expires_at__lte=now).delete()
+
+    loaded = 0
+    pipe = CachePipeline()
+    for (jti, expires_at) in RevokedToken.objects.order_by('expires_at').values_list(
+            'jti', 'expires_at').iterator(chunk_size=options['CHUNK_SIZE']):
+        # Whole seconds, so consecutive sets share a timeout and are grouped.
+        pipe.set(_revokedKey(namespace, jti), 1, timeout=max(1, int((expires_at - now).total_seconds())))
+        loaded += 1
+        if loaded % options['CHUNK_SIZE'] == 0:
+            pipe.execute()
+    pipe.execute()
+    return deleted, loaded
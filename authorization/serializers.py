@@ -2,10 +2,18 @@
 from user.models import User
 from rest_framework import exceptions, serializers
 from django.contrib.auth import authenticate
+from researchdt.aio import aget
+from researchdt.hashers import upgrade_password
+from researchdt.passwords import acheck_password, amake_password
 from user.serializers import UserInfoSerializer, UserSettingsSerializer
-from rest_framework_simplejwt.tokens import RefreshToken, TokenError
+from user.statistics import record_login
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer as BaseTokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from django.utils.translation import gettext_lazy as _
+from .tokens import RefreshToken, TokenIssuingMixin
     
-class LoginSerializer(serializers.ModelSerializer):
+class LoginSerializer(TokenIssuingMixin, serializers.ModelSerializer):
     email = serializers.CharField(max_length=255)
     password = serializers.CharField(max_length=128, write_only=True)
     info = UserInfoSerializer(read_only=True)
@@ -13,11 +21,6 @@ class LoginSerializer(serializers.ModelSerializer):
     is_research = serializers.BooleanField(read_only=True)
     tokens = serializers.SerializerMethodField()
 
-    def get_tokens(self, obj):  
-        user = User.objects.get(email=obj.email)
-
-        return {'refresh': user.tokens['refresh'], 'access': user.tokens['access']}
-
     class Meta:
         model = User
         fields = ['id', 'email', 'is_research' ,'password', 'info', 'settings', 'tokens']
@@ -32,8 +35,73 @@ class LoginSerializer(serializers.ModelSerializer):
         if user is None:
             raise exceptions.AuthenticationFailed()
 
+        self.logged_in(user, password)
         return user
+
+    @staticmethod
+    def logged_in(user, password):
+        """Upgrade a stale password hash and count the login."""
+        upgrade_password(user, password)
+        record_login(user.pk)
+
+
+class LoginCredentialsSerializer(serializers.Serializer):
+    """The login fields alone, validated without the database."""
+    email = serializers.CharField(max_length=255)
+    password = serializers.CharField(max_length=128, write_only=True)
+
+
+async def aauthenticate(email, password):
+    """
+    `authenticate()` with the model backend, without blocking the event loop:
+    the user is read in the thread of the ORM and the password is verified in
+    the hashing pool.
+    """
+    try:
+        user = await aget(User.objects.with_research().select_related('info', 'settings').by_email(email))
+    except User.DoesNotExist:
+        # Hash anyway, like ModelBackend, so unknown emails answer as slowly.
+        await amake_password(password)
+        return None
+    if not await acheck_password(password, user.password) or not user.is_active:
+        return None
+    return user
     
+class TokenRefreshSerializer(BaseTokenRefreshSerializer):
+    token_class = RefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            # The rotated token is revoked first: of concurrent refreshes
+            # with one token only the first gets a new one.
+            if api_settings.BLACKLIST_AFTER_ROTATION and not refresh.revoke():
+                raise TokenError(_('Token is revoked'))
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+
+        return data
+
+
+class JWKSerializer(serializers.Serializer):
+    kid = serializers.CharField()
+    kty = serializers.CharField()
+    alg = serializers.CharField()
+    use = serializers.CharField()
+    crv = serializers.CharField(required=False)
+    x = serializers.CharField(required=False)
+    n = serializers.CharField(required=False)
+    e = serializers.CharField(required=False)
+
+
+class JWKSSerializer(serializers.Serializer):
+    keys = JWKSerializer(many=True)
+
+
 class TokenRefreshResponseSerializer(serializers.Serializer):
     access = serializers.CharField()
 
@@ -56,6 +124,6 @@ class LogoutSerializer(serializers.Serializer):
         """Validate save backlisted token."""
 
         try:
-            RefreshToken(self.token).blacklist()
+            RefreshToken(self.token).revoke()
         except TokenError as ex:
             raise exceptions.AuthenticationFailed(ex)
\ No newline at end of file
@@ -1 +1,397 @@
-from django.test import TestCase, RequestFactory
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import Future
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipIf
+
+import jwt
+
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import AsyncRequestFactory, TestCase, RequestFactory, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+
+from researchdt import hashers, passwords
+from researchdt.exceptions import PasswordHashingUnavailable
+from researchdt.passwords import PasswordHasherPool
+from user.models import User
+from user.serializers import UserSerializer
+from . import tokens
+from .authentication import AUTH_USER_FIELDS, CachedJWTAuthentication, _tokens, reset_token_cache
+from .models import RevokedToken
+from .revocation import is_revoked, purge_revoked_tokens
+from .keys import KeyCache, get_key_cache, read_keyring, reset_key_cache, rotate_signing_keys, serialization
+from .serializers import LoginSerializer
+from .views import AsyncLoginAPIView, AsyncTokenRefreshView, LoginAPIView
+import json
+
+
+def register_user(email="login@a.com", password="jasdjasjd2!", is_research=False):
+    serializer = UserSerializer(data={
+        "email": email,
+        "password": password,
+        "is_research": is_research,
+        "info": {"name": "Login", "age": 30, "gender": "female"},
+        "settings": {"locale": "en"},
+        "system_info": {"os": "android"},
+    })
+    serializer.is_valid(raise_exception=True)
+    return serializer.save()
+
+
+class LoginTests(TestCase):
+
+    def setUp(self) -> None:
+        self.user = register_user()
+
+    def test_login_returns_tokens(self):
+        request = RequestFactory().post(
+            'api/v1/auth/login', {"email": "login@a.com", "password": "jasdjasjd2!"},
+            content_type="application/json")
+        response = LoginAPIView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        rendered_content = json.loads(response.rendered_content)
+        self.assertIn('access', rendered_content['tokens'])
+        self.assertIn('refresh', rendered_content['tokens'])
+
+    def test_login_mints_one_pair_without_refetching_user(self):
+        serializer = LoginSerializer(data={"email": "login@a.com", "password": "jasdjasjd2!"})
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data
+
+        with mock.patch('authorization.tokens.issue_tokens', wraps=tokens.issue_tokens) as issue:
+            with self.assertNumQueries(0):
+                first = serializer.get_tokens(user)
+                second = serializer.get_tokens(user)
+
+        self.assertEqual(issue.call_count, 1)
+        self.assertEqual(first, second)
+
+
+class PasswordHasherPoolTests(TestCase):
+
+    def test_hashes_in_worker_processes(self):
+        pool = PasswordHasherPool(workers=1, max_queue=4, timeout=30)
+        try:
+            encoded = pool.run(passwords._make_password, "jasdjasjd2!")
+            self.assertTrue(pool.run(passwords._verify_password, "jasdjasjd2!", encoded))
+            self.assertFalse(asyncio.run(pool.arun(passwords._verify_password, "wrong", encoded)))
+        finally:
+            pool.shutdown()
+
+        stats = pool.stats()
+        self.assertEqual(stats['completed'], 3)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertGreater(stats['latency_max'], 0)
+
+    def test_rejects_when_queue_is_full(self):
+        pool = PasswordHasherPool(workers=0, max_queue=1, timeout=0.01)
+        pool._slots.acquire()
+
+        with self.assertRaises(PasswordHashingUnavailable):
+            pool.run(passwords._make_password, "jasdjasjd2!")
+        self.assertEqual(pool.stats()['rejected'], 1)
+
+    def test_bulk_hashing_times_out_as_unavailable(self):
+        pool = PasswordHasherPool(workers=0, max_queue=4, timeout=0.01)
+        pending = [Future(), Future()]
+
+        with mock.patch.object(passwords, 'get_password_pool', return_value=pool), \
+                mock.patch.object(pool, 'submit', side_effect=pending):
+            with self.assertRaises(PasswordHashingUnavailable):
+                passwords.make_passwords(["jasdjasjd2!", "jasdjasjd3!"])
+        self.assertEqual(pool.stats()['timed_out'], 1)
+        self.assertTrue(all(future.cancelled() for future in pending))
+
+
+class PasswordHashPolicyTests(TestCase):
+
+    def setUp(self) -> None:
+        self.iterations = hashers.get_iterations()
+
+    def tearDown(self) -> None:
+        hashers.set_iterations(self.iterations)
+
+    def test_calibration_is_clamped_to_policy(self):
+        with self.settings(PASSWORD_HASH_POLICY={'BUDGET_MS': 0.01, 'MIN_ITERATIONS': 50_000}):
+            self.assertEqual(hashers.calibrate(), 50_000)
+        with self.settings(PASSWORD_HASH_POLICY={'BUDGET_MS': 10_000, 'MAX_ITERATIONS': 70_000}):
+            self.assertEqual(hashers.calibrate(), 70_000)
+        with self.settings(PASSWORD_HASH_POLICY={'ITERATIONS': 123_000}):
+            self.assertEqual(hashers.calibrate(), 123_000)
+
+    def test_calibration_never_goes_below_django_default(self):
+        with self.settings(PASSWORD_HASH_POLICY={'BUDGET_MS': 0.01}):
+            self.assertEqual(hashers.calibrate(), PBKDF2PasswordHasher.iterations)
+
+    def test_login_upgrades_stale_hash(self):
+        user = register_user()
+        user.password = PBKDF2PasswordHasher().encode("jasdjasjd2!", PBKDF2PasswordHasher().salt(), 1000)
+        user.save(update_fields=['password'])
+        self.assertTrue(hashers.needs_rehash(user.password))
+
+        serializer = LoginSerializer(data={"email": "login@a.com", "password": "jasdjasjd2!"})
+        serializer.is_valid(raise_exception=True)
+
+        user.refresh_from_db()
+        self.assertFalse(hashers.needs_rehash(user.password))
+        self.assertTrue(user.check_password("jasdjasjd2!"))
+
+
+class CachedJWTAuthenticationTests(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        reset_token_cache()
+        self.user = register_user()
+        self.access = tokens.issue_tokens(self.user)['access']
+
+    def authenticate(self, access=None):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION='Bearer %s' % (access or self.access))
+        return CachedJWTAuthentication().authenticate(request)
+
+    def test_repeated_requests_need_no_queries(self):
+        with mock.patch('rest_framework_simplejwt.authentication.JWTAuthentication.get_validated_token',
+                        autospec=True, side_effect=JWTAuthentication.get_validated_token) as verify:
+            with self.assertNumQueries(1):
+                self.authenticate()
+            with self.assertNumQueries(0):
+                user, _ = self.authenticate()
+        self.assertEqual(verify.call_count, 1)
+
+        self.assertEqual(user, self.user)
+        self.assertFalse(user.is_superuser)
+        self.assertEqual(user.get_deferred_fields(), {
+            field.attname for field in User._meta.concrete_fields if field.attname not in AUTH_USER_FIELDS})
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, 'login@a.com')
+
+    def test_saving_the_user_drops_cached_fields(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed) as raised:
+            self.authenticate()
+        self.assertEqual(raised.exception.detail['code'], 'user_inactive')
+
+    def test_deleted_user_is_rejected(self):
+        self.authenticate()
+        self.user.delete()
+
+        with self.assertRaises(AuthenticationFailed) as raised:
+            self.authenticate()
+        self.assertEqual(raised.exception.detail['code'], 'user_not_found')
+
+    def test_invalid_token_is_not_cached(self):
+        with self.assertRaises(InvalidToken):
+            self.authenticate(self.access[:-2] + 'xx')
+        self.assertEqual(len(_tokens), 0)
+
+    def test_profile_get_authenticates_from_cache(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer %s' % self.access)
+        url = '/api/v1/users/%s' % self.user.pk
+        self.assertEqual(client.get(url).status_code, 200)
+
+        with self.assertNumQueries(0):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+
+class SigningKeyTests(TestCase):
+
+    def setUp(self) -> None:
+        reset_key_cache()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.addCleanup(reset_key_cache)
+        self.user = register_user()
+
+    def keyring_settings(self, **options):
+        return override_settings(SIGNING_KEYS={'ENABLED': True, 'DIRECTORY': self.directory, **options})
+
+    def test_disabled_keeps_secret_key_signing(self):
+        issued = tokens.issue_tokens(self.user)
+        self.assertNotIn('kid', jwt.get_unverified_header(issued['access']))
+        self.assertEqual(self.client.get('/api/v1/auth/jwks').json(), {'keys': []})
+
+        response = self.client.post('/api/v1/auth/refresh', {'refresh': issued['refresh']}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.json())
+
+    @skipIf(serialization is not None, 'cryptography is installed')
+    def test_rotation_needs_cryptography(self):
+        with self.assertRaises(CommandError):
+            call_command('rotate_signing_keys', directory=self.directory)
+
+    @skipIf(serialization is None, 'cryptography is not installed')
+    def test_tokens_carry_the_kid_of_the_signing_key(self):
+        with self.keyring_settings():
+            entry = rotate_signing_keys(self.directory)
+            issued = tokens.issue_tokens(self.user)
+
+            self.assertEqual(jwt.get_unverified_header(issued['access'])['kid'], entry['kid'])
+            self.assertEqual(tokens.AccessToken(issued['access'])['user_id'], str(self.user.pk))
+            keys = self.client.get('/api/v1/auth/jwks').json()['keys']
+            self.assertEqual([(key['kid'], key['kty'], key['crv']) for key in keys], [(entry['kid'], 'OKP', 'Ed25519')])
+
+    @skipIf(serialization is None, 'cryptography is not installed')
+    def test_next_key_is_published_before_it_signs(self):
+        now = time.time()
+        with self.keyring_settings(PUBLISH_AHEAD=60):
+            first = rotate_signing_keys(self.directory, now=now - 120)
+            old_access = tokens.issue_tokens(self.user)['access']
+            second = rotate_signing_keys(self.directory, force=True, now=now)
+
+            keys = get_key_cache()
+            keys.reload()
+            self.assertEqual([key['kid'] for key in keys.jwks()['keys']], [first['kid'], second['kid']])
+            self.assertEqual(keys.signing_key(now)[0], first['kid'])
+            self.assertEqual(keys.signing_key(now + 61)[0], second['kid'])
+            tokens.AccessToken(old_access)
+
+    @skipIf(serialization is None, 'cryptography is not installed')
+    def test_expired_keys_are_dropped(self):
+        now = time.time()
+        with self.keyring_settings(PUBLISH_AHEAD=0):
+            first = rotate_signing_keys(self.directory, now=now - 20 * 24 * 3600)
+            second = rotate_signing_keys(self.directory, force=True, now=now - 16 * 24 * 3600)
+            rotate_signing_keys(self.directory, now=now)
+
+        self.assertEqual([key['kid'] for key in read_keyring(self.directory)['keys']], [second['kid']])
+        self.assertFalse(os.path.exists(os.path.join(self.directory, '%s.pem' % first['kid'])))
+
+    @skipIf(serialization is None, 'cryptography is not installed')
+    def test_failed_reload_is_logged(self):
+        with self.keyring_settings():
+            entry = rotate_signing_keys(self.directory)
+        with open(os.path.join(self.directory, '%s.pem' % entry['kid']), 'w') as pem:
+            pem.write('corrupt')
+
+        keys = KeyCache(self.directory, interval=0.01)
+        with self.assertLogs('authorization.keys', 'ERROR') as logs:
+            keys.ensure_started()
+            deadline = time.monotonic() + 5
+            while not logs.records and time.monotonic() < deadline:
+                time.sleep(0.01)
+            keys.stop(5)
+        self.assertEqual(logs.records[0].getMessage(), 'Reloading the signing keyring failed.')
+        self.assertIsNotNone(logs.records[0].exc_info)
+
+    @skipIf(serialization is None, 'cryptography is not installed')
+    def test_legacy_tokens_until_turned_off(self):
+        legacy = tokens.issue_tokens(self.user)['access']
+        with self.keyring_settings():
+            rotate_signing_keys(self.directory)
+            tokens.AccessToken(legacy)
+        reset_key_cache()
+        with self.keyring_settings(LEGACY_HS256=False):
+            with self.assertRaises(TokenError):
+                tokens.AccessToken(legacy)
+
+
+class RevocationTests(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = register_user()
+        self.refresh = tokens.issue_tokens(self.user)['refresh']
+
+    def post(self, path, refresh):
+        return self.client.post('/api/v1/auth/%s' % path, {'refresh': refresh}, content_type='application/json')
+
+    def test_logout_revokes_the_refresh_token(self):
+        self.assertEqual(self.post('logout', self.refresh).status_code, 204)
+
+        jti = tokens.RefreshToken(self.refresh, verify=False)['jti']
+        self.assertTrue(RevokedToken.objects.filter(jti=jti).exists())
+        self.assertEqual(self.post('refresh', self.refresh).status_code, 401)
+        self.assertEqual(self.post('logout', self.refresh).status_code, 401)
+
+    def test_rotation_revokes_the_old_token(self):
+        response = self.post('refresh', self.refresh)
+        self.assertEqual(response.status_code, 200)
+        rotated = response.json()['refresh']
+
+        self.assertEqual(self.post('refresh', self.refresh).status_code, 401)
+        self.assertEqual(self.post('refresh', rotated).status_code, 200)
+
+    def test_revoked_check_needs_no_query_once_cached(self):
+        tokens.RefreshToken(self.refresh).revoke()
+        jti = tokens.RefreshToken(self.refresh, verify=False)['jti']
+        with self.assertNumQueries(0):
+            self.assertTrue(is_revoked(jti))
+
+    def test_cache_miss_falls_back_to_the_database(self):
+        token = tokens.RefreshToken(self.refresh)
+        token.revoke()
+        cache.clear()
+
+        with self.assertNumQueries(1):
+            self.assertTrue(is_revoked(token['jti']))
+        with self.assertNumQueries(1):
+            self.assertFalse(is_revoked('unknown'))
+
+        cache.clear()
+        call_command('purge_revoked_tokens', once=True, stdout=StringIO())
+        with self.assertNumQueries(0):
+            self.assertTrue(is_revoked(token['jti']))
+
+        # An evicting cache may drop the key of any revoked token.
+        cache.delete('revoked:%s' % token['jti'])
+        with self.assertNumQueries(1):
+            self.assertTrue(is_revoked(token['jti']))
+
+    def test_purge_drops_expired_tokens(self):
+        expired = RevokedToken.objects.create(jti='expired', expires_at=timezone.now() - timedelta(seconds=1))
+        tokens.RefreshToken(self.refresh).revoke()
+
+        self.assertEqual(purge_revoked_tokens(), (1, 1))
+        self.assertFalse(RevokedToken.objects.filter(pk=expired.pk).exists())
+        self.assertFalse(is_revoked('expired'))
+
+
+class AsyncAuthViewTests(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = register_user()
+
+    async def login(self, email, password):
+        request = AsyncRequestFactory().post(
+            'api/v1/auth/login', {"email": email, "password": password}, content_type="application/json")
+        return await AsyncLoginAPIView.as_view()(request)
+
+    async def test_login(self):
+        response = await self.login("Login@a.com", "jasdjasjd2!")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['email'], "login@a.com")
+        self.assertIn('refresh', response.data['tokens'])
+
+    async def test_bad_credentials(self):
+        for (email, password) in (("login@a.com", "wrong"), ("nobody@a.com", "jasdjasjd2!")):
+            response = await self.login(email, password)
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response.data['error']['details']['code'], 'bad_credentials')
+
+    async def test_refresh_rotates(self):
+        refresh = (await self.login("login@a.com", "jasdjasjd2!")).data['tokens']['refresh']
+        view = AsyncTokenRefreshView.as_view()
+
+        def post():
+            return AsyncRequestFactory().post('api/v1/auth/refresh', {"refresh": refresh}, content_type="application/json")
+
+        response = await view(post())
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('refresh', response.data)
+        self.assertEqual((await view(post())).status_code, 401)
@@ -0,0 +1,57 @@
+from typing import Any
+
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .keys import get_token_backend
+from .revocation import is_revoked, revoke_token
+
+
+class KeyringTokenMixin:
+    """Sign and verify with the project's backend, see authorization/keys.py."""
+
+    @property
+    def token_backend(self) -> Any:
+        return get_token_backend()
+
+
+class AccessToken(KeyringTokenMixin, tokens.AccessToken):
+    pass
+
+
+class RefreshToken(KeyringTokenMixin, tokens.RefreshToken):
+    access_token_class = AccessToken
+
+    def verify(self) -> None:
+        super().verify()
+        if is_revoked(self[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is revoked'))
+
+    def revoke(self) -> bool:
+        """Revoke this token until it expires. Return False when it already was."""
+        return revoke_token(self[api_settings.JTI_CLAIM], datetime_from_epoch(self['exp']))
+
+
+def issue_tokens(user: Any) -> dict[str, str]:
+    """Mint a single refresh/access pair for the given user."""
+    refresh = RefreshToken.for_user(user)
+    return {'refresh': str(refresh), 'access': str(refresh.access_token)}
+
+
+class TokenIssuingMixin:
+    """
+    Serializer mixin for a `tokens = serializers.SerializerMethodField()` field.
+
+    Tokens are minted from the object being serialized (no extra user lookup)
+    and memoized on the serializer instance, so reading `serializer.data`
+    more than once does not sign a new pair every time.
+    """
+
+    def get_tokens(self, obj: Any) -> dict[str, str]:
+        issued = self.__dict__.setdefault('_issued_tokens', {})
+        if obj.pk not in issued:
+            issued[obj.pk] = issue_tokens(obj)
+        return issued[obj.pk]
@@ -1,14 +1,27 @@
+from django.conf import settings
 from django.urls import path
 from rest_framework_simplejwt.views import TokenRefreshView
 
 from .views import (
+    AsyncLoginAPIView,
+    AsyncTokenRefreshView,
     LoginAPIView,
-    DecoratedTokenRefreshView
+    DecoratedTokenRefreshView,
+    JWKSAPIView,
+    LogoutAPIView
 )
 
 #app_name = 'user'
 
+# ASYNC_VIEWS serves the hot endpoints from coroutines, see researchdt/asgi.py
+if settings.ASYNC_VIEWS:
+    LoginView, RefreshView = AsyncLoginAPIView, AsyncTokenRefreshView
+else:
+    LoginView, RefreshView = LoginAPIView, DecoratedTokenRefreshView
+
 urlpatterns = [
-    path('/login', LoginAPIView.as_view(), name='login_user'),
-    path('/refresh', DecoratedTokenRefreshView.as_view(), name='token_refresh'),
-]
\ No newline at end of file
+    path('/login', LoginView.as_view(), name='login_user'),
+    path('/refresh', RefreshView.as_view(), name='token_refresh'),
+    path('/logout', LogoutAPIView.as_view(), name='logout_user'),
+    path('/jwks', JWKSAPIView.as_view(), name='jwks'),
+]
@@ -3,15 +3,28 @@ from rest_framework.response import Response
 from rest_framework import status, exceptions, serializers
 from rest_framework.permissions import AllowAny
 
-from rest_framework.generics import CreateAPIView
+from rest_framework.generics import CreateAPIView, GenericAPIView
+from rest_framework.views import APIView
+from django.utils.cache import patch_cache_control
+from asgiref.sync import sync_to_async
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 
 from authorization.exceptions import InvalidCredentials
 
-from .serializers import LoginSerializer, TokenRefreshResponseSerializer
+from .keys import get_options as get_key_options, jwks
+from .serializers import (
+    JWKSSerializer,
+    LoginCredentialsSerializer,
+    LoginSerializer,
+    LogoutSerializer,
+    TokenRefreshResponseSerializer,
+    aauthenticate
+)
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework_simplejwt.views import (
     TokenRefreshView
 )
+from researchdt.aio import AsyncAPIViewMixin
 from researchdt.swagger import SwaggerResponses
 
 
@@ -57,4 +70,79 @@ class DecoratedTokenRefreshView(TokenRefreshView):
         }
     )
     def post(self, request, *args, **kwargs):
-        return super().post(request, *args, **kwargs)
\ No newline at end of file
+        return super().post(request, *args, **kwargs)
+
+
+class AsyncLoginAPIView(AsyncAPIViewMixin, LoginAPIView):
+
+    async def post(self, request: Request) -> Response:
+        """Return user after login."""
+
+        credentials = LoginCredentialsSerializer(data=request.data)
+        credentials.is_valid(raise_exception=True)
+        email, password = credentials.validated_data['email'], credentials.validated_data['password']
+
+        user = await aauthenticate(email, password)
+        if user is None:
+            raise InvalidCredentials
+
+        def logged_in():
+            self.serializer_class.logged_in(user, password)
+            return self.serializer_class(user).data
+
+        return Response(await sync_to_async(logged_in)(), status=status.HTTP_200_OK)
+
+
+class AsyncTokenRefreshView(AsyncAPIViewMixin, DecoratedTokenRefreshView):
+
+    async def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        try:
+            # Revocation is checked and recorded in the database.
+            await sync_to_async(serializer.is_valid)(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+        return Response(serializer.validated_data, status=status.HTTP_200_OK)
+
+
+class LogoutAPIView(GenericAPIView):
+    permission_classes = (AllowAny,)
+    serializer_class = LogoutSerializer
+
+    @swagger_auto_schema(
+        operation_id='Logout user',
+        security=[],
+        responses={
+            status.HTTP_204_NO_CONTENT: 'Refresh token revoked',
+            status.HTTP_400_BAD_REQUEST: SwaggerResponses.get_validation_error_schema(),
+            status.HTTP_401_UNAUTHORIZED: SwaggerResponses.get_common_schema('Unathorized', 401, 'authentication_failed'),
+            status.HTTP_500_INTERNAL_SERVER_ERROR: SwaggerResponses.get_common_schema('Internal server error', 500, 'internal_server_error')
+        }
+    )
+    def post(self, request: Request) -> Response:
+        """Revoke the refresh token, it cannot be refreshed again."""
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class JWKSAPIView(APIView):
+    permission_classes = (AllowAny,)
+    authentication_classes = ()
+
+    @swagger_auto_schema(
+        operation_id='Token verification keys',
+        security=[],
+        responses={
+            status.HTTP_200_OK: JWKSSerializer,
+            status.HTTP_500_INTERNAL_SERVER_ERROR: SwaggerResponses.get_common_schema('Internal server error', 500, 'internal_server_error')
+        }
+    )
+    def get(self, request: Request) -> Response:
+        """Return the public keys tokens are signed with, as a JWKS document."""
+
+        response = Response(jwks(), status=status.HTTP_200_OK)
+        patch_cache_control(response, public=True, max_age=get_key_options()['REFRESH_INTERVAL'])
+        return response
@@ -0,0 +1,162 @@
+"""
+Compare the async views under ASGI with the sync views under WSGI at high
+concurrency.
+
+    python benchmarks/bench_asgi.py [--concurrency 200] [--requests 2000]
+
+Each mode runs in its own process (ASYNC_VIEWS is read when the URLs load)
+against a throwaway test database. The WSGI mode serves requests from a pool
+of `--concurrency` threads, like a threaded WSGI server; the ASGI mode runs
+`--concurrency` concurrent requests on one event loop through Django's ASGI
+handler. Reported per scenario: requests per second and p50/p99 latency.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'researchdt.settings')
+
+MODES = {'wsgi': '0', 'asgi': '1'}
+PASSWORD = 'benchmark2!'
+
+
+def populate(count):
+    from authorization.tokens import issue_tokens
+    from user.serializers import UserSerializer
+
+    users = []
+    for number in range(count):
+        serializer = UserSerializer(data={
+            'email': 'bench%d@a.com' % number,
+            'password': PASSWORD,
+            'is_research': number % 2 == 0,
+            'info': {'name': 'Bench', 'age': 30, 'gender': 'male'},
+            'settings': {'locale': 'en'},
+            'system_info': {'os': 'ios'},
+        })
+        serializer.is_valid(raise_exception=True)
+        user = serializer.save()
+        users.append((user, issue_tokens(user)['access']))
+    return users
+
+
+def scenarios(users):
+    """(name, [(method, path, data, headers)]) of the measured requests."""
+    profile = [('get', '/api/v1/users/%s' % user.pk, None, {'HTTP_AUTHORIZATION': 'Bearer %s' % access})
+               for (user, access) in users]
+    login = [('post', '/api/v1/auth/login', {'email': user.email, 'password': PASSWORD}, {})
+             for (user, _) in users]
+    return [('profile', profile), ('login', login)]
+
+
+def report(name, results, elapsed):
+    latencies = sorted(latency for (latency, status) in results)
+    # 503: the password hashing pool shed the login (PASSWORD_HASHING TIMEOUT).
+    rejected = sum(1 for (latency, status) in results if status == 503)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print('  %-8s %8.0f req/s  p50 %7.1f ms  p99 %7.1f ms  %d rejected' % (
+        name, len(latencies) / elapsed, statistics.median(latencies) * 1000, p99 * 1000, rejected))
+
+
+def checked(response):
+    assert response.status_code in (200, 503), response.content
+    return response.status_code
+
+
+def run_wsgi(requests, concurrency):
+    from django.test import Client
+
+    def call(request):
+        method, path, data, headers = request
+        started = time.perf_counter()
+        response = getattr(Client(), method)(path, data, content_type='application/json', **headers)
+        return time.perf_counter() - started, checked(response)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(call, requests))
+    return results, time.perf_counter() - started
+
+
+def run_asgi(requests, concurrency):
+    from django.test import AsyncClient
+
+    async def main():
+        slots = asyncio.Semaphore(concurrency)
+        client = AsyncClient()
+
+        async def call(request):
+            method, path, data, headers = request
+            # AsyncClient takes the header names, not their WSGI environ keys.
+            headers = {name[5:].lower().replace('_', '-'): value for (name, value) in headers.items()}
+            async with slots:
+                started = time.perf_counter()
+                response = await getattr(client, method)(path, data, content_type='application/json', **headers)
+                return time.perf_counter() - started, checked(response)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*[call(request) for request in requests])
+        return results, time.perf_counter() - started
+
+    return asyncio.run(main())
+
+
+def child(options):
+    # Read when the URLs load.
+    os.environ['DJANGO_ASYNC_VIEWS'] = MODES[options.mode]
+    import django
+
+    django.setup()
+
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    from researchdt.hashers import calibrate
+    from researchdt.passwords import get_password_pool
+
+    calibrate()
+    get_password_pool().start()
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        users = populate(options.users)
+        print('%s (%s views), %d concurrent' % (
+            options.mode, 'async' if settings.ASYNC_VIEWS else 'sync', options.concurrency))
+        run = run_asgi if options.mode == 'asgi' else run_wsgi
+        for (name, pool) in scenarios(users):
+            count = options.requests if name == 'profile' else options.logins
+            requests = [pool[number % len(pool)] for number in range(count)]
+            # Warm the caches and connections first.
+            run(requests[:len(pool)], options.concurrency)
+            results, elapsed = run(requests, options.concurrency)
+            report(name, results, elapsed)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        get_password_pool().shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=['both', *MODES], default='both')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--logins', type=int, default=200)
+    options = parser.parse_args()
+
+    if options.mode != 'both':
+        return child(options)
+    for mode in MODES:
+        subprocess.run([sys.executable, __file__, *sys.argv[1:], '--mode', mode], check=True)
+
+
+if __name__ == '__main__':
+    main()
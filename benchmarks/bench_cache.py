@@ -0,0 +1,83 @@
+"""
+Compare N single-key cache calls with one batched call.
+
+    python benchmarks/bench_cache.py [--keys 1000] [--redis-url redis://localhost:6379/0]
+
+Runs against locmem, and against a Redis-compatible server (redis-server,
+KeyDB, a local stand-in...) when --redis-url is given.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'researchdt.settings')
+
+import django
+
+django.setup()
+
+from django.core.cache import cache
+from django.test import override_settings
+
+from researchdt.cache import delete_many, deleteKey, get_many, getKey, pipeline, set_many, setKey
+
+
+def timed(function):
+    started = time.perf_counter()
+    function()
+    return time.perf_counter() - started
+
+
+def single_calls(keys):
+    return {
+        'set': timed(lambda: [setKey(key, key) for key in keys]),
+        'get': timed(lambda: [getKey(key) for key in keys]),
+        'delete': timed(lambda: [deleteKey(key) for key in keys]),
+    }
+
+
+def batched_calls(keys):
+    def piped():
+        with pipeline() as pipe:
+            for key in keys:
+                pipe.set(key, key)
+            for key in keys:
+                pipe.get(key)
+
+    return {
+        'set': timed(lambda: set_many({key: key for key in keys})),
+        'get': timed(lambda: get_many(keys)),
+        'delete': timed(lambda: delete_many(keys)),
+        'pipeline set+get': timed(piped),
+    }
+
+
+def run(name, caches, count):
+    keys = ['bench:%d' % number for number in range(count)]
+    with override_settings(CACHES=caches):
+        cache.clear()
+        single = single_calls(keys)
+        batched = batched_calls(keys)
+        cache.clear()
+
+    print('%s, %d keys' % (name, count))
+    for operation, elapsed in single.items():
+        print('  %-18s single %8.2f ms   batched %8.2f ms' % (operation, elapsed * 1000, batched[operation] * 1000))
+    print('  %-18s                    batched %8.2f ms' % ('pipeline set+get', batched['pipeline set+get'] * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--keys', type=int, default=1000)
+    parser.add_argument('--redis-url')
+    options = parser.parse_args()
+
+    run('locmem', {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench'}}, options.keys)
+    if options.redis_url:
+        run('redis', {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': options.redis_url}}, options.keys)
+
+
+if __name__ == '__main__':
+    main()
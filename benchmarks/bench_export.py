@@ -0,0 +1,73 @@
+"""
+Measure throughput and peak memory of the streaming user export.
+
+    python benchmarks/bench_export.py [--users 20000] [--chunk-size 2000]
+
+Runs in a throwaway test database. Peak memory should stay flat when
+--users grows, throughput is reported in rows per second.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'researchdt.settings')
+
+import django
+
+django.setup()
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+
+from user.export import export_stream
+from user.models import User, UserActivity, UserInfo, UserSettings, UserSystemInfo
+
+
+def populate(count):
+    password = make_password('benchmark')
+    for start in range(0, count, 1000):
+        users = User.objects.bulk_create([
+            User(email='bench%d@a.com' % number, password=password) for number in range(start, min(start + 1000, count))
+        ])
+        UserInfo.objects.bulk_create([UserInfo(user=user, name='Bench', age=30, gender='male') for user in users])
+        UserSettings.objects.bulk_create([UserSettings(user=user, locale='en') for user in users])
+        UserSystemInfo.objects.bulk_create([UserSystemInfo(user=user, os='ios') for user in users])
+        UserActivity.objects.bulk_create([UserActivity(user=user) for user in users])
+
+
+def measure(file_format, compress, chunk_size):
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = 0
+    for chunk in export_stream(file_format, compress=compress, chunk_size=chunk_size):
+        size += len(chunk)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, size, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--chunk-size', type=int, default=2000)
+    options = parser.parse_args()
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        populate(options.users)
+        print('%d users, chunk size %d' % (options.users, options.chunk_size))
+        for (file_format, compress) in (('ndjson', False), ('csv', False), ('ndjson', True), ('csv', True)):
+            elapsed, size, peak = measure(file_format, compress, options.chunk_size)
+            print('  %-6s %-5s %10.0f rows/s %10.1f MB %8.1f MB peak' % (
+                file_format, 'gzip' if compress else '', options.users / elapsed, size / 2 ** 20, peak / 2 ** 20))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Compare DRF's JSONRenderer/JSONParser with FastJSONRenderer/FastJSONParser.
+
+    python benchmarks/bench_json.py [--users 10] [--rounds 2000]
+
+Payloads are built by the serializers of the API in a throwaway test
+database: a user profile (RetrieveUpdateUserSerializer), a page of --users
+profiles, and a login response with its tokens (LoginSerializer).
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'researchdt.settings')
+
+import django
+
+django.setup()
+
+from django.db import connection
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from authorization.serializers import LoginSerializer
+from researchdt.parsers import FastJSONParser
+from researchdt.renderers import FastJSONRenderer, orjson
+from user.models import User, UserInfo, UserSettings, UserSystemInfo
+from user.serializers import RetrieveUpdateUserSerializer
+
+
+def populate(count):
+    users = User.objects.bulk_create([
+        User(email='bench%d@a.com' % number, password='!') for number in range(count)
+    ])
+    UserInfo.objects.bulk_create([UserInfo(user=user, name='Bench Ünïcode', age=30, gender='male') for user in users])
+    UserSettings.objects.bulk_create([UserSettings(user=user, locale='en') for user in users])
+    UserSystemInfo.objects.bulk_create([UserSystemInfo(user=user, os='ios') for user in users])
+    queryset = User.objects.with_research().select_related('info', 'settings', 'system_info')
+    return list(queryset.prefetch_related('groups'))
+
+
+def payloads(users):
+    profiles = RetrieveUpdateUserSerializer(users, many=True).data
+    login = LoginSerializer(users[0]).data
+    page = {'count': len(users), 'next': None, 'previous': None, 'results': profiles}
+    return [('profile', profiles[0]), ('page', page), ('login', login)]
+
+
+def timed(function, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        function()
+    return (time.perf_counter() - started) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--rounds', type=int, default=2000)
+    options = parser.parse_args()
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        users = populate(options.users)
+        print('orjson %s, %d rounds' % (orjson.__version__ if orjson else 'not installed', options.rounds))
+        for (name, data) in payloads(users):
+            body = JSONRenderer().render(data)
+            assert FastJSONParser().parse(io.BytesIO(FastJSONRenderer().render(data))) == JSONParser().parse(
+                io.BytesIO(body))
+            render = [timed(lambda: renderer.render(data), options.rounds)
+                      for renderer in (JSONRenderer(), FastJSONRenderer())]
+            parse = [timed(lambda: json_parser.parse(io.BytesIO(body)), options.rounds)
+                     for json_parser in (JSONParser(), FastJSONParser())]
+            print('  %-8s %6d B  render %7.1f -> %6.1f us (x%.1f)  parse %7.1f -> %6.1f us (x%.1f)' % (
+                name, len(body), render[0] * 1e6, render[1] * 1e6, render[0] / render[1],
+                parse[0] * 1e6, parse[1] * 1e6, parse[0] / parse[1]))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
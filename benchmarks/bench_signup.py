@@ -0,0 +1,117 @@
+"""
+Measure a sign-up burst against a large user table, with and without the
+Bloom filter of registered emails: the email pre-check alone, then the full
+create path (validation, inserts and the filter update of each new email).
+
+    python benchmarks/bench_signup.py [--users 200000] [--signups 5000] [--creates 1000]
+
+Runs in a throwaway test database with the locmem cache. Most emails of the
+burst are new, a few are already registered. Passwords of the created users
+are hashed once up front, the hashing pool is measured by its own numbers.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'researchdt.settings')
+
+import django
+
+django.setup()
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection, reset_queries
+from django.test import override_settings
+
+from user.email_filter import rebuild_email_filter, reset_email_filter
+from user.models import User
+from user.serializers import UserSerializer
+
+PASSWORD = 'benchmark2!'
+
+
+def populate(count):
+    for start in range(0, count, 5000):
+        User.objects.bulk_create([User(email='member%d@a.com' % number, password='!')
+                                  for number in range(start, min(start + 5000, count))])
+
+
+def burst(emails):
+    serializer = UserSerializer()
+    reset_queries()
+    started = time.perf_counter()
+    rejected = 0
+    for email in emails:
+        try:
+            serializer.validate_email(email)
+        except Exception:
+            rejected += 1
+    return time.perf_counter() - started, len(connection.queries), rejected
+
+
+def create_burst(emails, encoded_password):
+    reset_queries()
+    started = time.perf_counter()
+    rejected = 0
+    for email in emails:
+        serializer = UserSerializer(data={
+            'email': email,
+            'password': PASSWORD,
+            'is_research': False,
+            'info': {'name': 'Bench', 'age': 30, 'gender': 'male'},
+            'settings': {'locale': 'en'},
+            'system_info': {'os': 'ios'},
+        })
+        if serializer.is_valid():
+            serializer.save(encoded_password=encoded_password)
+        else:
+            rejected += 1
+    return time.perf_counter() - started, len(connection.queries), rejected
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=200000)
+    parser.add_argument('--signups', type=int, default=5000)
+    parser.add_argument('--creates', type=int, default=1000)
+    options = parser.parse_args()
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        with override_settings(DEBUG=True):
+            populate(options.users)
+            # One in a hundred sign-ups reuses a registered email.
+            emails = ['member%d@a.com' % number if number % 100 == 0 else 'new%d@a.com' % number
+                      for number in range(options.signups)]
+
+            started = time.perf_counter()
+            rebuild_email_filter()
+            print('%d users, filter rebuilt in %.2f s' % (options.users, time.perf_counter() - started))
+
+            for (name, settings) in (('database only', {'ENABLED': False}), ('bloom filter', {'ENABLED': True})):
+                with override_settings(EMAIL_FILTER=settings):
+                    reset_email_filter()
+                    elapsed, queries, rejected = burst(emails)
+                print('  %-14s %8.1f ms %6d queries %5d rejected' % (name, elapsed * 1000, queries, rejected))
+
+            encoded_password = make_password(PASSWORD)
+            print('full create path, %d sign-ups' % options.creates)
+            for (name, settings) in (('database only', {'ENABLED': False}), ('bloom filter', {'ENABLED': True})):
+                emails = ['member%d@a.com' % number if number % 100 == 0 else '%s%d@a.com' % (name[0], number)
+                          for number in range(options.creates)]
+                with override_settings(EMAIL_FILTER=settings):
+                    reset_email_filter()
+                    elapsed, queries, rejected = create_burst(emails, encoded_password)
+                print('  %-14s %8.1f ms %6d queries %5d rejected  %.2f ms per sign-up' % (
+                    name, elapsed * 1000, queries, rejected, elapsed * 1000 / options.creates))
+    finally:
+        cache.clear()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+import asyncio
+import queue
+import threading
+from typing import Any, Iterable, Iterator
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.db.models import QuerySet
+
+# Django 4.1 added aget()/acreate()/aexists() to querysets, they run the sync
+# method in the thread of the ORM. These helpers use them where they exist
+# and do the same before.
+
+
+async def aget(queryset: QuerySet, *args: Any, **kwargs: Any) -> Any:
+    if hasattr(queryset, 'aget'):
+        return await queryset.aget(*args, **kwargs)
+    return await sync_to_async(queryset.get)(*args, **kwargs)
+
+
+async def acreate(queryset: Any, **kwargs: Any) -> Any:
+    """`create()` of a manager or queryset."""
+    if hasattr(queryset, 'acreate'):
+        return await queryset.acreate(**kwargs)
+    return await sync_to_async(queryset.create)(**kwargs)
+
+
+async def aexists(queryset: QuerySet) -> bool:
+    if hasattr(queryset, 'aexists'):
+        return await queryset.aexists()
+    return await sync_to_async(queryset.exists)()
+
+
+def iterate_in_thread(iterable: Iterable[Any], buffer_size: int = 4) -> Iterator[Any]:
+    """
+    Yield the items of `iterable`, produced in a thread of their own at most
+    `buffer_size` ahead. Django 4.0's ASGI handler iterates a streaming
+    response on the event loop, where the ORM refuses to run: a body that
+    reads the database is wrapped with this.
+    """
+    items: queue.Queue = queue.Queue(maxsize=buffer_size)
+    stopped = threading.Event()
+
+    def put(item: tuple[bool, Any]) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in iterable:
+                if not put((True, item)):
+                    return
+            put((False, None))
+        except BaseException as exc:
+            put((False, exc))
+        finally:
+            connections.close_all()
+
+    threading.Thread(target=produce, name='stream-producer', daemon=True).start()
+    try:
+        while True:
+            more, item = items.get()
+            if not more:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        # The client went away or the body was read, the producer stops.
+        stopped.set()
+
+
+class AsyncAPIViewMixin:
+    """
+    Serve a DRF view from a coroutine, for handlers written as `async def`.
+
+    DRF dispatches synchronously, so under ASGI Django runs every DRF view in
+    the thread of the ORM. Views with this mixin are coroutines: the request
+    is authenticated and checked in one hop to that thread, the handler runs
+    on the event loop and only hops for the database work it awaits. The
+    view's sync handlers run in that thread together with the checks.
+    """
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        # An async handler is documented like the sync handler it replaces.
+        for method in cls.http_method_names:
+            handler = cls.__dict__.get(method)
+            if handler is None or hasattr(handler, '_swagger_auto_schema'):
+                continue
+            for base in cls.__mro__[1:]:
+                if method in base.__dict__:
+                    schema = getattr(base.__dict__[method], '_swagger_auto_schema', None)
+                    if schema is not None:
+                        handler._swagger_auto_schema = schema
+                    break
+
+    @classmethod
+    def as_view(cls, **initkwargs: Any) -> Any:
+        view = super().as_view(**initkwargs)
+
+        async def async_view(request: Any, *args: Any, **kwargs: Any) -> Any:
+            self = cls(**initkwargs)
+            self.setup(request, *args, **kwargs)
+            return await self.adispatch(request, *args, **kwargs)
+
+        # What DRF's as_view() sets on its view, for csrf_exempt, the URL
+        # resolver and schema generation.
+        async_view.__dict__.update({key: value for (key, value) in view.__dict__.items() if key != '__wrapped__'})
+        async_view.__name__ = view.__name__
+        async_view.__doc__ = view.__doc__
+        return async_view
+
+    async def adispatch(self, request: Any, *args: Any, **kwargs: Any) -> Any:
+        """`APIView.dispatch()` awaiting the handler."""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            if asyncio.iscoroutinefunction(handler):
+                # Authentication and permissions may read the database.
+                await sync_to_async(self.initial)(request, *args, **kwargs)
+                response = await handler(request, *args, **kwargs)
+            else:
+                def run() -> Any:
+                    self.initial(request, *args, **kwargs)
+                    return handler(request, *args, **kwargs)
+                response = await sync_to_async(run)()
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
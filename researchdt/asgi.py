@@ -14,3 +14,12 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'researchdt.settings')
 
 application = get_asgi_application()
+
+# Calibrate the password work factor and start the password hashing pool
+# before the event loop runs, so hashes can be awaited through
+# researchdt.passwords.amake_password/acheck_password.
+from researchdt.hashers import calibrate
+from researchdt.passwords import get_password_pool
+
+calibrate()
+get_password_pool().start()
@@ -1,18 +1,55 @@
+import math
+import random
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from fnmatch import fnmatch
+from typing import Any, Callable, Iterator, Optional
+
 from django.core.cache import cache
 
+# Keys registered under a namespace are tracked in an index, so they can be
+# listed or dropped together without scanning the whole keyspace. On Redis
+# the index is a sorted set scored by expiry time. Elsewhere it is split by a
+# hash of the key into INDEX_BUCKETS dicts of key -> expiry stored in the
+# cache itself, so a registration rewrites one small bucket however large the
+# namespace is.
+INDEX_PREFIX = '__keyidx__:'
+INDEX_BUCKETS = 256
+INDEX_LOCK_TIMEOUT = 5
+INDEX_PAGE_SIZE = 100
+
+_index_locks = [threading.Lock() for _ in range(INDEX_BUCKETS)]
+_pipeline_lock = threading.Lock()
+_DEFAULT = object()
+
+
+class IndexLockTimeout(TimeoutError):
+    """The index bucket of a namespace stayed locked for INDEX_LOCK_TIMEOUT."""
+
+
 # This function increase value by one
 def incrKey(key, value, timeout=None):
     return cache.incr(key, delta=value)
 
 
-# This function set value
-def setKey(key, value, timeout=None):
-    return cache.set(key, value, timeout=timeout)
+# This function set value, a namespace registers the key in its index
+def setKey(key, value, timeout=None, namespace=None):
+    result = cache.set(key, value, timeout=timeout)
+    if namespace is not None:
+        registerKey(namespace, key, timeout)
+    return result
 
 
 # This function set value if key exist then give error
-def addKey(key, value, timeout=None):
-    return cache.add(key, value, timeout=timeout)
+def addKey(key, value, timeout=None, namespace=None):
+    added = cache.add(key, value, timeout=timeout)
+    if added and namespace is not None:
+        registerKey(namespace, key, timeout)
+    return added
 
 
 # this function get value by key
@@ -21,10 +58,525 @@ def getKey(key):
 
 
 # this function delete value by key
-def deleteKey(key):
-    return cache.delete(key)
+def deleteKey(key, namespace=None):
+    result = cache.delete(key)
+    if namespace is not None:
+        unregisterKeys(namespace, [key])
+    return result
 
 
-# this function delete value by pattern
+# this function return keys of a namespace matching pattern,
+# the namespace is the part of the pattern before the first ":"
 def getAllKey(pattern):
-    return cache.keys(pattern)
\ No newline at end of file
+    namespace = pattern.split(':', 1)[0]
+    return sorted(key for key in iterKeys(namespace) if fnmatch(key, pattern))
+
+
+# this function get values of many keys in one round trip
+def get_many(keys):
+    return cache.get_many(keys)
+
+
+# this function set many values in one round trip, return keys that failed
+def set_many(data, timeout=None, namespace=None):
+    failed = cache.set_many(data, timeout=timeout)
+    if namespace is not None:
+        registerKeys(namespace, [key for key in data if key not in failed], timeout)
+    return failed
+
+
+# this function delete many keys in one round trip
+def delete_many(keys, namespace=None):
+    result = cache.delete_many(keys)
+    if namespace is not None:
+        unregisterKeys(namespace, list(keys))
+    return result
+
+
+class CachePipeline:
+    """
+    Queue cache operations and run them together. On Django's Redis backend
+    they go out as one MULTI/EXEC transaction in a single round trip; on other
+    backends consecutive operations of the same kind are grouped into
+    get_many/set_many/delete_many calls and pipelines of this process do not
+    interleave. `results` holds one result per queued operation.
+    """
+
+    def __init__(self) -> None:
+        self._operations: list[tuple[Any, ...]] = []
+        self.results: list[Any] = []
+
+    def get(self, key: str) -> 'CachePipeline':
+        self._operations.append(('get', key))
+        return self
+
+    def set(self, key: str, value: Any, timeout: Optional[float] = None, namespace: Optional[str] = None) -> 'CachePipeline':
+        self._operations.append(('set', key, value, timeout, namespace))
+        return self
+
+    def add(self, key: str, value: Any, timeout: Optional[float] = None) -> 'CachePipeline':
+        self._operations.append(('add', key, value, timeout))
+        return self
+
+    def incr(self, key: str, delta: int = 1) -> 'CachePipeline':
+        """Increment a counter, a missing counter starts from 0."""
+        self._operations.append(('incr', key, delta))
+        return self
+
+    def delete(self, key: str) -> 'CachePipeline':
+        self._operations.append(('delete', key))
+        return self
+
+    def execute(self) -> list[Any]:
+        operations, self._operations = self._operations, []
+        if not operations:
+            self.results = []
+            return self.results
+
+        backend = getattr(cache, '_cache', None)
+        if hasattr(backend, 'get_client') and hasattr(backend, '_serializer'):
+            self.results = self._executeRedis(backend, operations)
+        else:
+            with _pipeline_lock:
+                self.results = self._executeGrouped(operations)
+
+        for operation in operations:
+            if operation[0] == 'set' and operation[4] is not None:
+                registerKey(operation[4], operation[1], operation[3])
+        return self.results
+
+    def _executeRedis(self, backend: Any, operations: list[tuple[Any, ...]]) -> list[Any]:
+        serializer = backend._serializer
+        pipe = backend.get_client(write=True).pipeline(transaction=True)
+        for operation in operations:
+            kind, key = operation[0], cache.make_key(operation[1])
+            if kind == 'get':
+                pipe.get(key)
+            elif kind in ('set', 'add'):
+                timeout = cache.get_backend_timeout(operation[3])
+                if timeout == 0:
+                    pipe.delete(key)
+                else:
+                    pipe.set(key, serializer.dumps(operation[2]), ex=timeout, nx=kind == 'add')
+            elif kind == 'incr':
+                pipe.incrby(key, operation[2])
+            else:
+                pipe.delete(key)
+
+        results = []
+        for operation, result in zip(operations, pipe.execute()):
+            kind = operation[0]
+            if kind == 'get':
+                results.append(None if result is None else serializer.loads(result))
+            elif kind in ('set', 'add', 'delete'):
+                results.append(bool(result))
+            else:
+                results.append(result)
+        return results
+
+    def _executeGrouped(self, operations: list[tuple[Any, ...]]) -> list[Any]:
+        results = []
+        start = 0
+        while start < len(operations):
+            kind = operations[start][0]
+            end = start
+            while end < len(operations) and operations[end][0] == kind and kind in ('get', 'delete'):
+                end += 1
+            if kind == 'get':
+                keys = [operation[1] for operation in operations[start:end]]
+                values = cache.get_many(keys)
+                results.extend(values.get(key) for key in keys)
+                start = end
+            elif kind == 'delete':
+                keys = [operation[1] for operation in operations[start:end]]
+                existing = cache.get_many(keys)
+                cache.delete_many(keys)
+                results.extend(key in existing for key in keys)
+                start = end
+            elif kind == 'set':
+                # Group consecutive sets sharing a timeout.
+                timeout = operations[start][3]
+                end = start
+                while end < len(operations) and operations[end][0] == 'set' and operations[end][3] == timeout:
+                    end += 1
+                failed = cache.set_many({operation[1]: operation[2] for operation in operations[start:end]}, timeout=timeout)
+                results.extend(operation[1] not in failed for operation in operations[start:end])
+                start = end
+            elif kind == 'add':
+                results.append(cache.add(operations[start][1], operations[start][2], timeout=operations[start][3]))
+                start += 1
+            else:
+                cache.add(operations[start][1], 0, timeout=None)
+                results.append(cache.incr(operations[start][1], delta=operations[start][2]))
+                start += 1
+        return results
+
+
+# this function queue cache operations and run them in one round trip,
+# results are available in pipeline.results after the block
+@contextmanager
+def pipeline() -> Iterator[CachePipeline]:
+    pipe = CachePipeline()
+    yield pipe
+    pipe.execute()
+
+
+def _redisClient() -> Any:
+    """Return the native client when the default cache speaks the Redis protocol."""
+    backend = getattr(cache, '_cache', None)
+    if hasattr(backend, 'get_client'):
+        # django.core.cache.backends.redis.RedisCache
+        return backend.get_client(write=True)
+    client = getattr(cache, 'client', None)
+    if hasattr(client, 'get_client'):
+        # django_redis.cache.RedisCache
+        return client.get_client(write=True)
+    return None
+
+
+def _expiresAt(timeout: Optional[float]) -> float:
+    return float('inf') if timeout is None else time.time() + timeout
+
+
+def _indexKey(namespace: str) -> str:
+    return INDEX_PREFIX + namespace
+
+
+def _bucketOf(key: str) -> int:
+    return zlib.crc32(key.encode()) % INDEX_BUCKETS
+
+
+def _bucketKey(namespace: str, bucket: int) -> str:
+    return '%s:%d' % (_indexKey(namespace), bucket)
+
+
+def _byBucket(keys: list[str]) -> dict[int, list[str]]:
+    buckets: dict[int, list[str]] = {}
+    for key in keys:
+        buckets.setdefault(_bucketOf(key), []).append(key)
+    return buckets
+
+
+@contextmanager
+def _lockedBucket(namespace: str, bucket: int) -> Iterator[dict[str, float]]:
+    """Yield an index bucket of a non-Redis backend for modification and store it back."""
+    bucket_key = _bucketKey(namespace, bucket)
+    lock_key = bucket_key + ':lock'
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + INDEX_LOCK_TIMEOUT
+    with _index_locks[bucket]:
+        # cache.add is atomic on every backend, it guards the bucket across processes.
+        while not cache.add(lock_key, token, INDEX_LOCK_TIMEOUT):
+            if time.monotonic() >= deadline:
+                # Writing without the lock would lose concurrent updates.
+                raise IndexLockTimeout(bucket_key)
+            time.sleep(0.001)
+        try:
+            index = cache.get(bucket_key) or {}
+            yield index
+            now = time.time()
+            index = {key: expires for (key, expires) in index.items() if expires > now}
+            if index:
+                cache.set(bucket_key, index, timeout=None)
+            else:
+                cache.delete(bucket_key)
+        finally:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+
+# this function add key to the index of namespace until it expires
+def registerKey(namespace: str, key: str, timeout: Optional[float] = None) -> None:
+    registerKeys(namespace, [key], timeout)
+
+
+def registerKeys(namespace: str, keys: list[str], timeout: Optional[float] = None) -> None:
+    if not keys:
+        return
+    expires = _expiresAt(timeout)
+    client = _redisClient()
+    if client is not None:
+        index_key = cache.make_key(_indexKey(namespace))
+        pipe = client.pipeline()
+        pipe.zadd(index_key, {key: expires for key in keys})
+        pipe.zremrangebyscore(index_key, '-inf', time.time())
+        pipe.execute()
+        return
+    for (bucket, bucket_keys) in _byBucket(keys).items():
+        with _lockedBucket(namespace, bucket) as index:
+            for key in bucket_keys:
+                index[key] = expires
+
+
+# this function remove keys from the index of namespace
+def unregisterKeys(namespace: str, keys: list[str]) -> None:
+    if not keys:
+        return
+    client = _redisClient()
+    if client is not None:
+        client.zrem(cache.make_key(_indexKey(namespace)), *keys)
+        return
+    for (bucket, bucket_keys) in _byBucket(keys).items():
+        with _lockedBucket(namespace, bucket) as index:
+            for key in bucket_keys:
+                index.pop(key, None)
+
+
+# this function return one page of live keys of namespace,
+# the returned cursor is None after the last page
+def listKeys(namespace: str, cursor: Any = None, count: int = INDEX_PAGE_SIZE) -> tuple[Any, list[str]]:
+    now = time.time()
+    client = _redisClient()
+    if client is not None:
+        cursor, members = client.zscan(cache.make_key(_indexKey(namespace)), cursor or 0, count=count)
+        keys = [member.decode() if isinstance(member, bytes) else member for (member, expires) in members if expires > now]
+        return (cursor or None), keys
+
+    # The cursor is (bucket, last key returned from it), keys are listed
+    # bucket by bucket and sorted within a bucket.
+    start, after = cursor if cursor is not None else (0, None)
+    page: list[str] = []
+    for first in range(start, INDEX_BUCKETS, INDEX_PAGE_SIZE):
+        buckets = range(first, min(first + INDEX_PAGE_SIZE, INDEX_BUCKETS))
+        indexes = cache.get_many([_bucketKey(namespace, bucket) for bucket in buckets])
+        for bucket in buckets:
+            index = indexes.get(_bucketKey(namespace, bucket)) or {}
+            keys = sorted(key for (key, expires) in index.items()
+                          if expires > now and (bucket != start or after is None or key > after))
+            room = count - len(page)
+            if len(keys) > room:
+                page.extend(keys[:room])
+                # With no room left the page ended with the previous bucket.
+                return (bucket, keys[room - 1] if room else None), page
+            page.extend(keys)
+    return None, page
+
+
+# this function iterate over all live keys of namespace page by page
+def iterKeys(namespace: str, count: int = INDEX_PAGE_SIZE) -> Iterator[str]:
+    cursor = None
+    while True:
+        cursor, keys = listKeys(namespace, cursor, count)
+        yield from keys
+        if cursor is None:
+            return
+
+
+# this function delete all keys of namespace and its index
+def deleteNamespace(namespace: str, count: int = INDEX_PAGE_SIZE) -> int:
+    deleted = 0
+    batch = []
+    for key in iterKeys(namespace, count):
+        batch.append(key)
+        if len(batch) >= count:
+            cache.delete_many(batch)
+            deleted += len(batch)
+            batch = []
+    if batch:
+        cache.delete_many(batch)
+        deleted += len(batch)
+
+    client = _redisClient()
+    if client is not None:
+        client.delete(cache.make_key(_indexKey(namespace)))
+    else:
+        cache.delete_many([_bucketKey(namespace, bucket) for bucket in range(INDEX_BUCKETS)])
+    return deleted
+
+
+class LocalLRU:
+    """Bounded in-process LRU whose entries expire after their own timeout."""
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.maxsize = maxsize
+        self._entries: 'OrderedDict[str, tuple[Any, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[0]
+
+    def set(self, key: str, value: Any, timeout: float) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + timeout)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class TieredCache:
+    """
+    A short-lived in-process LRU in front of the shared cache.
+
+    - Misses are single-flight: one thread per process and, through a shared
+      lock key, one process recomputes a key while the others wait for it.
+    - Entries are recomputed early with a probability growing towards their
+      expiry (XFetch), so a popular key does not expire for everyone at once.
+    - Writes and invalidations bump a version stamp of the namespace; every
+      worker checks it at most every `stamp_interval` seconds and drops its
+      local entries when it changed.
+    """
+
+    def __init__(self, namespace: str, maxsize: int = 1024, local_timeout: float = 5, timeout: Optional[float] = 300,
+                 beta: float = 1.0, lock_timeout: float = 10, stamp_interval: float = 1.0) -> None:
+        self.namespace = namespace
+        self.local = LocalLRU(maxsize)
+        self.local_timeout = local_timeout
+        self.timeout = timeout
+        self.beta = beta
+        self.lock_timeout = lock_timeout
+        self.stamp_interval = stamp_interval
+        self._stamp: Any = None
+        self._stamp_checked = 0.0
+        self._lock = threading.Lock()
+        self._flights: dict[str, threading.Lock] = {}
+        self._counters = dict.fromkeys(
+            ('local_hits', 'shared_hits', 'misses', 'recomputes', 'early_recomputes', 'stale_served'), 0)
+
+    def _sharedKey(self, key: str) -> str:
+        return 'tiered:%s:%s' % (self.namespace, key)
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {**self._counters, 'local_size': len(self.local)}
+
+    def _checkStamp(self) -> None:
+        now = time.monotonic()
+        if now - self._stamp_checked < self.stamp_interval:
+            return
+        stamp = cache.get(self._sharedKey('__stamp__'))
+        with self._lock:
+            if stamp != self._stamp:
+                self.local.clear()
+                self._stamp = stamp
+            self._stamp_checked = now
+
+    def _bumpStamp(self) -> None:
+        stamp = uuid.uuid4().hex
+        cache.set(self._sharedKey('__stamp__'), stamp, timeout=None)
+        with self._lock:
+            self._stamp = stamp
+
+    def _remember(self, key: str, entry: dict[str, Any]) -> None:
+        timeout = self.local_timeout
+        if entry['expires'] is not None:
+            timeout = min(timeout, entry['expires'] - time.time())
+        if timeout > 0:
+            self.local.set(key, entry['value'], timeout)
+
+    def _expiresEarly(self, entry: dict[str, Any]) -> bool:
+        if entry['expires'] is None:
+            return False
+        return time.time() - entry['delta'] * self.beta * math.log(random.random() or 1e-12) >= entry['expires']
+
+    def _store(self, key: str, value: Any, delta: float, timeout: Any) -> dict[str, Any]:
+        timeout = self.timeout if timeout is _DEFAULT else timeout
+        entry = {'value': value, 'delta': delta, 'expires': None if timeout is None else time.time() + timeout}
+        cache.set(self._sharedKey(key), entry, timeout=timeout)
+        self._remember(key, entry)
+        return entry
+
+    def _compute(self, key: str, producer: Callable[[], Any], timeout: Any) -> Any:
+        started = time.perf_counter()
+        value = producer()
+        self._store(key, value, time.perf_counter() - started, timeout)
+        self._count('recomputes')
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        self._checkStamp()
+        found, value = self.local.get(key)
+        if found:
+            self._count('local_hits')
+            return value
+        entry = cache.get(self._sharedKey(key))
+        if entry is None:
+            self._count('misses')
+            return default
+        self._count('shared_hits')
+        self._remember(key, entry)
+        return entry['value']
+
+    def get_or_set(self, key: str, producer: Callable[[], Any], timeout: Any = _DEFAULT) -> Any:
+        """Return the cached value of key, computing it with `producer` when needed."""
+        self._checkStamp()
+        found, value = self.local.get(key)
+        if found:
+            self._count('local_hits')
+            return value
+
+        lock_key = self._sharedKey(key) + ':lock'
+        entry = cache.get(self._sharedKey(key))
+        if entry is not None:
+            if not self._expiresEarly(entry):
+                self._count('shared_hits')
+                self._remember(key, entry)
+                return entry['value']
+            if cache.add(lock_key, 1, self.lock_timeout):
+                self._count('early_recomputes')
+                try:
+                    return self._compute(key, producer, timeout)
+                finally:
+                    cache.delete(lock_key)
+            # Someone else refreshes it, the current value is still valid.
+            self._count('stale_served')
+            return entry['value']
+
+        self._count('misses')
+        with self._lock:
+            flight = self._flights.setdefault(key, threading.Lock())
+        try:
+            with flight:
+                # Another thread of this process may have just computed it.
+                found, value = self.local.get(key)
+                if found:
+                    return value
+                deadline = time.monotonic() + self.lock_timeout
+                while not cache.add(lock_key, 1, self.lock_timeout):
+                    entry = cache.get(self._sharedKey(key))
+                    if entry is not None:
+                        self._remember(key, entry)
+                        return entry['value']
+                    if time.monotonic() >= deadline:
+                        return self._compute(key, producer, timeout)
+                    time.sleep(0.01)
+                try:
+                    return self._compute(key, producer, timeout)
+                finally:
+                    cache.delete(lock_key)
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+    def set(self, key: str, value: Any, timeout: Any = _DEFAULT) -> None:
+        self._store(key, value, 0.0, timeout)
+        self._bumpStamp()
+
+    def delete(self, key: str) -> None:
+        """Invalidate key here and, through the version stamp, in every worker."""
+        cache.delete(self._sharedKey(key))
+        self.local.delete(key)
+        self._bumpStamp()
@@ -79,6 +79,16 @@ class DetailDictMixin:
 class AuthenticationFailed(DetailDictMixin, exceptions.AuthenticationFailed):
     pass
 
+class PasswordHashingUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _("Service is busy, try again later")
+    default_code = "password_hashing_unavailable"
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = _("Resource has been modified")
+    default_code = "precondition_failed"
+
 def internal_server_error(request, *args, **kwargs):
     """
     Generic 500 error handler.
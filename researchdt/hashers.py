@@ -0,0 +1,112 @@
+import time
+from typing import Any, Optional
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+# BUDGET_MS: time one hash should take on this host, the iteration count is
+# calibrated at startup to hit it. MIN_ITERATIONS/MAX_ITERATIONS bound the
+# calibrated count, the floor is Django's own PBKDF2 default so a slow host
+# never hashes weaker than stock Django. ITERATIONS pins the count and skips
+# calibration. Stored hashes whose iteration count is outside TOLERANCE of
+# the target are re-hashed on the next successful login, so hosts that
+# calibrate differently re-hash each other's passwords: pin ITERATIONS for
+# the deployment when it runs on mixed hardware.
+DEFAULTS = {
+    'BUDGET_MS': 100,
+    'MIN_ITERATIONS': PBKDF2PasswordHasher.iterations,
+    'MAX_ITERATIONS': 1_000_000,
+    'ITERATIONS': None,
+    'TOLERANCE': 0.25,
+}
+
+ITERATION_STEP = 10_000
+CALIBRATION_PROBE = 20_000
+CALIBRATION_ROUNDS = 3
+
+_iterations: Optional[int] = None
+
+
+def get_policy() -> dict[str, Any]:
+    return {**DEFAULTS, **getattr(settings, 'PASSWORD_HASH_POLICY', {})}
+
+
+def measure_iterations(budget_ms: float, probe: int = CALIBRATION_PROBE) -> int:
+    """Return how many PBKDF2-SHA256 iterations fit in `budget_ms` on this host."""
+    hasher = PBKDF2PasswordHasher()
+    salt = hasher.salt()
+    best = None
+    for _ in range(CALIBRATION_ROUNDS):
+        started = time.perf_counter()
+        hasher.encode('calibration', salt, probe)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return int(budget_ms / 1000 / (best / probe))
+
+
+def calibrate() -> int:
+    """Pick the iteration count for this process from the policy."""
+    global _iterations
+    policy = get_policy()
+    if policy['ITERATIONS']:
+        _iterations = policy['ITERATIONS']
+        return _iterations
+
+    iterations = measure_iterations(policy['BUDGET_MS'])
+    iterations = round(iterations / ITERATION_STEP) * ITERATION_STEP
+    _iterations = min(max(iterations, policy['MIN_ITERATIONS']), policy['MAX_ITERATIONS'])
+    return _iterations
+
+
+def get_iterations() -> int:
+    if _iterations is None:
+        return calibrate()
+    return _iterations
+
+
+def set_iterations(iterations: Optional[int]) -> None:
+    """Adopt an iteration count calibrated elsewhere, e.g. in the parent process."""
+    global _iterations
+    _iterations = iterations
+
+
+class CalibratedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 with the iteration count taken from the hashing policy.
+    It keeps the `pbkdf2_sha256` algorithm name, so it verifies existing
+    hashes and only asks for an update when they are off the target.
+    """
+
+    @property
+    def iterations(self) -> int:
+        return get_iterations()
+
+    def must_update(self, encoded: str) -> bool:
+        decoded = self.decode(encoded)
+        target = self.iterations
+        tolerance = get_policy()['TOLERANCE']
+        return not (target * (1 - tolerance) <= decoded['iterations'] <= target * (1 + tolerance))
+
+
+def needs_rehash(encoded: Optional[str]) -> bool:
+    """Tell whether a stored hash is not what the preferred hasher would produce."""
+    if not hashers.is_password_usable(encoded):
+        return False
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False
+    preferred = hashers.get_hasher('default')
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def upgrade_password(user: Any, raw_password: str) -> bool:
+    """Re-hash a verified password when the stored hash is stale."""
+    if not needs_rehash(user.password):
+        return False
+    user.set_password(raw_password)
+    # Password hash upgrades shouldn't be considered password changes.
+    user._password = None
+    user.save(update_fields=['password'])
+    return True
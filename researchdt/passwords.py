@@ -0,0 +1,253 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Optional
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from researchdt import hashers as policy
+from researchdt.exceptions import PasswordHashingUnavailable
+
+# WORKERS: size of the process pool, None means one per core and 0 hashes in
+# the calling thread. MAX_QUEUE bounds the hashes waiting for or running in
+# the pool, TIMEOUT (seconds) bounds both the wait for a slot and the hash.
+DEFAULTS = {
+    'WORKERS': None,
+    'MAX_QUEUE': 256,
+    'TIMEOUT': 5,
+    'START_METHOD': None,
+}
+
+
+def _init_worker(settings_module: str, iterations: int) -> None:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+    # Workers hash with the parent's calibrated work factor.
+    policy.set_iterations(iterations)
+
+
+def _make_password(password: str) -> str:
+    return hashers.make_password(password)
+
+
+def _verify_password(password: str, encoded: str) -> bool:
+    return hashers.identify_hasher(encoded).verify(password, encoded)
+
+
+class PasswordHasherPool:
+    """
+    Runs CPU-bound password hashing in a process pool so request workers and
+    the event loop are not held for the duration of a PBKDF2 run.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_queue: int = 256, timeout: float = 5,
+                 start_method: Optional[str] = None) -> None:
+        self.workers = os.cpu_count() if workers is None else workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.start_method = start_method
+        self._slots = threading.BoundedSemaphore(max_queue)
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._submitted = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._in_flight = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    @classmethod
+    def from_settings(cls) -> 'PasswordHasherPool':
+        options = {**DEFAULTS, **getattr(settings, 'PASSWORD_HASHING', {})}
+        return cls(options['WORKERS'], options['MAX_QUEUE'], options['TIMEOUT'], options['START_METHOD'])
+
+    def start(self) -> None:
+        """Create the process pool, it is re-created in forked children."""
+        if self.workers == 0:
+            return
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                return
+            context = multiprocessing.get_context(self.start_method) if self.start_method else None
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'researchdt.settings'), policy.get_iterations()),
+            )
+            self._pid = os.getpid()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor = self._executor if self._pid == os.getpid() else None
+            self._executor = None
+        # Outside the lock: the callbacks of the cancelled hashes take it.
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    def stats(self) -> dict[str, Any]:
+        """Return queue depth and hash latency counters."""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_depth': self._in_flight,
+                'max_queue': self.max_queue,
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'timed_out': self._timed_out,
+                'latency_avg': self._latency_total / self._completed if self._completed else 0.0,
+                'latency_max': self._latency_max,
+            }
+
+    def _acquired(self) -> float:
+        with self._lock:
+            self._submitted += 1
+            self._in_flight += 1
+        return time.perf_counter()
+
+    def _released(self, started: float) -> None:
+        latency = time.perf_counter() - started
+        with self._lock:
+            self._completed += 1
+            self._in_flight -= 1
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+        self._slots.release()
+
+    def _rejected_error(self, timed_out: bool = False) -> PasswordHashingUnavailable:
+        with self._lock:
+            if timed_out:
+                self._timed_out += 1
+            else:
+                self._rejected += 1
+        return PasswordHashingUnavailable()
+
+    def _submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        """Run `fn` in the pool, a slot must already be held."""
+        started = self._acquired()
+        if self.workers == 0:
+            future: Future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            self.start()
+            future = self._executor.submit(fn, *args)
+        future.add_done_callback(lambda _: self._released(started))
+        return future
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        """Queue `fn`, waiting up to `timeout` for a free slot."""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise self._rejected_error()
+        return self._submit(fn, *args)
+
+    def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        future = self.submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise self._rejected_error(timed_out=True)
+
+    async def arun(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Like `run` but awaits the slot and the result without blocking the loop."""
+        deadline = time.monotonic() + self.timeout
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                raise self._rejected_error()
+            await asyncio.sleep(0.005)
+        future = self._submit(fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            future.cancel()
+            raise self._rejected_error(timed_out=True)
+
+
+_pool: Optional[PasswordHasherPool] = None
+
+
+def get_password_pool() -> PasswordHasherPool:
+    global _pool
+    if _pool is None:
+        _pool = PasswordHasherPool.from_settings()
+    return _pool
+
+
+def make_password(password: Optional[str]) -> str:
+    """`django.contrib.auth.hashers.make_password` computed in the pool."""
+    if password is None:
+        return hashers.make_password(None)
+    return get_password_pool().run(_make_password, password)
+
+
+def make_passwords(passwords: list[str]) -> list[str]:
+    """Hash many passwords, as many at a time as the pool allows."""
+    pool = get_password_pool()
+    futures: list[Future] = []
+    try:
+        for password in passwords:
+            futures.append(pool.submit(_make_password, password))
+        return [future.result(timeout=pool.timeout) for future in futures]
+    except FutureTimeoutError:
+        raise pool._rejected_error(timed_out=True)
+    finally:
+        # No-op for the finished hashes, frees the queue of the others.
+        for future in futures:
+            future.cancel()
+
+
+def _prepare_check(password: Optional[str], encoded: Optional[str]) -> Optional[hashers.BasePasswordHasher]:
+    if password is None or not hashers.is_password_usable(encoded):
+        return None
+    try:
+        return hashers.identify_hasher(encoded)
+    except ValueError:
+        return None
+
+
+def _finish_check(is_correct: bool, hasher: hashers.BasePasswordHasher, password: str, encoded: str,
+                  setter: Optional[Callable[[str], None]]) -> bool:
+    # Mirrors django.contrib.auth.hashers.check_password.
+    preferred = hashers.get_hasher('default')
+    hasher_changed = hasher.algorithm != preferred.algorithm
+    must_update = hasher_changed or preferred.must_update(encoded)
+    if not is_correct and not hasher_changed and must_update:
+        hasher.harden_runtime(password, encoded)
+    if setter and is_correct and must_update:
+        setter(password)
+    return is_correct
+
+
+def check_password(password: Optional[str], encoded: Optional[str],
+                   setter: Optional[Callable[[str], None]] = None) -> bool:
+    """`django.contrib.auth.hashers.check_password` verified in the pool."""
+    hasher = _prepare_check(password, encoded)
+    if hasher is None:
+        return False
+    is_correct = get_password_pool().run(_verify_password, password, encoded)
+    return _finish_check(is_correct, hasher, password, encoded, setter)
+
+
+async def amake_password(password: Optional[str]) -> str:
+    if password is None:
+        return hashers.make_password(None)
+    return await get_password_pool().arun(_make_password, password)
+
+
+async def acheck_password(password: Optional[str], encoded: Optional[str]) -> bool:
+    """Verify without blocking the event loop. Stale hashes are not upgraded here."""
+    hasher = _prepare_check(password, encoded)
+    if hasher is None:
+        return False
+    return await get_password_pool().arun(_verify_password, password, encoded)
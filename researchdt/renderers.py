@@ -0,0 +1,48 @@
+from typing import Any, Mapping, Optional
+
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+# UUIDs, datetimes, dates and times are encoded by orjson itself, anything
+# else it cannot (lazy translation strings, decimals, querysets...) the way
+# DRF's encoder does.
+_encoder = JSONEncoder()
+
+
+def _default(obj: Any) -> Any:
+    return _encoder.default(obj)
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    `JSONRenderer` encoding with orjson when it is installed.
+
+    The output matches DRF's compact output, except that datetimes keep their
+    microseconds (DRF cuts them to milliseconds). Pretty-printed responses, as
+    requested by the browsable API, and settings orjson does not support
+    (UNICODE_JSON or STRICT_JSON off) are rendered by DRF's encoder.
+    """
+
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z if orjson is not None else 0
+
+    def render(
+        self,
+        data: Any,
+        accepted_media_type: Optional[str] = None,
+        renderer_context: Optional[Mapping[str, Any]] = None,
+    ) -> bytes:
+        if orjson is None or data is None or self.ensure_ascii or not self.strict or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=_default, option=self.options)
+        # Like DRF, keep the output a strict javascript subset.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
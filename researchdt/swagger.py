@@ -112,3 +112,49 @@ class SwaggerResponses():
                   ),
       }
     )
+
+  def get_bulk_result_schema(title):
+    return openapi.Schema(
+      title,
+      type=openapi.TYPE_OBJECT,
+      properties={
+        'created': openapi.Schema(
+          type=openapi.TYPE_ARRAY,
+          description='Created rows',
+          items=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+              'index': openapi.Schema(
+                type=openapi.TYPE_NUMBER,
+                description='Position of the row in the request'
+              ),
+              'id': openapi.Schema(
+                type=openapi.TYPE_STRING,
+                description='Id of the created user'
+              ),
+              'email': openapi.Schema(
+                type=openapi.TYPE_STRING,
+                description='Email of the created user'
+              ),
+            }
+          )
+        ),
+        'errors': openapi.Schema(
+          type=openapi.TYPE_ARRAY,
+          description='Rejected rows',
+          items=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+              'index': openapi.Schema(
+                type=openapi.TYPE_NUMBER,
+                description='Position of the row in the request'
+              ),
+              'fields': openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                description='Error messages for each field that triggered a validation error'
+              ),
+            }
+          )
+        ),
+      }
+    )
@@ -0,0 +1,236 @@
+import io
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from .bloom import BloomFilter
+from .cache import (
+    delete_many, deleteKey, deleteNamespace, get_many, getAllKey, getKey, iterKeys, listKeys, pipeline, registerKey,
+    set_many, setKey, TieredCache
+)
+from . import cache as cache_module
+from .parsers import FastJSONParser
+from .renderers import FastJSONRenderer
+
+
+class KeyIndexTests(SimpleTestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_lists_namespace_keys_with_cursor(self):
+        for number in range(5):
+            setKey('code:%d' % number, number, timeout=60, namespace='code')
+        setKey('other:1', 1, namespace='other')
+
+        cursor, first = listKeys('code', count=2)
+        cursor, second = listKeys('code', cursor, count=2)
+        cursor, third = listKeys('code', cursor, count=2)
+
+        self.assertEqual((len(first), len(second)), (2, 2))
+        self.assertEqual(sorted(first + second + third), ['code:0', 'code:1', 'code:2', 'code:3', 'code:4'])
+        self.assertIsNone(cursor)
+        self.assertEqual(getAllKey('code:[12]'), ['code:1', 'code:2'])
+
+    def test_expired_and_deleted_keys_are_dropped(self):
+        setKey('code:live', 1, timeout=60, namespace='code')
+        registerKey('code', 'code:expired', timeout=-1)
+        setKey('code:gone', 1, namespace='code')
+        deleteKey('code:gone', namespace='code')
+
+        self.assertEqual(list(iterKeys('code')), ['code:live'])
+
+    def test_delete_namespace(self):
+        for number in range(250):
+            setKey('code:%d' % number, number, namespace='code')
+        setKey('other:1', 1, namespace='other')
+
+        self.assertEqual(deleteNamespace('code'), 250)
+        self.assertIsNone(getKey('code:7'))
+        self.assertEqual(list(iterKeys('code')), [])
+        self.assertEqual(getKey('other:1'), 1)
+
+    def test_index_is_split_in_buckets(self):
+        keys = ['code:%d' % number for number in range(2000)]
+        set_many(dict.fromkeys(keys, 1), namespace='code')
+        registerKey('code', 'code:extra')
+
+        buckets = get_many([cache_module._bucketKey('code', bucket) for bucket in range(cache_module.INDEX_BUCKETS)])
+        self.assertLess(max(len(bucket) for bucket in buckets.values()), 30)
+        listed = list(iterKeys('code', count=7))
+        self.assertEqual(len(listed), 2001)
+        self.assertEqual(set(listed), {*keys, 'code:extra'})
+
+    def test_locked_bucket_is_not_written(self):
+        bucket = cache_module._bucketKey('code', cache_module._bucketOf('code:1'))
+        cache.add(bucket + ':lock', 'other', 60)
+
+        with mock.patch.object(cache_module, 'INDEX_LOCK_TIMEOUT', 0.01):
+            with self.assertRaises(cache_module.IndexLockTimeout):
+                registerKey('code', 'code:1')
+        self.assertIsNone(cache.get(bucket))
+
+
+class BatchedCacheTests(SimpleTestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_many_helpers(self):
+        self.assertEqual(set_many({'a': 1, 'b': 2}, namespace='batch'), [])
+        self.assertEqual(get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+        self.assertEqual(list(iterKeys('batch')), ['a', 'b'])
+
+        delete_many(['a', 'b'], namespace='batch')
+        self.assertEqual(get_many(['a', 'b']), {})
+        self.assertEqual(list(iterKeys('batch')), [])
+
+    def test_pipeline_results_per_operation(self):
+        setKey('existing', 'value')
+
+        with pipeline() as pipe:
+            pipe.get('existing')
+            pipe.get('missing')
+            pipe.set('a', 1, namespace='batch')
+            pipe.set('b', 2, namespace='batch')
+            pipe.add('a', 3)
+            pipe.incr('counter')
+            pipe.incr('counter', 5)
+            pipe.delete('existing')
+            pipe.get('a')
+
+        self.assertEqual(pipe.results, ['value', None, True, True, False, 1, 6, True, 1])
+        self.assertIsNone(getKey('existing'))
+        self.assertEqual(list(iterKeys('batch')), ['a', 'b'])
+
+
+class TieredCacheTests(SimpleTestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_serves_from_local_tier(self):
+        tiered = TieredCache('test', stamp_interval=60)
+        producer = mock.Mock(return_value={'name': 'profile'})
+
+        self.assertEqual(tiered.get_or_set('key', producer), {'name': 'profile'})
+        with mock.patch.object(cache, 'get', wraps=cache.get) as shared_get:
+            self.assertEqual(tiered.get_or_set('key', producer), {'name': 'profile'})
+            shared_get.assert_not_called()
+
+        self.assertEqual(producer.call_count, 1)
+        self.assertEqual(tiered.stats()['local_hits'], 1)
+        self.assertEqual(tiered.stats()['misses'], 1)
+
+    def test_concurrent_misses_compute_once(self):
+        tiered = TieredCache('test')
+        calls = []
+
+        def producer():
+            calls.append(1)
+            time.sleep(0.05)
+            return 'value'
+
+        threads = [threading.Thread(target=tiered.get_or_set, args=('key', producer)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+
+    def test_invalidation_reaches_other_workers(self):
+        first = TieredCache('test', stamp_interval=0)
+        second = TieredCache('test', stamp_interval=0)
+
+        self.assertEqual(first.get_or_set('key', lambda: 'old'), 'old')
+        second.delete('key')
+        self.assertEqual(first.get_or_set('key', lambda: 'new'), 'new')
+
+        second.set('key', 'newest')
+        self.assertEqual(first.get('key'), 'newest')
+
+    def test_recomputes_before_expiry(self):
+        tiered = TieredCache('test', local_timeout=0, beta=1e12)
+        producer = mock.Mock(return_value='value')
+
+        with mock.patch('researchdt.cache.random.random', return_value=0.5):
+            tiered.get_or_set('key', producer)
+            tiered.get_or_set('key', producer)
+
+        self.assertEqual(producer.call_count, 2)
+        self.assertEqual(tiered.stats()['early_recomputes'], 1)
+
+
+class BloomFilterTests(SimpleTestCase):
+
+    def test_no_false_negatives_and_bounded_false_positives(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        members = ['user%d@a.com' % number for number in range(1000)]
+        for member in members:
+            bloom.add(member)
+
+        self.assertTrue(all(member in bloom for member in members))
+        false_positives = sum('other%d@a.com' % number in bloom for number in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_survives_serialization(self):
+        bloom = BloomFilter(100)
+        bloom.add('member@a.com')
+        copy = BloomFilter.loads(bloom.dumps())
+
+        self.assertIn('member@a.com', copy)
+        self.assertNotIn('other@a.com', copy)
+
+
+class FastJSONTests(SimpleTestCase):
+
+    def test_matches_drf_output(self):
+        data = {'id': 1, 'email': 'a@a.com', 'info': {'name': 'Ïvo', 'age': None}, 'groups': [1, 2], 'ok': True}
+
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_renders_uuids_datetimes_and_lazy_strings(self):
+        pk = uuid.uuid4()
+        data = {
+            'id': pk,
+            'joined': datetime(2022, 5, 1, 12, 30, tzinfo=timezone.utc),
+            'message': _('Not found.'),
+            'score': Decimal('1.5'),
+            3: 'non-string key',
+        }
+
+        self.assertEqual(json.loads(FastJSONRenderer().render(data)), {
+            'id': str(pk), 'joined': '2022-05-01T12:30:00Z', 'message': 'Not found.', 'score': 1.5,
+            '3': 'non-string key',
+        })
+
+    def test_escapes_line_separators(self):
+        self.assertEqual(FastJSONRenderer().render(['a\u2028b\u2029']), b'["a\\u2028b\\u2029"]')
+
+    def test_pretty_printing_and_missing_library_use_drf(self):
+        data = {'id': 1, 'name': 'a'}
+        pretty = FastJSONRenderer().render(data, 'application/json; indent=4')
+
+        self.assertEqual(pretty, JSONRenderer().render(data, 'application/json; indent=4'))
+        with mock.patch('researchdt.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_parses_json(self):
+        body = '{"email": "a@a.com", "info": {"name": "Ïvo"}}'.encode()
+
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+        for invalid in (b'{"email": ', b'{"age": NaN}'):
+            with self.assertRaises(ParseError):
+                FastJSONParser().parse(io.BytesIO(invalid))
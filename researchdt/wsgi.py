@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'researchdt.settings')
 
 application = get_wsgi_application()
+
+# Calibrate the password work factor once at startup, see researchdt/hashers.py
+from researchdt.hashers import calibrate
+
+calibrate()
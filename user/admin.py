@@ -1,11 +1,13 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import User, UserActivity, UserInfo, UserSettings, UserStatistic, UserSystemInfo
+from .models import OutboxEvent, User, UserActivity, UserInfo, UserDailyStatistic, UserSettings, UserStatistic, UserSystemInfo
 
 admin.site.register(User)
 admin.site.register(UserInfo)
 admin.site.register(UserSettings)
 admin.site.register(UserActivity)
 admin.site.register(UserStatistic)
-admin.site.register(UserSystemInfo)
\ No newline at end of file
+admin.site.register(UserDailyStatistic)
+admin.site.register(UserSystemInfo)
+admin.site.register(OutboxEvent)
\ No newline at end of file
@@ -1,6 +1,26 @@
 from django.apps import AppConfig
+from django.db.models.signals import m2m_changed, post_delete, post_save
 
 
 class UserConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'user'
+
+    def ready(self) -> None:
+        from django.contrib.auth.models import Group
+
+        from . import email_filter, profile_cache, research
+        from .models import User, UserInfo, UserSettings, UserSystemInfo
+
+        m2m_changed.connect(research.user_groups_changed, sender=User.groups.through)
+        post_save.connect(research.research_group_changed, sender=Group)
+        post_delete.connect(research.research_group_changed, sender=Group)
+
+        m2m_changed.connect(profile_cache.user_groups_changed, sender=User.groups.through)
+        for signal in (post_save, post_delete):
+            signal.connect(profile_cache.user_saved, sender=User)
+            for model in (UserInfo, UserSettings, UserSystemInfo):
+                signal.connect(profile_cache.profile_row_saved, sender=model)
+
+        post_save.connect(email_filter.user_created, sender=User)
+        post_delete.connect(email_filter.user_deleted, sender=User)
@@ -0,0 +1,128 @@
+from typing import Any, Iterable
+
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+
+from researchdt.passwords import make_passwords
+
+from .email_filter import remember_emails
+from .models import User, UserActivity, UserInfo, UserSettings, UserStatistic, UserSystemInfo
+from .research import get_research_group_id
+from .serializers import UserSerializer
+from .utils import canonical_email
+
+BULK_BATCH_SIZE = 1000
+
+
+class BulkUserSerializer(UserSerializer):
+    """One row of a bulk registration. Email uniqueness is checked per batch."""
+
+    tokens = None
+
+    class Meta(UserSerializer.Meta):
+        fields = ['id', 'email', 'password', 'info', 'settings', 'is_research', 'system_info']
+
+    def validate_email(self, value):
+        return canonical_email(value)
+
+
+def flatten_errors(errors: dict[str, Any], prefix: str = '') -> dict[str, dict[str, str]]:
+    """Render serializer errors the way `api_exception_handler` renders fields."""
+    fields = {}
+    for field_name, field_errors in errors.items():
+        if isinstance(field_errors, dict):
+            fields.update(flatten_errors(field_errors, prefix + field_name + '.'))
+        else:
+            fields[prefix + field_name] = {"message": str(field_errors[0]), "code": field_errors[0].code}
+    return fields
+
+
+def _chunks(items: list[Any], size: int) -> Iterable[list[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _drop_existing(rows: list[tuple[int, dict[str, Any]]], errors: list[dict[str, Any]],
+                   batch_size: int) -> list[tuple[int, dict[str, Any]]]:
+    """Report the rows whose email is already registered and return the others."""
+    indexes_by_email = {data['email']: index for (index, data) in rows}
+    existing = set()
+    for emails in _chunks(list(indexes_by_email), batch_size):
+        existing.update(User.objects.by_emails(emails).values_list(Lower('email'), flat=True))
+    for email in existing:
+        errors.append({"index": indexes_by_email[email], "fields": {"email": {"message": "Email is exist", "code": "email_exist"}}})
+    return [(index, data) for (index, data) in rows if data['email'] not in existing]
+
+
+def _create_users(users: list[User], rows: list[dict[str, Any]], batch_size: int) -> None:
+    with transaction.atomic():
+        User.objects.bulk_create(users, batch_size=batch_size)
+        UserInfo.objects.bulk_create(
+            [UserInfo(user=user, **data['info']) for (user, data) in zip(users, rows)], batch_size=batch_size)
+        UserSettings.objects.bulk_create(
+            [UserSettings(user=user, **data['settings']) for (user, data) in zip(users, rows)], batch_size=batch_size)
+        UserSystemInfo.objects.bulk_create(
+            [UserSystemInfo(user=user, **data['system_info']) for (user, data) in zip(users, rows)], batch_size=batch_size)
+        UserActivity.objects.bulk_create([UserActivity(user=user) for user in users], batch_size=batch_size)
+        UserStatistic.objects.bulk_create([UserStatistic(user=user) for user in users], batch_size=batch_size)
+
+        research_users = [user for (user, data) in zip(users, rows) if data['is_research']]
+        if research_users:
+            group_id = get_research_group_id(create=True)
+            through = User.groups.through
+            through.objects.bulk_create(
+                [through(user_id=user.pk, group_id=group_id) for user in research_users], batch_size=batch_size)
+
+
+def register_users(payloads: list[dict[str, Any]], batch_size: int = BULK_BATCH_SIZE) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    """
+    Validate and create many users at once.
+
+    Every table is written with one `bulk_create` per batch and research
+    membership with a single through-table insert, all in one transaction.
+    Invalid rows are skipped and reported, valid rows are created.
+    Return `(created, errors)`, both lists refer to rows by their index.
+    """
+    errors = []
+    rows = []
+    indexes_by_email = {}
+
+    for index, payload in enumerate(payloads):
+        serializer = BulkUserSerializer(data=payload)
+        if not serializer.is_valid():
+            errors.append({"index": index, "fields": flatten_errors(serializer.errors)})
+            continue
+
+        email = serializer.validated_data['email']
+        if email in indexes_by_email:
+            errors.append({"index": index, "fields": {"email": {"message": "Email is exist", "code": "email_exist"}}})
+            continue
+        indexes_by_email[email] = index
+        rows.append((index, serializer.validated_data))
+
+    rows = _drop_existing(rows, errors, batch_size)
+    passwords = make_passwords([data['password'] for (_, data) in rows]) if rows else []
+    hashed = [(index, data, password) for ((index, data), password) in zip(rows, passwords)]
+
+    while hashed:
+        users = [User(email=data['email'], password=password) for (_, data, password) in hashed]
+        try:
+            _create_users(users, [data for (_, data, _) in hashed], batch_size)
+            break
+        except IntegrityError:
+            # A registration committed one of the emails after the check above.
+            rows = _drop_existing([(index, data) for (index, data, _) in hashed], errors, batch_size)
+            if len(rows) == len(hashed):
+                raise
+            kept = {index for (index, _) in rows}
+            hashed = [row for row in hashed if row[0] in kept]
+    errors.sort(key=lambda error: error["index"])
+
+    if not hashed:
+        return [], errors
+
+    # bulk_create sends no post_save.
+    remember_emails([user.email for user in users])
+    created = [{"index": index, "id": str(user.pk), "email": user.email} for (user, (index, _, _)) in zip(users, hashed)]
+    return created, errors
+
@@ -0,0 +1,180 @@
+import threading
+import time
+import uuid
+from typing import Any, Iterable, Optional
+
+from django.conf import settings
+from django.db.models.functions import Lower
+
+from researchdt.bloom import BloomFilter
+from researchdt.cache import deleteKey, get_many, getKey, pipeline, set_many, setKey
+
+from .models import User
+from .utils import canonical_email
+
+# A Bloom filter of the registered emails lets registration skip the
+# existence query for new emails, the unique index still decides at insert.
+# ERROR_RATE/MIN_CAPACITY: sizing of a rebuilt filter, it is sized for twice
+# the current users. SYNC_INTERVAL: seconds a worker uses its copy before it
+# checks the cache for a rebuilt one and for emails added by other workers.
+# REBUILD_INTERVAL: seconds between rebuilds by `manage.py rebuild_email_filter`.
+# DELETIONS_REBUILD: deleted users (still positive in the filter) that make
+# the command rebuild early.
+DEFAULTS = {
+    'ENABLED': True,
+    'ERROR_RATE': 0.01,
+    'MIN_CAPACITY': 100_000,
+    'SYNC_INTERVAL': 30,
+    'REBUILD_INTERVAL': 60 * 60,
+    'DELETIONS_REBUILD': 1000,
+    'NAMESPACE': 'email-filter',
+}
+
+
+def get_options() -> dict[str, Any]:
+    return {**DEFAULTS, **getattr(settings, 'EMAIL_FILTER', {})}
+
+
+def _versionKey(namespace: str) -> str:
+    return '%s:version' % namespace
+
+
+def _filterKey(namespace: str) -> str:
+    return '%s:filter' % namespace
+
+
+def _deletionsKey(namespace: str) -> str:
+    return '%s:deletions' % namespace
+
+
+def _addedCountKey(namespace: str) -> str:
+    return '%s:added' % namespace
+
+
+def _addedKey(namespace: str, number: int) -> str:
+    # Emails registered since a rebuild form a numbered log: a writer takes
+    # the next numbers from the counter, a reader fetches only the numbers it
+    # has not applied yet.
+    return '%s-added:%d' % (namespace, number)
+
+
+_state: dict[str, Any] = {'filter': None, 'version': None, 'synced': None, 'applied': 0}
+_state_lock = threading.Lock()
+
+
+def reset_email_filter() -> None:
+    """Drop this process' copy, the next check loads it from the cache."""
+    with _state_lock:
+        _state.update(filter=None, version=None, synced=None, applied=0)
+
+
+def rebuild_email_filter(chunk_size: int = 10_000) -> int:
+    """Build the filter from the user table and share it. Return the number of emails."""
+    options = get_options()
+    namespace = options['NAMESPACE']
+    # Emails logged from here on may be missing from the scan, readers apply them.
+    logged = getKey(_addedCountKey(namespace)) or 0
+    count = User.objects.count()
+    bloom = BloomFilter(max(options['MIN_CAPACITY'], 2 * count), options['ERROR_RATE'])
+    added = 0
+    for email in User.objects.values_list(Lower('email'), flat=True).iterator(chunk_size=chunk_size):
+        bloom.add(email)
+        added += 1
+
+    version = uuid.uuid4().hex
+    # Readers check that the filter matches the version they saw.
+    setKey(_filterKey(namespace), {'version': version, 'built_at': time.time(), 'logged': logged, **bloom.dumps()},
+           timeout=None)
+    setKey(_versionKey(namespace), version, timeout=None)
+    deleteKey(_deletionsKey(namespace))
+    reset_email_filter()
+    return added
+
+
+def needs_rebuild() -> bool:
+    """Whether the shared filter is missing, old, or holds too many deleted users."""
+    options = get_options()
+    namespace = options['NAMESPACE']
+    stored = getKey(_filterKey(namespace))
+    if stored is None or time.time() - stored['built_at'] >= options['REBUILD_INTERVAL']:
+        return True
+    return (getKey(_deletionsKey(namespace)) or 0) >= options['DELETIONS_REBUILD']
+
+
+def _synced_filter(options: dict[str, Any]) -> Optional[BloomFilter]:
+    namespace = options['NAMESPACE']
+    now = time.monotonic()
+    with _state_lock:
+        if _state['synced'] is not None and now - _state['synced'] < options['SYNC_INTERVAL']:
+            return _state['filter']
+        current = _state['filter'] if _state['version'] is not None else None
+        known_version = _state['version']
+        applied = _state['applied']
+
+    bloom = None
+    version = getKey(_versionKey(namespace))
+    if version is not None:
+        if version == known_version:
+            bloom = current
+        else:
+            stored = getKey(_filterKey(namespace))
+            if stored is not None and stored['version'] == version:
+                bloom = BloomFilter.loads(stored)
+                applied = stored['logged']
+    if bloom is not None:
+        logged = getKey(_addedCountKey(namespace)) or 0
+        for start in range(applied + 1, logged + 1, 1000):
+            keys = [_addedKey(namespace, number) for number in range(start, min(start + 1000, logged + 1))]
+            # An entry still being written is missed, the unique index decides then.
+            for email in get_many(keys).values():
+                bloom.add(email)
+        applied = max(applied, logged)
+
+    with _state_lock:
+        _state.update(filter=bloom, version=version if bloom is not None else None, synced=now, applied=applied)
+    return bloom
+
+
+def email_may_exist(email: str) -> bool:
+    """
+    False means the email is certainly not registered (as of the last sync),
+    True means it may be and the database has to be asked.
+    """
+    options = get_options()
+    if not options['ENABLED']:
+        return True
+    bloom = _synced_filter(options)
+    if bloom is None:
+        return True
+    return canonical_email(email) in bloom
+
+
+def remember_emails(emails: Iterable[str]) -> None:
+    """Add newly registered emails to this process' filter and share them until the next rebuild."""
+    options = get_options()
+    emails = [canonical_email(email) for email in emails]
+    if not emails:
+        return
+    with _state_lock:
+        bloom = _state['filter']
+    if bloom is not None:
+        for email in emails:
+            bloom.add(email)
+    namespace = options['NAMESPACE']
+    with pipeline() as pipe:
+        pipe.incr(_addedCountKey(namespace), len(emails))
+    first = pipe.results[0] - len(emails) + 1
+    set_many({_addedKey(namespace, first + offset): email for (offset, email) in enumerate(emails)},
+             timeout=2 * options['REBUILD_INTERVAL'])
+
+
+def user_created(sender: Any, instance: Any, created: bool, raw: bool = False, **kwargs: Any) -> None:
+    """`post_save` receiver for `User`."""
+    if created and not raw:
+        remember_emails([instance.email])
+
+
+def user_deleted(sender: Any, instance: Any, **kwargs: Any) -> None:
+    """`post_delete` receiver for `User`, a deleted email stays positive until the next rebuild."""
+    with pipeline() as pipe:
+        pipe.incr(_deletionsKey(get_options()['NAMESPACE']))
@@ -0,0 +1,184 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Optional
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Case, DateTimeField, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from researchdt.cache import (
+    LocalLRU, addKey, delete_many, deleteKey, get_many, getKey, iterKeys, pipeline, registerKey, setKey, unregisterKeys
+)
+
+from .models import UserActivity
+from .statistics import record_activity
+
+logger = logging.getLogger(__name__)
+
+# FLUSH_INTERVAL: seconds between flushes, engagement is buffered in windows
+# of this length. MAX_STALENESS: a process records a user again only after
+# this many seconds, so last_engagement lags by at most
+# MAX_STALENESS + FLUSH_INTERVAL. BATCH_SIZE: users per UPDATE.
+# BUFFER_TIMEOUT: seconds an unflushed record is kept in the cache.
+DEFAULTS = {
+    'FLUSH_INTERVAL': 30,
+    'MAX_STALENESS': 60,
+    'BATCH_SIZE': 1000,
+    'BUFFER_TIMEOUT': 24 * 60 * 60,
+    'NAMESPACE': 'engagement',
+}
+
+
+def get_options() -> dict[str, Any]:
+    return {**DEFAULTS, **getattr(settings, 'ENGAGEMENT', {})}
+
+
+# Users this process recorded within MAX_STALENESS, bounded to the most active.
+_recent = LocalLRU(maxsize=100_000)
+
+
+def _windowKey(namespace: str, window: int) -> str:
+    # Records are bucketed by flush window: a flush only takes closed windows,
+    # so it never deletes a record written after it read the buffer. The key
+    # counts the records of the window, only it is registered in the index.
+    return '%s:%d' % (namespace, window)
+
+
+def _recordKey(namespace: str, window: int, number: int) -> str:
+    return '%s:%d:%d' % (namespace, window, number)
+
+
+def record_engagement(user_id: Any, now: Optional[float] = None) -> bool:
+    """
+    Buffer that the user is active now. Return False when the user was
+    recorded recently enough by this process and nothing was written.
+    """
+    options = get_options()
+    if _recent.get(str(user_id))[0]:
+        return False
+    now = time.time() if now is None else now
+    _recent.set(str(user_id), True, options['MAX_STALENESS'])
+    namespace = options['NAMESPACE']
+    window = int(now // options['FLUSH_INTERVAL'])
+    with pipeline() as pipe:
+        pipe.incr(_windowKey(namespace, window))
+    number = pipe.results[0]
+    setKey(_recordKey(namespace, window, number), (str(user_id), now), timeout=options['BUFFER_TIMEOUT'])
+    if number == 1:
+        registerKey(namespace, _windowKey(namespace, window), options['BUFFER_TIMEOUT'])
+    record_activity(user_id, now)
+    get_flusher().ensure_started()
+    return True
+
+
+def _write(stamps: dict[str, float]) -> int:
+    """Move last_engagement of the users forward in one UPDATE."""
+    buffered = Case(
+        *[When(user_id=user_id, then=Value(datetime.fromtimestamp(stamp, dt_timezone.utc)))
+          for (user_id, stamp) in stamps.items()],
+        output_field=DateTimeField(),
+    )
+    return UserActivity.objects.filter(user_id__in=list(stamps)).update(
+        last_engagement=Greatest(Coalesce('last_engagement', buffered), buffered))
+
+
+def flush_engagement(force: bool = False, now: Optional[float] = None) -> int:
+    """
+    Write buffered engagement of closed windows, of all windows with `force`,
+    coalesced to one UPDATE per BATCH_SIZE users. Return the number of users.
+    """
+    options = get_options()
+    namespace = options['NAMESPACE']
+    now = time.time() if now is None else now
+    current = int(now // options['FLUSH_INTERVAL'])
+
+    windows = [key for key in iterKeys(namespace) if force or int(key[len(namespace) + 1:]) < current]
+    records = [_recordKey(namespace, int(window_key[len(namespace) + 1:]), number)
+               for (window_key, count) in get_many(windows).items() for number in range(1, count + 1)]
+    stamps: dict[str, float] = {}
+    for start in range(0, len(records), options['BATCH_SIZE']):
+        for (user_id, stamp) in get_many(records[start:start + options['BATCH_SIZE']]).values():
+            stamps[user_id] = max(stamp, stamps.get(user_id, stamp))
+
+    users = list(stamps)
+    for start in range(0, len(users), options['BATCH_SIZE']):
+        _write({user_id: stamps[user_id] for user_id in users[start:start + options['BATCH_SIZE']]})
+    for start in range(0, len(records), options['BATCH_SIZE']):
+        delete_many(records[start:start + options['BATCH_SIZE']])
+    delete_many(windows)
+    unregisterKeys(namespace, windows)
+    return len(stamps)
+
+
+class EngagementFlusher:
+    """Flushes the buffer every FLUSH_INTERVAL from a background thread."""
+
+    def __init__(self, interval: float, lock_key: str) -> None:
+        self.interval = interval
+        self.lock_key = lock_key
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name='engagement-flusher', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def flush_once(self) -> int:
+        # Every process runs a flusher, one of them flushes per interval.
+        token = uuid.uuid4().hex
+        if not addKey(self.lock_key, token, timeout=self.interval):
+            return 0
+        try:
+            return flush_engagement()
+        finally:
+            if getKey(self.lock_key) == token:
+                deleteKey(self.lock_key)
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.interval):
+            try:
+                self.flush_once()
+            except Exception:
+                logger.exception('Engagement flush failed.')
+            finally:
+                close_old_connections()
+
+
+_flusher: Optional[EngagementFlusher] = None
+_flusher_pid: Optional[int] = None
+_flusher_lock = threading.Lock()
+
+
+def get_flusher() -> EngagementFlusher:
+    """Return the flusher of this process, a forked worker gets its own."""
+    global _flusher, _flusher_pid
+    with _flusher_lock:
+        if _flusher is None or _flusher_pid != os.getpid():
+            options = get_options()
+            _flusher = EngagementFlusher(options['FLUSH_INTERVAL'], '%s:flush-lock' % options['NAMESPACE'])
+            _flusher_pid = os.getpid()
+        return _flusher
+
+
+def reset_engagement() -> None:
+    """Stop the flusher of this process and forget which users it recorded."""
+    global _flusher
+    with _flusher_lock:
+        flusher, _flusher = _flusher, None
+    if flusher is not None:
+        flusher.stop(timeout=1)
+    _recent.clear()
@@ -0,0 +1,106 @@
+import csv
+import io
+import zlib
+from typing import Any, Iterable, Iterator
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+
+from .models import User
+
+EXPORT_CHUNK_SIZE = 2000
+# Rows rendered into one chunk of the response.
+EXPORT_ROWS_PER_WRITE = 500
+
+# (column, lookup) of an exported row. Rows are read as tuples, no model
+# instances are built.
+EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('email', 'email'),
+    ('is_research', '_is_research'),
+    ('is_active', 'is_active'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+    ('name', 'info__name'),
+    ('gender', 'info__gender'),
+    ('age', 'info__age'),
+    ('device_serial_number', 'info__device_serial_number'),
+    ('os', 'system_info__os'),
+    ('platform_version', 'system_info__platform_version'),
+    ('device_model', 'system_info__device_model'),
+    ('manufacturer', 'system_info__manufacturer'),
+    ('locale', 'settings__locale'),
+    ('last_engagement', 'activity__last_engagement'),
+)
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+
+
+def export_rows(research_only: bool = False, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[tuple[Any, ...]]:
+    """
+    Yield the export rows in `(created_at, id)` order. The iterator reads
+    through a server-side cursor where the backend has one, `chunk_size` rows
+    at a time.
+    """
+    queryset: QuerySet = User.objects.with_research()
+    if research_only:
+        queryset = queryset.filter(_is_research=True)
+    return queryset.order_by('created_at', 'id').values_list(
+        *[lookup for (_, lookup) in EXPORT_COLUMNS]).iterator(chunk_size=chunk_size)
+
+
+def _batched(rows: Iterable[tuple[Any, ...]]) -> Iterator[list[tuple[Any, ...]]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= EXPORT_ROWS_PER_WRITE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def render_ndjson(rows: Iterable[tuple[Any, ...]]) -> Iterator[bytes]:
+    columns = [column for (column, _) in EXPORT_COLUMNS]
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for batch in _batched(rows):
+        yield ''.join(encoder.encode(dict(zip(columns, row))) + '\n' for row in batch).encode('utf-8')
+
+
+def render_csv(rows: Iterable[tuple[Any, ...]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column for (column, _) in EXPORT_COLUMNS])
+    for batch in _batched(rows):
+        writer.writerows([['' if value is None else value.isoformat() if hasattr(value, 'isoformat') else value
+                           for value in row] for row in batch])
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Compress a stream of chunks into one gzip member on the fly."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_stream(file_format: str = 'ndjson', research_only: bool = False, compress: bool = False,
+                  chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Return the export as a stream of bytes, memory use does not grow with the cohort."""
+    render = render_csv if file_format == 'csv' else render_ndjson
+    chunks = render(export_rows(research_only, chunk_size))
+    return gzip_stream(chunks) if compress else chunks
+
+
+def export_filename(file_format: str, compress: bool = False) -> str:
+    return 'users.%s%s' % (EXPORT_FORMATS[file_format][1], '.gz' if compress else '')
@@ -1,2 +1,19 @@
-
 from django_filters import rest_framework as filters
+
+from .models import User, UserInfo, UserSettings, UserSystemInfo
+
+
+class UserFilter(filters.FilterSet):
+    """Filters of the user listing over the profile rows and research membership."""
+
+    gender = filters.ChoiceFilter(field_name='info__gender', choices=UserInfo.GenderChoices.choices)
+    age_min = filters.NumberFilter(field_name='info__age', lookup_expr='gte')
+    age_max = filters.NumberFilter(field_name='info__age', lookup_expr='lte')
+    os = filters.ChoiceFilter(field_name='system_info__os', choices=UserSystemInfo.OSChoises.choices)
+    locale = filters.ChoiceFilter(field_name='settings__locale', choices=UserSettings.LocaleChoises.choices)
+    # Expects a queryset annotated by User.objects.with_research().
+    is_research = filters.BooleanFilter(field_name='_is_research')
+
+    class Meta:
+        model = User
+        fields = ['gender', 'age_min', 'age_max', 'os', 'locale', 'is_research']
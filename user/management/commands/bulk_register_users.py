@@ -0,0 +1,36 @@
+import json
+import sys
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+
+from user.bulk import BULK_BATCH_SIZE, register_users
+
+
+class Command(BaseCommand):
+    help = 'Register users from a JSON list or NDJSON file of registration payloads.'
+
+    def add_arguments(self, parser: Any) -> None:
+        parser.add_argument('path', help='File with the payloads, "-" reads stdin.')
+        parser.add_argument('--batch-size', type=int, default=BULK_BATCH_SIZE)
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options['path'] == '-':
+            content = sys.stdin.read()
+        else:
+            with open(options['path'], encoding='utf-8') as source:
+                content = source.read()
+
+        try:
+            if content.lstrip().startswith('['):
+                payloads = json.loads(content)
+            else:
+                payloads = [json.loads(line) for line in content.splitlines() if line.strip()]
+        except json.JSONDecodeError as e:
+            raise CommandError('Invalid payload file: %s' % e)
+
+        created, errors = register_users(payloads, batch_size=options['batch_size'])
+
+        for error in errors:
+            self.stderr.write(json.dumps(error))
+        self.stdout.write(self.style.SUCCESS('Created %d users, rejected %d.' % (len(created), len(errors))))
@@ -0,0 +1,33 @@
+import sys
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from user.export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_stream
+
+
+class Command(BaseCommand):
+    help = 'Stream all users with their profiles as NDJSON or CSV.'
+
+    def add_arguments(self, parser: Any) -> None:
+        parser.add_argument('path', help='Output file, "-" writes stdout.')
+        parser.add_argument('--format', dest='file_format', choices=list(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--research-only', action='store_true')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        stream = export_stream(options['file_format'], options['research_only'], options['gzip'], options['chunk_size'])
+        if options['path'] == '-':
+            target = sys.stdout.buffer
+            for chunk in stream:
+                target.write(chunk)
+            target.flush()
+            return
+
+        written = 0
+        with open(options['path'], 'wb') as target:
+            for chunk in stream:
+                target.write(chunk)
+                written += len(chunk)
+        self.stderr.write('Wrote %d bytes to %s.' % (written, options['path']))
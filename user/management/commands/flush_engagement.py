@@ -0,0 +1,13 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from user.engagement import flush_engagement
+
+
+class Command(BaseCommand):
+    help = 'Write buffered user engagement to UserActivity.last_engagement now.'
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        flushed = flush_engagement(force=True)
+        self.stdout.write('Flushed engagement of %d users.' % flushed)
@@ -0,0 +1,23 @@
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from user.email_filter import get_options, needs_rebuild, rebuild_email_filter
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the shared Bloom filter of registered emails.'
+
+    def add_arguments(self, parser: Any) -> None:
+        parser.add_argument('--once', action='store_true', help='Rebuild once and exit.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        while True:
+            if options['once'] or needs_rebuild():
+                started = time.perf_counter()
+                count = rebuild_email_filter()
+                self.stdout.write('Rebuilt the email filter with %d emails in %.1f s.' % (count, time.perf_counter() - started))
+            if options['once']:
+                return
+            time.sleep(get_options()['SYNC_INTERVAL'])
@@ -0,0 +1,45 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from user.outbox import (PURGE_INTERVAL, RELAY_BATCH_SIZE, RELAY_CONCURRENCY, RELAY_MAX_ATTEMPTS, RETENTION_DAYS,
+                         RelayTransports, purge_events, relay_once)
+
+
+class Command(BaseCommand):
+    help = 'Deliver pending outbox events to the broker.'
+
+    def add_arguments(self, parser: Any) -> None:
+        parser.add_argument('--batch-size', type=int, default=RELAY_BATCH_SIZE)
+        parser.add_argument('--concurrency', type=int, default=RELAY_CONCURRENCY)
+        parser.add_argument('--max-attempts', type=int, default=RELAY_MAX_ATTEMPTS)
+        parser.add_argument('--interval', type=float, default=1, help='Seconds to sleep when nothing is due.')
+        parser.add_argument('--retention-days', type=int, default=RETENTION_DAYS,
+                            help='Delete delivered and failed events older than this.')
+        parser.add_argument('--once', action='store_true', help='Drain what is due and exit.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        transports = RelayTransports()
+        purged_at = None
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            while True:
+                if purged_at is None or time.monotonic() - purged_at >= PURGE_INTERVAL:
+                    purged = purge_events(options['retention_days'])
+                    purged_at = time.monotonic()
+                    if purged:
+                        self.stdout.write('Purged %d old events.' % purged)
+                delivered, failed = relay_once(
+                    options['batch_size'],
+                    concurrency=options['concurrency'],
+                    max_attempts=options['max_attempts'],
+                    executor=executor,
+                    transports=transports,
+                )
+                if delivered or failed:
+                    self.stdout.write('Delivered %d events, %d failed.' % (delivered, failed))
+                    continue
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
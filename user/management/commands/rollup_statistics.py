@@ -0,0 +1,22 @@
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from user.statistics import rollup_statistics
+
+
+class Command(BaseCommand):
+    help = 'Fold pending statistics counters into the per-day rows and totals.'
+
+    def add_arguments(self, parser: Any) -> None:
+        parser.add_argument('--interval', type=float, default=60, help='Seconds between rollups.')
+        parser.add_argument('--once', action='store_true', help='Roll up once and exit.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        while True:
+            folded = rollup_statistics()
+            self.stdout.write('Folded %d counters.' % folded)
+            if options['once']:
+                return
+            time.sleep(options['interval'])
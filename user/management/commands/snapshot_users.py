@@ -0,0 +1,25 @@
+from typing import Any
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from user.snapshot import write_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Append users changed since the last run to the columnar (Parquet) snapshot.'
+
+    def add_arguments(self, parser: Any) -> None:
+        parser.add_argument('--directory', help='Snapshot directory, SNAPSHOTS["DIRECTORY"] by default.')
+        parser.add_argument('--full', action='store_true', help='Start a new series with all users.')
+        parser.add_argument('--chunk-size', type=int)
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        try:
+            entry = write_snapshot(options['directory'], full=options['full'], chunk_size=options['chunk_size'])
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        if entry is None:
+            self.stdout.write('No users changed.')
+        else:
+            self.stdout.write(self.style.SUCCESS('Wrote %d users to %s.' % (entry['rows'], entry['path'])))
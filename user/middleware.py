@@ -0,0 +1,41 @@
+import asyncio
+from typing import Any, Callable
+
+from asgiref.sync import sync_to_async
+from django.http import HttpRequest, HttpResponse
+
+from .engagement import record_engagement
+
+
+class EngagementMiddleware:
+    """
+    Record the engagement of authenticated users. Only a buffer entry is
+    written per request, see user/engagement.py.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable[[HttpRequest], Any]) -> None:
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Tells Django to await this middleware, as MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request: HttpRequest) -> Any:
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self.record(request)
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        response = await self.get_response(request)
+        # A session user is only loaded from the database here.
+        await sync_to_async(self.record)(request)
+        return response
+
+    def record(self, request: HttpRequest) -> None:
+        # DRF sets the user it authenticated on the wrapped Django request.
+        user: Any = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            record_engagement(user.pk)
@@ -0,0 +1,58 @@
+# Generated by Django 4.0.6 on 2026-10-18 10:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0002_outboxevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstatistic',
+            name='engagement_seconds',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userstatistic',
+            name='logins',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userstatistic',
+            name='sessions',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userstatistic',
+            name='updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='UserDailyStatistic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('sessions', models.PositiveIntegerField(default=0)),
+                ('logins', models.PositiveIntegerField(default=0)),
+                ('engagement_seconds', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_statistics', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Users Daily Statistic',
+                'verbose_name_plural': 'Users Daily Statistics',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='userdailystatistic',
+            index=models.Index(fields=['day'], name='user_daily_statistic_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='userdailystatistic',
+            constraint=models.UniqueConstraint(fields=('user', 'day'), name='user_daily_statistic_unique'),
+        ),
+    ]
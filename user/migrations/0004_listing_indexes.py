@@ -0,0 +1,29 @@
+# Generated by Django 4.0.6 on 2026-10-18 10:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0003_userstatistic_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['created_at', 'id'], name='user_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userinfo',
+            index=models.Index(fields=['gender', 'age'], name='userinfo_gender_age_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usersettings',
+            index=models.Index(fields=['locale'], name='usersettings_locale_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usersysteminfo',
+            index=models.Index(fields=['os'], name='usersysteminfo_os_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+from django.db.models.functions import Lower
+import django.db.models.functions.text
+
+
+def lowercase_emails(apps, schema_editor):
+    User = apps.get_model('user', 'User')
+    duplicates = list(User.objects.values(email_lower=Lower('email'))
+                      .annotate(count=models.Count('id')).filter(count__gt=1).values_list('email_lower', flat=True))
+    if duplicates:
+        raise RuntimeError('Emails differing only in case must be merged first: %s' % ', '.join(duplicates))
+    for user in User.objects.exclude(email=Lower('email')).only('id', 'email').iterator():
+        User.objects.filter(id=user.id).update(email=user.email.strip().lower())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0005_snapshot_watermarks'),
+    ]
+
+    operations = [
+        migrations.RunPython(lowercase_emails, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), name='user_email_lower_unique'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from typing import Any, Optional
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from researchdt.exceptions import PreconditionFailed
+
+from .profile_cache import profile_etag, profile_stamp
+
+
+class ConditionalUserMixin:
+    """
+    Conditional requests for views of a single user. Validators come from the
+    profile version stamp, which changes with every save of the user or its
+    related rows, so they are computed without loading or serializing the user.
+    The stamps live in the default cache, which the workers share.
+    """
+
+    def get_validators(self, pk: Any) -> tuple[str, float]:
+        """Return `(etag, last_modified)` of the user's profile."""
+        stamp = profile_stamp(pk)
+        return profile_etag(stamp), stamp / 1e9
+
+    def get_validator_headers(self, pk: Any) -> dict[str, str]:
+        etag, last_modified = self.get_validators(pk)
+        return {'ETag': etag, 'Last-Modified': http_date(last_modified)}
+
+    def evaluate_preconditions(self, request: Request, pk: Any) -> Optional[Response]:
+        """
+        Return a 304 response when the client's copy is current, raise
+        `PreconditionFailed` when `If-Match`/`If-Unmodified-Since` do not hold,
+        and return None when the request should be served.
+        """
+        etag, last_modified = self.get_validators(pk)
+        response = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+        if response is None:
+            return None
+        if response.status_code == status.HTTP_412_PRECONDITION_FAILED:
+            raise PreconditionFailed()
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={
+            'ETag': etag,
+            'Last-Modified': http_date(last_modified),
+        })
@@ -10,25 +10,101 @@ from django.contrib.auth.models import (
     PermissionsMixin,
 )
 from django.db import models
-from rest_framework_simplejwt.tokens import RefreshToken
+from django.db.models.functions import Lower
+from django.utils import timezone
+from authorization.tokens import issue_tokens
+from researchdt.passwords import check_password, make_password
 
-from django.contrib.auth.models import Group
+from .research import get_research_group_id, is_research_member, research_membership
+from .utils import canonical_email
 
 
-class UserManager(BaseUserManager):  # type: ignore
+class DirtyFieldsMixin(models.Model):
+    """Remember the column values as loaded, so a save can write only the changed ones."""
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db: Optional[str], field_names: Any, values: Any) -> Any:
+        instance = super().from_db(db, field_names, values)
+        instance._remember_loaded_values()
+        return instance
+
+    def _remember_loaded_values(self) -> None:
+        # Deferred columns are not in __dict__ and are never reported dirty.
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields if field.attname in self.__dict__
+        }
+
+    def get_dirty_fields(self) -> list[str]:
+        """Return the names of the columns changed since the instance was loaded or saved."""
+        loaded = getattr(self, '_loaded_values', {})
+        return [
+            field.attname for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname in self.__dict__
+            and (field.attname not in loaded or loaded[field.attname] != getattr(self, field.attname))
+        ]
+
+    def save(self, *args: Any, **kwargs: Any) -> None:
+        super().save(*args, **kwargs)
+        self._remember_loaded_values()
+
+    def refresh_from_db(self, *args: Any, **kwargs: Any) -> None:
+        super().refresh_from_db(*args, **kwargs)
+        self._remember_loaded_values()
+
+    def save_dirty(self) -> list[str]:
+        """
+        Save only the changed columns, plus the `auto_now` ones when anything
+        changed, and return their names. Nothing is written when nothing changed.
+        """
+        if self._state.adding:
+            self.save()
+            return [field.attname for field in self._meta.concrete_fields]
+        dirty = self.get_dirty_fields()
+        if dirty:
+            dirty += [field.attname for field in self._meta.concrete_fields
+                      if getattr(field, 'auto_now', False) and field.attname not in dirty]
+            self.save(update_fields=dirty)
+        return dirty
+
+
+class UserQuerySet(models.QuerySet):
+
+    def by_email(self, email: str) -> models.QuerySet:
+        """Filter by email through the unique `Lower("email")` index."""
+        return self.alias(email_lower=Lower('email')).filter(email_lower=canonical_email(email))
+
+    def by_emails(self, emails: list[str]) -> models.QuerySet:
+        return self.alias(email_lower=Lower('email')).filter(email_lower__in=[canonical_email(email) for email in emails])
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):  # type: ignore
     """UserManager class."""
 
+    @classmethod
+    def normalize_email(cls, email: Optional[str]) -> str:
+        return canonical_email(email or '')
+
     # type: ignore
-    def create_user(self, email: str, password: Optional[str] = None, is_research = False) -> 'User':
-        """Create and return a `User` with an email, username and password."""
+    def create_user(self, email: str, password: Optional[str] = None, is_research = False,
+                    encoded_password: Optional[str] = None) -> 'User':
+        """
+        Create and return a `User` with an email, username and password.
+        `encoded_password` is a hash made by the caller, e.g. awaited in the pool.
+        """
     
         if email is None:
             raise TypeError('Users must have an email address.')
        
         user = self.model(email=self.normalize_email(email))
         
-        
-        user.set_password(password)
+        if encoded_password is not None:
+            user.password = encoded_password
+        else:
+            user.set_password(password)
         user.save()
         user.set_research_group(is_research)
         return user
@@ -45,22 +121,38 @@ class UserManager(BaseUserManager):  # type: ignore
         user.save()
 
         return user
+
+    def with_research(self) -> models.QuerySet:
+        """Return users annotated with their research group membership."""
+        return self.get_queryset().annotate(_is_research=research_membership())
+
+    def get_by_natural_key(self, username: Optional[str]) -> 'User':
+        """Load the user for authentication together with what login renders."""
+        return self.with_research().select_related('info', 'settings').by_email(username or '').get()
     
 
-class User(AbstractBaseUser, PermissionsMixin):
+class User(DirtyFieldsMixin, AbstractBaseUser, PermissionsMixin):
         
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     email = models.EmailField(db_index=True, unique=True)                                 
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     USERNAME_FIELD = 'email'
     
     class Meta:
         verbose_name = 'Users'
         verbose_name_plural = 'Users'
+        indexes = [
+            # Keyset pagination of the user listing.
+            models.Index(fields=['created_at', 'id'], name='user_created_id_idx'),
+        ]
+        constraints = [
+            # Emails are stored lowercase, lookups go through this index.
+            models.UniqueConstraint(Lower('email'), name='user_email_lower_unique'),
+        ]
     # Tells Django that the UserManager class defined above should manage
     # objects of this type.
     objects = UserManager()
@@ -69,10 +161,21 @@ class User(AbstractBaseUser, PermissionsMixin):
         string = self.email
         return string
 
+    def save(self, *args: Any, **kwargs: Any) -> None:
+        self.email = canonical_email(self.email)
+        super().save(*args, **kwargs)
+
     @property
     def tokens(self) -> dict[str, str]:
-        refresh = RefreshToken.for_user(self)
-        return {'refresh': str(refresh), 'access': str(refresh.access_token)}
+        return issue_tokens(self)
+
+    def set_password(self, raw_password: Optional[str]) -> None:
+        self.password = make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password: str) -> bool:
+        # Stale hashes are upgraded by login, see researchdt.hashers.upgrade_password.
+        return check_password(raw_password, self.password)
 
     def get_name(self) -> Optional[str]:
         return self.email
@@ -81,19 +184,17 @@ class User(AbstractBaseUser, PermissionsMixin):
         return self.email
     
     def is_research(self) -> bool:
-        try:
-            return Group.objects.get(name='research').user_set.filter(id=self.id).exists()
-        except Group.DoesNotExist:
-            return False
+        return is_research_member(self)
         
-    def set_research_group(self, is_research) -> str:
-        research_group, created = Group.objects.get_or_create(name='research') 
+    def set_research_group(self, is_research) -> None:
         if is_research:
-            research_group.user_set.add(self)
+            self.groups.add(get_research_group_id(create=True))
+            self._is_research = True
         elif is_research is False and self.is_research():
-            research_group.user_set.remove(self)
+            self.groups.remove(get_research_group_id())
+            self._is_research = False
 
-class UserInfo(models.Model):
+class UserInfo(DirtyFieldsMixin, models.Model):
     class GenderChoices(models.TextChoices):
         male = 'male'
         female = 'female'
@@ -104,16 +205,20 @@ class UserInfo(models.Model):
     name = models.CharField(max_length=255)
     subscription = models.CharField(default="", max_length=1000, blank=True)
     device_serial_number = models.CharField(max_length=255, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     class Meta:
         verbose_name = 'Users Information'
         verbose_name_plural = 'Users Information'
+        indexes = [
+            models.Index(fields=['gender', 'age'], name='userinfo_gender_age_idx'),
+        ]
         
     def __str__(self) -> str:
         string = self.user.email
         return string
     
-class UserSystemInfo(models.Model):
+class UserSystemInfo(DirtyFieldsMixin, models.Model):
     class OSChoises(models.TextChoices):
         ios = 'ios'
         android = 'android'
@@ -124,10 +229,14 @@ class UserSystemInfo(models.Model):
     platform_version = models.CharField(max_length=255, blank=True)
     device_model = models.CharField(max_length=255, blank=True)
     manufacturer = models.CharField(max_length=255, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     class Meta:
         verbose_name = 'Users System Information'
         verbose_name_plural = 'Users System Information'
+        indexes = [
+            models.Index(fields=['os'], name='usersysteminfo_os_idx'),
+        ]
         
     def __str__(self) -> str:
         string = self.user.email
@@ -146,7 +255,12 @@ class UserActivity(models.Model):
         return string
         
 class UserStatistic(models.Model):
+    # Totals folded in from the per-day rows, see user/statistics.py
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="statistic")
+    sessions = models.PositiveIntegerField(default=0)
+    logins = models.PositiveIntegerField(default=0)
+    engagement_seconds = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         verbose_name = 'Users Statistic'
@@ -155,8 +269,28 @@ class UserStatistic(models.Model):
     def __str__(self) -> str:
         string = self.user.email
         return string
+
+class UserDailyStatistic(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="daily_statistics")
+    day = models.DateField()
+    sessions = models.PositiveIntegerField(default=0)
+    logins = models.PositiveIntegerField(default=0)
+    engagement_seconds = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Users Daily Statistic'
+        verbose_name_plural = 'Users Daily Statistics'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='user_daily_statistic_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='user_daily_statistic_day_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return '%s %s' % (self.user_id, self.day)
     
-class UserSettings(models.Model):
+class UserSettings(DirtyFieldsMixin, models.Model):
     class LocaleChoises(models.TextChoices):
         en = 'en'
         ua = 'ua'
@@ -165,12 +299,42 @@ class UserSettings(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="settings")
     locale = models.CharField(choices=LocaleChoises.choices, max_length=255)
     fcm_token = models.CharField(default="", max_length=255, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     class Meta:
         verbose_name = 'Users Settings'
         verbose_name_plural = 'Users Settings'
+        indexes = [
+            models.Index(fields=['locale'], name='usersettings_locale_idx'),
+        ]
         
     def __str__(self) -> str:
         string = self.user.email
         return string
     
+class OutboxEvent(models.Model):
+    class StatusChoices(models.TextChoices):
+        pending = 'pending'
+        delivered = 'delivered'
+        failed = 'failed'
+
+    topic = models.CharField(max_length=255)
+    payload = models.JSONField()
+    status = models.CharField(choices=StatusChoices.choices, default=StatusChoices.pending, max_length=9)
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(max_length=64, blank=True, default="")
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Outbox Event'
+        verbose_name_plural = 'Outbox Events'
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='outbox_status_available_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return '%s #%s' % (self.topic, self.id)
@@ -0,0 +1,162 @@
+import json
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from researchdt.aio import acreate
+
+from .models import OutboxEvent
+from .publisher import get_options
+
+EMAIL_TOPIC = 'email.send'
+
+RELAY_BATCH_SIZE = 100
+RELAY_CONCURRENCY = 4
+RELAY_MAX_ATTEMPTS = 10
+# Seconds a relay owns a claimed batch, afterwards another relay may retry it.
+CLAIM_LEASE = 60
+RETRY_BASE_DELAY = 1
+RETRY_MAX_DELAY = 600
+# Delivered and failed events are deleted this many days after they were
+# enqueued, the relay purges them every PURGE_INTERVAL seconds.
+RETENTION_DAYS = 7
+PURGE_INTERVAL = 60 * 60
+
+
+def enqueue_event(payload: dict[str, Any], topic: str = EMAIL_TOPIC) -> OutboxEvent:
+    """
+    Store an event for the relay. Call it inside the transaction of the change
+    that triggers the event, so both are committed or rolled back together.
+    """
+    return OutboxEvent.objects.create(topic=topic, payload=payload)
+
+
+async def aenqueue_event(payload: dict[str, Any], topic: str = EMAIL_TOPIC) -> OutboxEvent:
+    """`enqueue_event` for async views, the event is committed on its own."""
+    return await acreate(OutboxEvent.objects, topic=topic, payload=payload)
+
+
+def _claimable(now: Any) -> Q:
+    return Q(status=OutboxEvent.StatusChoices.pending, available_at__lte=now) & (
+        Q(claimed_until__isnull=True) | Q(claimed_until__lt=now))
+
+
+def claim_events(batch_size: int = RELAY_BATCH_SIZE, lease: int = CLAIM_LEASE) -> list[OutboxEvent]:
+    """
+    Claim due events for this relay. Backends with SKIP LOCKED let concurrent
+    relays pick disjoint rows without waiting; elsewhere (sqlite) rows are
+    claimed with a conditional UPDATE and a lease token.
+    """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    claim = {'claimed_by': token, 'claimed_until': now + timedelta(seconds=lease)}
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(OutboxEvent.objects.select_for_update(skip_locked=True)
+                       .filter(_claimable(now)).order_by('id').values_list('id', flat=True)[:batch_size])
+            OutboxEvent.objects.filter(id__in=ids).update(**claim)
+    else:
+        ids = list(OutboxEvent.objects.filter(_claimable(now)).order_by('id').values_list('id', flat=True)[:batch_size])
+        # Rows claimed by another relay since the SELECT no longer match.
+        OutboxEvent.objects.filter(_claimable(now), id__in=ids).update(**claim)
+
+    return list(OutboxEvent.objects.filter(claimed_by=token).order_by('id'))
+
+
+class RelayTransports(threading.local):
+    """One transport per relay thread and topic."""
+
+    def get(self, topic: str) -> Any:
+        transports = self.__dict__.setdefault('transports', {})
+        if topic not in transports:
+            options = {**get_options(), 'QUEUE': topic}
+            transports[topic] = import_string(options['TRANSPORT'])(options)
+        return transports[topic]
+
+
+def _publish(transports: RelayTransports, events: list[OutboxEvent]) -> tuple[list[OutboxEvent], Optional[Exception]]:
+    try:
+        transports.get(events[0].topic).publish_batch([json.dumps(event.payload).encode('utf-8') for event in events])
+    except Exception as e:
+        transports.get(events[0].topic).close()
+        return events, e
+    return events, None
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY))
+
+
+def deliver_events(events: list[OutboxEvent], concurrency: int = RELAY_CONCURRENCY,
+                   max_attempts: int = RELAY_MAX_ATTEMPTS, executor: Optional[ThreadPoolExecutor] = None,
+                   transports: Optional[RelayTransports] = None) -> tuple[int, int]:
+    """
+    Publish claimed events with at most `concurrency` batches in flight and
+    record the outcome. Failed events are retried with exponential backoff
+    until `max_attempts`. Return `(delivered, failed)`.
+    """
+    transports = transports or RelayTransports()
+    by_topic: dict[str, list[OutboxEvent]] = {}
+    for event in events:
+        by_topic.setdefault(event.topic, []).append(event)
+    chunk_size = max(1, -(-len(events) // concurrency))
+    chunks = [topic_events[start:start + chunk_size]
+              for topic_events in by_topic.values() for start in range(0, len(topic_events), chunk_size)]
+
+    own_executor = executor is None
+    executor = executor or ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        results = list(executor.map(lambda chunk: _publish(transports, chunk), chunks))
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    now = timezone.now()
+    delivered = [event.id for (chunk, error) in results if error is None for event in chunk]
+    # The payload holds the recipient and the reset code, it is not kept.
+    OutboxEvent.objects.filter(id__in=delivered).update(
+        status=OutboxEvent.StatusChoices.delivered, delivered_at=now, payload={}, claimed_by="", claimed_until=None)
+
+    failed = 0
+    for (chunk, error) in results:
+        if error is None:
+            continue
+        for event in chunk:
+            attempts = event.attempts + 1
+            OutboxEvent.objects.filter(id=event.id).update(
+                attempts=attempts,
+                status=OutboxEvent.StatusChoices.failed if attempts >= max_attempts else OutboxEvent.StatusChoices.pending,
+                available_at=now + _retry_delay(attempts),
+                last_error=str(error),
+                claimed_by="",
+                claimed_until=None,
+            )
+            failed += 1
+
+    return len(delivered), failed
+
+
+def relay_once(batch_size: int = RELAY_BATCH_SIZE, **kwargs: Any) -> tuple[int, int]:
+    """Claim and deliver one batch. Return `(delivered, failed)`."""
+    events = claim_events(batch_size)
+    if not events:
+        return 0, 0
+    return deliver_events(events, **kwargs)
+
+
+def purge_events(retention_days: int = RETENTION_DAYS, now: Optional[datetime] = None) -> int:
+    """Delete delivered and failed events older than `retention_days`. Return how many."""
+    cutoff = (now or timezone.now()) - timedelta(days=retention_days)
+    deleted, _ = OutboxEvent.objects.filter(
+        status__in=(OutboxEvent.StatusChoices.delivered, OutboxEvent.StatusChoices.failed),
+        created_at__lt=cutoff,
+    ).delete()
+    return deleted
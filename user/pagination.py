@@ -1,6 +1,87 @@
-from rest_framework.pagination import PageNumberPagination
+import uuid
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from typing import Any, Optional
 
-class UserPagination(PageNumberPagination):
-    page_size = 2
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from rest_framework import exceptions
+from rest_framework.pagination import BasePagination
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class UserPagination(BasePagination):
+    """
+    Keyset pagination over `(created_at, id)`. The cursor holds the key of the
+    last row of the page and the next page starts right after it, so a deep
+    page is an index range scan like the first one, with no OFFSET.
+    """
+
+    page_size = 50
     page_size_query_param = 'page_size'
-     
\ No newline at end of file
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    ordering = ('created_at', 'id')
+
+    def get_page_size(self, request: Request) -> int:
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def encode_cursor(self, row: Any) -> str:
+        key = '%s|%s' % (row.created_at.isoformat(), row.pk)
+        return urlsafe_b64encode(key.encode()).decode()
+
+    def decode_cursor(self, request: Request) -> Optional[tuple[Any, uuid.UUID]]:
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            created_at, pk = urlsafe_b64decode(encoded.encode()).decode().split('|', 1)
+            created_at = parse_datetime(created_at)
+            pk = uuid.UUID(pk)
+        except ValueError:
+            created_at = None
+        if created_at is None:
+            raise exceptions.NotFound('Invalid cursor', 'invalid_cursor')
+        return created_at, pk
+
+    def paginate_queryset(self, queryset: QuerySet, request: Request, view: Any = None) -> list[Any]:
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        queryset = queryset.order_by(*self.ordering)
+        if cursor is not None:
+            created_at, pk = cursor
+            queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+
+        rows = list(queryset[:self.page_size_value + 1])
+        self.has_next = len(rows) > self.page_size_value
+        self.page = rows[:self.page_size_value]
+        return self.page
+
+    def get_next_link(self) -> Optional[str]:
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+        return replace_query_param(url, self.page_size_query_param, self.page_size_value)
+
+    def get_paginated_response(self, data: Any) -> Response:
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema: dict[str, Any]) -> dict[str, Any]:
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,87 @@
+import time
+from typing import Any, Callable, Iterable
+
+from django.db import connection, transaction
+
+from researchdt.cache import TieredCache, addKey, getKey, setKey
+
+# Bump when the RetrieveUpdateUserSerializer payload changes shape.
+PROFILE_SCHEMA = 1
+PROFILE_TIMEOUT = 60 * 60
+
+# Rendered profiles are stored under "<user id>:<stamp>". The stamp is the
+# time (ns) of the last change of the user or its related rows, so a change
+# only has to write a new stamp: entries of older stamps are never read again
+# and simply expire.
+profiles = TieredCache('profile:v%d' % PROFILE_SCHEMA, local_timeout=5, timeout=PROFILE_TIMEOUT)
+
+
+def _stampKey(user_id: Any) -> str:
+    return 'profile:stamp:%s' % user_id
+
+
+def profile_stamp(user_id: Any) -> int:
+    """Return the current version stamp of the user's profile."""
+    stamp = getKey(_stampKey(user_id))
+    if stamp is None:
+        addKey(_stampKey(user_id), time.time_ns())
+        stamp = getKey(_stampKey(user_id))
+    return stamp
+
+
+def profile_etag(stamp: int) -> str:
+    return '"%d-%d"' % (PROFILE_SCHEMA, stamp)
+
+
+def get_profile(user_id: Any, render: Callable[[], tuple[dict[str, Any], Any]]) -> dict[str, Any]:
+    """
+    Return `{'data', 'etag', 'last_modified'}` of the user's profile.
+    `render` is only called on a miss and returns the serialized payload with
+    the user's `updated_at`.
+    """
+    stamp = profile_stamp(user_id)
+
+    def produce() -> dict[str, Any]:
+        data, updated_at = render()
+        return {
+            'data': data,
+            'etag': profile_etag(stamp),
+            'last_modified': max(updated_at.timestamp(), stamp / 1e9),
+        }
+
+    return profiles.get_or_set('%s:%s' % (user_id, stamp), produce)
+
+
+def _bump(user_ids: Iterable[Any]) -> None:
+    for user_id in user_ids:
+        setKey(_stampKey(user_id), time.time_ns(), timeout=None)
+
+
+def invalidate_profiles(user_ids: Iterable[Any]) -> None:
+    """Give the users' profiles a new stamp, again once the transaction commits."""
+    user_ids = list(user_ids)
+    if connection.in_atomic_block:
+        # A read before the commit may cache the old rows under the new stamp.
+        _bump(user_ids)
+    transaction.on_commit(lambda: _bump(user_ids))
+
+
+def user_saved(sender: Any, instance: Any, **kwargs: Any) -> None:
+    """`post_save`/`post_delete` receiver for `User`."""
+    invalidate_profiles([instance.pk])
+
+
+def profile_row_saved(sender: Any, instance: Any, **kwargs: Any) -> None:
+    """`post_save`/`post_delete` receiver for the one-to-one profile rows."""
+    invalidate_profiles([instance.user_id])
+
+
+def user_groups_changed(sender: Any, instance: Any, action: str, reverse: bool, pk_set: Any, **kwargs: Any) -> None:
+    """`m2m_changed` receiver for `User.groups`."""
+    if reverse and action == 'pre_clear':
+        # group.user_set.clear() does not tell afterwards who the members were.
+        invalidate_profiles(instance.user_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        invalidate_profiles(pk_set if reverse else [instance.pk])
+    elif action == 'post_clear' and not reverse:
+        invalidate_profiles([instance.pk])
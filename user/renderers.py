@@ -1,30 +1,19 @@
-import json
 from typing import Any, Mapping, Optional
 
-from rest_framework.renderers import JSONRenderer
+from researchdt.renderers import FastJSONRenderer
 
 
-class UserJSONRenderer(JSONRenderer):
-    """Custom method."""
-
-    charset = 'utf-8'
+class UserJSONRenderer(FastJSONRenderer):
+    """Render a user under the "user" key."""
 
     def render(
         self,
-        data: dict[str, Any],
-        media_type: Optional[str] = None,
+        data: Any,
+        accepted_media_type: Optional[str] = None,
         renderer_context: Optional[Mapping[str, Any]] = None,
-    ) -> str:
-        """Return a well formatted user jSON."""
-        errors = data.get('errors', None)
-        token = data.get('token', None)
-        if errors is not None:
-            return super(UserJSONRenderer, self).render(data)
-
-        if token is not None and isinstance(token, bytes):
-            # Also as mentioned above, we will decode `token` if it is of type
-            # bytes.
-            data['token'] = token.decode('utf-8')
-
-        # Finally, we can render our data under the "user" namespace.
-        return json.dumps({'user': data})
\ No newline at end of file
+    ) -> bytes:
+        """Return a well formatted user JSON."""
+        if data is None or data.get('errors', None) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        # A bytes `token` is decoded by the encoder.
+        return super().render({'user': data}, accepted_media_type, renderer_context)
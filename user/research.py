@@ -0,0 +1,91 @@
+from typing import Any, Optional
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+RESEARCH_GROUP_NAME = 'research'
+
+# Process-level cache of the research group primary key. It is only filled
+# once the transaction that read or created the group has committed, so a
+# rolled back `get_or_create` never leaves a dangling id behind.
+_research_group_id: Optional[int] = None
+
+
+def _remember_group_id(group_id: int) -> None:
+    global _research_group_id
+    _research_group_id = group_id
+
+
+def reset_research_group_cache() -> None:
+    """Forget the cached research group id."""
+    global _research_group_id
+    _research_group_id = None
+
+
+def get_research_group_id(create: bool = False) -> Optional[int]:
+    """Return the research group id, creating the group if asked to."""
+    if _research_group_id is not None:
+        return _research_group_id
+
+    if create:
+        group_id = Group.objects.get_or_create(name=RESEARCH_GROUP_NAME)[0].id
+    else:
+        group_id = Group.objects.filter(name=RESEARCH_GROUP_NAME).values_list('id', flat=True).first()
+        if group_id is None:
+            return None
+
+    transaction.on_commit(lambda: _remember_group_id(group_id))
+    return group_id
+
+
+def research_membership() -> Exists:
+    """Subquery expression telling whether the outer user is in the research group."""
+    members = get_user_model().groups.through.objects.filter(user_id=OuterRef('pk'))
+    if _research_group_id is not None:
+        return Exists(members.filter(group_id=_research_group_id))
+    return Exists(members.filter(group__name=RESEARCH_GROUP_NAME))
+
+
+def is_research_member(user: Any) -> bool:
+    """
+    Resolve research membership of the user, in order of preference from
+    the `with_research()` annotation, prefetched groups and finally a single
+    through-table query. The answer is memoized on the instance until its
+    groups change.
+    """
+    if '_is_research' in user.__dict__:
+        return user._is_research
+
+    prefetched = getattr(user, '_prefetched_objects_cache', {}).get('groups')
+    if prefetched is not None:
+        result = any(group.name == RESEARCH_GROUP_NAME for group in prefetched)
+    else:
+        group_id = get_research_group_id()
+        if group_id is None:
+            result = False
+        else:
+            result = user.groups.through.objects.filter(user_id=user.pk, group_id=group_id).exists()
+
+    user._is_research = result
+    return result
+
+
+def forget_membership(user: Any) -> None:
+    """Drop memoized group data from the user instance."""
+    user.__dict__.pop('_is_research', None)
+
+
+def user_groups_changed(sender: Any, instance: Any, action: str, reverse: bool, **kwargs: Any) -> None:
+    """`m2m_changed` receiver for `User.groups`."""
+    # On the reverse side (`group.user_set.add(...)`) only user ids are known,
+    # those instances are fresh on their next load anyway.
+    if action in ('post_add', 'post_remove', 'post_clear') and not reverse:
+        forget_membership(instance)
+
+
+def research_group_changed(sender: Any, instance: Group, **kwargs: Any) -> None:
+    """`post_save`/`post_delete` receiver for `Group`."""
+    if instance.name == RESEARCH_GROUP_NAME or instance.id == _research_group_id:
+        reset_research_group_cache()
@@ -5,14 +5,17 @@ from rest_framework import exceptions, serializers
 from rest_framework_simplejwt.tokens import RefreshToken, TokenError
 from django.contrib.auth.password_validation import validate_password
 
+from authorization.tokens import TokenIssuingMixin
 from researchdt.cache import deleteKey, getKey
+from researchdt.exceptions import PasswordHashingUnavailable
+from .email_filter import email_may_exist
 from .models import User, UserActivity, UserInfo, UserSettings, UserStatistic, UserSystemInfo
-from .utils import validate_email as email_is_valid
+from .utils import RESET_CODE_NAMESPACE, canonical_email, reset_code_key, validate_email as email_is_valid
 
 from django.utils.encoding import force_str
 from django.utils.http import urlsafe_base64_decode
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.db.models import Prefetch
 
 class UserInfoSerializer(serializers.ModelSerializer):
@@ -43,7 +46,7 @@ class UserSystemInfoSerializer(serializers.ModelSerializer):
         fields = ['os', 'platform_version', 'device_model', 'manufacturer']
         model = UserSystemInfo
         
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TokenIssuingMixin, serializers.ModelSerializer):
     """Handle serialization and deserialization of User objects."""
 
     info=UserInfoSerializer(required=True)
@@ -52,26 +55,37 @@ class UserSerializer(serializers.ModelSerializer):
     email = serializers.EmailField(required=True)
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
     is_research = serializers.BooleanField(required=True)
+    tokens = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = ['id', 'email', 'password', 'info', 'settings', 'is_research', 'system_info', 'tokens']
 
     def validate_email(self, value):
-        lower_email = value.lower()
-        if User.objects.filter(email__iexact=lower_email).exists():
+        email = canonical_email(value)
+        # Emails the filter has never seen skip the query, the unique index decides.
+        # Async views ask the database themselves, without `check_exists`.
+        if self.context.get('check_exists', True) and email_may_exist(email) and User.objects.by_email(email).exists():
             raise serializers.ValidationError("Email is exist")
-        return lower_email
+        return email
 
-    
     def create(self, validated_data):
         """Return user after creation."""
+        try:
+            return self._create(validated_data)
+        except IntegrityError:
+            if User.objects.by_email(validated_data['email']).exists():
+                raise serializers.ValidationError({"email": [serializers.ErrorDetail("Email is exist", "invalid")]})
+            raise
+
+    def _create(self, validated_data):
         #try:
         with transaction.atomic():
             user = User.objects.create_user(
                 email=validated_data['email'], 
                 password=validated_data['password'],
-                is_research=validated_data['is_research']
+                is_research=validated_data['is_research'],
+                encoded_password=validated_data.pop('encoded_password', None)
             )
             
             info_data=validated_data.pop('info')
@@ -118,12 +132,12 @@ class RetrieveUpdateUserSerializer(serializers.ModelSerializer):
 
     def validate_email(self, value):
         user = self.instance
-        lower_email = value.lower()
-        if user.email == lower_email:
-            return lower_email
-        if User.objects.filter(email__iexact=lower_email).exists():
+        email = canonical_email(value)
+        if user.email == email:
+            return email
+        if email_may_exist(email) and User.objects.by_email(email).exists():
             raise serializers.ValidationError("Email is exist", "email_exist")
-        return lower_email
+        return email
     
     def validate_old_password(self, value):
         user = self.instance
@@ -133,6 +147,15 @@ class RetrieveUpdateUserSerializer(serializers.ModelSerializer):
 
     def update(self, user, validated_data):  # type: ignore
         """Perform an update on a User."""
+        try:
+            return self._update(user, validated_data)
+        except IntegrityError:
+            email = validated_data.get('email')
+            if email is not None and User.objects.by_email(email).exclude(pk=user.pk).exists():
+                raise serializers.ValidationError({"email": [serializers.ErrorDetail("Email is exist", "email_exist")]})
+            raise
+
+    def _update(self, user, validated_data):
         with transaction.atomic():
             password = validated_data.pop('password', None)
             info_data=validated_data.pop('info', None)
@@ -140,33 +163,34 @@ class RetrieveUpdateUserSerializer(serializers.ModelSerializer):
             system_info_data=validated_data.pop('system_info', None)
             is_research = validated_data.pop('is_research', None)
                
+            # Only rows with changed values are written, and only their changed columns.
             if info_data is not None:
                 for (key, value) in info_data.items():
                     setattr(user.info, key, value)
-                user.info.save()
+                user.info.save_dirty()
                 
                 
             if settings_data is not None:
                 for (key, value) in settings_data.items(): 
                     setattr(user.settings, key, value)
-                user.settings.save()
+                user.settings.save_dirty()
                
                 
             if system_info_data is not None:
                 for (key, value) in system_info_data.items():
                     setattr(user.system_info, key, value)
-                user.system_info.save()
+                user.system_info.save_dirty()
                 
             for (key, value) in validated_data.items():
                 setattr(user, key, value)
 
-            if is_research is not None:
+            if is_research is not None and is_research != user.is_research():
                 user.set_research_group(is_research)
                 
             if password is not None:
                 user.set_password(password)
 
-            user.save()
+            user.save_dirty()
             return user
     
 class ResetPasswordEmailRequestSerializer(serializers.Serializer):
@@ -179,18 +203,15 @@ class ResetPasswordEmailRequestSerializer(serializers.Serializer):
         valid, error_text = email_is_valid(value)
         if not valid:
             raise serializers.ValidationError(error_text)
-        try:
-            email_name, domain_part = value.strip().rsplit('@', 1)
-        except ValueError:
-            pass
-        else:
-            value = '@'.join([email_name, domain_part.lower()])
-
-        lower_email = value.lower()
-        if not User.objects.filter(email=lower_email).exists():
-            raise serializers.ValidationError('User not found by email.', 'email_is_not_exist')
+        email = canonical_email(value)
+        if self.context.get('check_exists', True) and not User.objects.by_email(email).exists():
+            raise self.email_not_found()
         
-        return value
+        return email
+
+    @staticmethod
+    def email_not_found() -> serializers.ValidationError:
+        return serializers.ValidationError('User not found by email.', 'email_is_not_exist')
     
  
     
@@ -233,23 +254,55 @@ class SetNewPasswordByCodeSerializer(serializers.Serializer):
 
     def validate(self, attrs):
         try:
-            email = attrs.get('email')
+            email = canonical_email(attrs.get('email'))
             password = attrs.get('password')
             code = attrs.get('code')
             
             try:
-                user = User.objects.get(email=email)
+                user = User.objects.by_email(email).get()
                 print(user)
             except User.DoesNotExist:
                 raise User.DoesNotExist
             
-            if getKey(email) != code:
+            if getKey(reset_code_key(email)) != code:
                 raise serializers.ValidationError('The reset data is invalid', 'reset_data_invalid')
-            deleteKey(email)
             user.set_password(password)
             user.save()
+            deleteKey(reset_code_key(email), namespace=RESET_CODE_NAMESPACE)
 
             return (user)
+        except PasswordHashingUnavailable:
+            raise
         except Exception as e:
             raise serializers.ValidationError('The reset data is invalid', 'reset_data_invalid')
-        
\ No newline at end of file
+        
+
+class StatisticQuerySerializer(serializers.Serializer):
+    days = serializers.IntegerField(min_value=1, max_value=90, default=7)
+
+
+class StatisticMetricsSerializer(serializers.Serializer):
+    sessions = serializers.IntegerField()
+    logins = serializers.IntegerField()
+    engagement_seconds = serializers.IntegerField()
+
+
+class DailyStatisticSerializer(StatisticMetricsSerializer):
+    day = serializers.DateField()
+
+
+class DailySummarySerializer(DailyStatisticSerializer):
+    users = serializers.IntegerField()
+
+
+class UserStatisticSerializer(serializers.Serializer):
+    total = StatisticMetricsSerializer()
+    week = StatisticMetricsSerializer()
+    days = DailyStatisticSerializer(many=True)
+    updated_at = serializers.DateTimeField(allow_null=True)
+
+
+class ExportQuerySerializer(serializers.Serializer):
+    output = serializers.ChoiceField(choices=['ndjson', 'csv'], default='ndjson')
+    research_only = serializers.BooleanField(default=False)
+    gzip = serializers.BooleanField(default=False)
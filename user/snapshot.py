@@ -0,0 +1,181 @@
+import json
+import os
+from datetime import timedelta
+from typing import Any, Iterator, Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import QuerySet
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import User, UserInfo, UserSettings, UserSystemInfo
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - optional dependency
+    pyarrow = None
+
+# DIRECTORY: where snapshot files and the manifest go. CHUNK_SIZE: rows read
+# per database round trip and written per Parquet row group. LAG: seconds the
+# next run re-reads before the watermark, so rows committed late by a
+# transaction that started before the run are not missed.
+DEFAULTS = {
+    'DIRECTORY': 'snapshots',
+    'CHUNK_SIZE': 50_000,
+    'LAG': 60,
+}
+
+MANIFEST_NAME = 'manifest.json'
+SNAPSHOT_SCHEMA = 1
+
+# (column, lookup, kind) of a snapshot row.
+SNAPSHOT_COLUMNS = (
+    ('id', 'id', 'string'),
+    ('email', 'email', 'string'),
+    ('is_research', '_is_research', 'bool'),
+    ('is_active', 'is_active', 'bool'),
+    ('created_at', 'created_at', 'timestamp'),
+    ('updated_at', 'updated_at', 'timestamp'),
+    ('name', 'info__name', 'string'),
+    ('gender', 'info__gender', UserInfo.GenderChoices),
+    ('age', 'info__age', 'int32'),
+    ('os', 'system_info__os', UserSystemInfo.OSChoises),
+    ('platform_version', 'system_info__platform_version', 'string'),
+    ('device_model', 'system_info__device_model', 'string'),
+    ('manufacturer', 'system_info__manufacturer', 'string'),
+    ('locale', 'settings__locale', UserSettings.LocaleChoises),
+)
+
+
+def get_options() -> dict[str, Any]:
+    return {**DEFAULTS, **getattr(settings, 'SNAPSHOTS', {})}
+
+
+def _require_pyarrow() -> None:
+    if pyarrow is None:
+        raise ImproperlyConfigured('Columnar snapshots need pyarrow, install it with "pip install pyarrow".')
+
+
+def snapshot_schema() -> Any:
+    """
+    Arrow schema of a snapshot. Choice columns are dictionary encoded with
+    the full list of choices as dictionary, so codes are the same in every file.
+    """
+    _require_pyarrow()
+    types = {
+        'string': pyarrow.string(),
+        'bool': pyarrow.bool_(),
+        'int32': pyarrow.int32(),
+        'timestamp': pyarrow.timestamp('us', tz='UTC'),
+    }
+    return pyarrow.schema([
+        pyarrow.field(column, types[kind] if isinstance(kind, str) else pyarrow.dictionary(pyarrow.int8(), pyarrow.string()))
+        for (column, _, kind) in SNAPSHOT_COLUMNS
+    ])
+
+
+def changed_users(since: Optional[Any] = None) -> QuerySet:
+    """Return users changed after `since` in the user row or a profile row, all without it."""
+    queryset = User.objects.with_research()
+    if since is not None:
+        # One range scan of the updated_at index per table, an OR over the
+        # joined tables would scan every user.
+        changed = User.objects.filter(updated_at__gt=since).values('pk').union(
+            *[model.objects.filter(updated_at__gt=since).values('user_id')
+              for model in (UserInfo, UserSettings, UserSystemInfo)])
+        queryset = queryset.filter(pk__in=changed)
+    return queryset.order_by('created_at', 'id').values_list(*[lookup for (_, lookup, _) in SNAPSHOT_COLUMNS])
+
+
+def _record_batches(rows: Iterator[tuple[Any, ...]], chunk_size: int) -> Iterator[Any]:
+    schema = snapshot_schema()
+    codes = {column: {value: code for (code, value) in enumerate(kind.values)}
+             for (column, _, kind) in SNAPSHOT_COLUMNS if not isinstance(kind, str)}
+
+    def build(chunk: list[tuple[Any, ...]]) -> Any:
+        arrays = []
+        for (position, (column, _, kind)) in enumerate(SNAPSHOT_COLUMNS):
+            values = [row[position] for row in chunk]
+            if column in codes:
+                indices = pyarrow.array([codes[column].get(value) for value in values], pyarrow.int8())
+                arrays.append(pyarrow.DictionaryArray.from_arrays(indices, pyarrow.array(kind.values, pyarrow.string())))
+            elif column == 'id':
+                arrays.append(pyarrow.array([str(value) for value in values], pyarrow.string()))
+            else:
+                arrays.append(pyarrow.array(values, schema.field(column).type))
+        return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+    chunk: list[tuple[Any, ...]] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield build(chunk)
+            chunk = []
+    if chunk:
+        yield build(chunk)
+
+
+def read_manifest(directory: str) -> dict[str, Any]:
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'schema': SNAPSHOT_SCHEMA, 'watermark': None, 'files': []}
+    with open(path, encoding='utf-8') as manifest:
+        return json.load(manifest)
+
+
+def _write_manifest(directory: str, manifest: dict[str, Any]) -> None:
+    path = os.path.join(directory, MANIFEST_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as target:
+        json.dump(manifest, target, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def write_snapshot(directory: Optional[str] = None, full: bool = False, chunk_size: Optional[int] = None) -> Optional[dict[str, Any]]:
+    """
+    Write the users changed since the manifest's watermark into a new Parquet
+    file and record it in the manifest. `full` starts a new series with all
+    users. Readers take, per user id, the row of the latest file; deleted users
+    are not tracked. Return the manifest entry, None when nothing changed.
+    """
+    _require_pyarrow()
+    options = get_options()
+    directory = str(directory or options['DIRECTORY'])
+    chunk_size = chunk_size or options['CHUNK_SIZE']
+    os.makedirs(directory, exist_ok=True)
+
+    manifest = read_manifest(directory)
+    if full or manifest.get('schema') != SNAPSHOT_SCHEMA:
+        manifest = {'schema': SNAPSHOT_SCHEMA, 'watermark': None, 'files': []}
+    since = parse_datetime(manifest['watermark']) if manifest['watermark'] else None
+    started = timezone.now()
+
+    name = 'users-%05d-%s.parquet' % (len(manifest['files']) + 1, started.strftime('%Y%m%dT%H%M%S'))
+    path = os.path.join(directory, name)
+    rows = 0
+    writer = None
+    try:
+        for batch in _record_batches(changed_users(since).iterator(chunk_size=chunk_size), chunk_size):
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(path + '.tmp', batch.schema, compression='zstd')
+            writer.write_table(pyarrow.Table.from_batches([batch]))
+            rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+
+    manifest['watermark'] = (started - timedelta(seconds=options['LAG'])).isoformat()
+    entry = None
+    if rows:
+        os.replace(path + '.tmp', path)
+        entry = {
+            'path': name,
+            'rows': rows,
+            'full': since is None,
+            'since': since.isoformat() if since else None,
+            'created_at': started.isoformat(),
+        }
+        manifest['files'].append(entry)
+    _write_manifest(directory, manifest)
+    return entry
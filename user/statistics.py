@@ -0,0 +1,167 @@
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from typing import Any, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from researchdt.cache import LocalLRU, delete_many, get_many, getKey, iterKeys, pipeline, registerKeys, setKey
+
+from .models import User, UserDailyStatistic, UserStatistic
+
+# SESSION_GAP: seconds of inactivity after which engagement starts a new
+# session. NAMESPACE: index of the pending counters. BATCH_SIZE: counters
+# folded per rollup round. WEEK_DAYS: length of the rolling window.
+DEFAULTS = {
+    'SESSION_GAP': 30 * 60,
+    'NAMESPACE': 'stats',
+    'BATCH_SIZE': 1000,
+    'WEEK_DAYS': 7,
+}
+
+METRICS = ('sessions', 'logins', 'engagement_seconds')
+
+
+def get_options() -> dict[str, Any]:
+    return {**DEFAULTS, **getattr(settings, 'STATISTICS', {})}
+
+
+# Counter keys this process already put into the namespace index.
+_registered = LocalLRU(maxsize=100_000)
+
+
+def _counterKey(namespace: str, day: date, user_id: Any, metric: str) -> str:
+    return '%s:%s:%s:%s' % (namespace, day.isoformat(), user_id, metric)
+
+
+def _lastSeenKey(namespace: str, user_id: Any) -> str:
+    return '%s-last:%s' % (namespace, user_id)
+
+
+def _day(now: float) -> date:
+    return timezone.localdate(datetime.fromtimestamp(now, dt_timezone.utc))
+
+
+def count_event(user_id: Any, deltas: dict[str, int], now: Optional[float] = None) -> None:
+    """Add `deltas` to today's pending counters of the user, atomically per counter."""
+    options = get_options()
+    now = time.time() if now is None else now
+    keys = {metric: _counterKey(options['NAMESPACE'], _day(now), user_id, metric)
+            for (metric, delta) in deltas.items() if delta}
+    new = [key for key in keys.values() if not _registered.get(key)[0]]
+    if new:
+        registerKeys(options['NAMESPACE'], new)
+        for key in new:
+            _registered.set(key, True, 24 * 60 * 60)
+    with pipeline() as pipe:
+        for (metric, key) in keys.items():
+            pipe.incr(key, deltas[metric])
+
+
+def record_login(user_id: Any, now: Optional[float] = None) -> None:
+    count_event(user_id, {'logins': 1}, now)
+
+
+def record_activity(user_id: Any, now: Optional[float] = None) -> None:
+    """
+    Count a sign of life of the user: it starts a session after SESSION_GAP
+    of inactivity, otherwise the time since the previous one is engagement.
+    """
+    options = get_options()
+    now = time.time() if now is None else now
+    last_seen = getKey(_lastSeenKey(options['NAMESPACE'], user_id))
+    setKey(_lastSeenKey(options['NAMESPACE'], user_id), now, timeout=options['SESSION_GAP'])
+    if last_seen is None or now - last_seen > options['SESSION_GAP']:
+        count_event(user_id, {'sessions': 1}, now)
+    elif now > last_seen:
+        count_event(user_id, {'engagement_seconds': int(now - last_seen)}, now)
+
+
+def _fold(counts: dict[tuple[str, date], dict[str, int]]) -> None:
+    """Add the counts to the per-day rows and the totals of the users."""
+    with transaction.atomic():
+        UserDailyStatistic.objects.bulk_create(
+            [UserDailyStatistic(user_id=user_id, day=day) for (user_id, day) in counts], ignore_conflicts=True)
+        totals: dict[str, dict[str, int]] = {}
+        for ((user_id, day), deltas) in counts.items():
+            UserDailyStatistic.objects.filter(user_id=user_id, day=day).update(
+                **{metric: F(metric) + delta for (metric, delta) in deltas.items()})
+            for (metric, delta) in deltas.items():
+                totals.setdefault(user_id, dict.fromkeys(METRICS, 0))[metric] += delta
+        now = timezone.now()
+        for (user_id, deltas) in totals.items():
+            UserStatistic.objects.filter(user_id=user_id).update(
+                updated_at=now, **{metric: F(metric) + delta for (metric, delta) in deltas.items()})
+
+
+def rollup_statistics(now: Optional[float] = None) -> int:
+    """
+    Fold the pending counters into the per-day rows and the totals. A folded
+    value is subtracted from its counter, so increments racing the rollup are
+    kept for the next one. Return the number of counters folded.
+    """
+    options = get_options()
+    namespace = options['NAMESPACE']
+    today = _day(time.time() if now is None else now)
+    keys = list(iterKeys(namespace))
+    folded = 0
+
+    for start in range(0, len(keys), options['BATCH_SIZE']):
+        batch = keys[start:start + options['BATCH_SIZE']]
+        values = {key: value for (key, value) in get_many(batch).items() if value}
+        parsed = {key: key[len(namespace) + 1:].split(':') for key in values}
+        if parsed:
+            # Counters of deleted users have no rows to fold into.
+            users = {str(pk) for pk in User.objects.filter(
+                pk__in={user_id for (day, user_id, metric) in parsed.values()}).values_list('pk', flat=True)}
+            gone = [key for (key, (day, user_id, metric)) in parsed.items() if user_id not in users]
+            delete_many(gone, namespace=namespace)
+            for key in gone:
+                del values[key]
+        counts: dict[tuple[str, date], dict[str, int]] = {}
+        for (key, value) in values.items():
+            (day, user_id, metric) = parsed[key]
+            counts.setdefault((user_id, date.fromisoformat(day)), {})[metric] = value
+        if counts:
+            _fold(counts)
+            with pipeline() as pipe:
+                for (key, value) in values.items():
+                    pipe.incr(key, -value)
+            folded += len(values)
+
+        # Counters of past days receive nothing more once folded.
+        closed = [key for key in batch if key[len(namespace) + 1:].split(':', 1)[0] < today.isoformat()]
+        delete_many(closed, namespace=namespace)
+    return folded
+
+
+def get_statistics(user_id: Any, days: int = 7, today: Optional[date] = None) -> dict[str, Any]:
+    """Return the user's totals, rolling week and per-day rows from the rollups."""
+    options = get_options()
+    today = today or timezone.localdate()
+    week_start = today - timedelta(days=options['WEEK_DAYS'] - 1)
+    since = min(week_start, today - timedelta(days=days - 1))
+
+    statistic = UserStatistic.objects.filter(user_id=user_id).values(*METRICS, 'updated_at').first()
+    daily = list(UserDailyStatistic.objects.filter(user_id=user_id, day__gte=since).order_by('-day').values('day', *METRICS))
+    week = dict.fromkeys(METRICS, 0)
+    for row in daily:
+        if row['day'] >= week_start:
+            for metric in METRICS:
+                week[metric] += row[metric]
+
+    return {
+        'total': {metric: (statistic or {}).get(metric, 0) for metric in METRICS},
+        'week': week,
+        'days': [row for row in daily if row['day'] > today - timedelta(days=days)],
+        'updated_at': (statistic or {}).get('updated_at'),
+    }
+
+
+def get_daily_summary(days: int = 7, today: Optional[date] = None) -> list[dict[str, Any]]:
+    """Return the per-day sums over all users, newest first."""
+    today = today or timezone.localdate()
+    return list(UserDailyStatistic.objects.filter(day__gt=today - timedelta(days=days))
+                .values('day').annotate(users=Count('user'), **{metric: Sum(metric) for metric in METRICS}).order_by('-day'))
@@ -1,7 +1,46 @@
-from django.test import TestCase, RequestFactory
+from base64 import urlsafe_b64encode
+from datetime import timedelta
+from io import StringIO
+import asyncio
+import csv
+import gzip
+import os
+import tempfile
+import threading
+from urllib.parse import parse_qsl, urlsplit
+import time
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from asgiref.sync import sync_to_async
+from django.test import AsyncClient, AsyncRequestFactory, TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.utils import timezone
+from unittest import mock, skipIf
+from rest_framework.test import force_authenticate
 
 from .views import *
+from authorization.tokens import issue_tokens
 from authorization.views import *
+from researchdt.aio import aget
+from researchdt.cache import get_many, getKey, iterKeys, registerKey
+from .utils import reset_code_key
+from .bulk import register_users
+from .email_filter import email_may_exist, needs_rebuild, rebuild_email_filter, remember_emails, reset_email_filter
+from .engagement import EngagementFlusher, _recent, flush_engagement, record_engagement, reset_engagement
+from .middleware import EngagementMiddleware
+from .renderers import UserJSONRenderer
+from .models import OutboxEvent, UserActivity, UserDailyStatistic, UserSettings, UserStatistic
+from .outbox import purge_events, relay_once
+from .publisher import LocalTransport
+from .research import get_research_group_id, reset_research_group_cache
+from . import snapshot
+from .snapshot import changed_users
+from .statistics import _registered, record_activity, record_login, rollup_statistics
 import json
 
 token = ""
@@ -42,3 +81,820 @@ class ResearchTests(TestCase):
             rendered_content = json.loads(response.rendered_content)
             token = rendered_content['tokens']['access']  
  
+
+
+def create_user(email="member@a.com", is_research=False):
+    serializer = UserSerializer(data={
+        "email": email,
+        "password": "jasdjasjd2!",
+        "is_research": is_research,
+        "info": {"name": "Member", "age": 30, "gender": "male"},
+        "settings": {"locale": "en"},
+        "system_info": {"os": "ios"},
+    })
+    serializer.is_valid(raise_exception=True)
+    return serializer.save()
+
+
+class ResearchMembershipTests(TestCase):
+
+    def setUp(self) -> None:
+        reset_research_group_cache()
+
+    def test_retrieve_reports_is_research_without_extra_queries(self):
+        user = create_user(is_research=True)
+        request = RequestFactory().get('api/v1/users/%s' % user.pk)
+        force_authenticate(request, user=user)
+
+        # One query for the user with its one-to-one rows, one for its groups.
+        with self.assertNumQueries(2):
+            response = RetrieveUpdateUserAPIView.as_view()(request, pk=user.pk)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_research'])
+
+    def test_natural_key_lookup_annotates_membership(self):
+        create_user(is_research=True)
+        user = User.objects.get_by_natural_key("member@a.com")
+
+        with self.assertNumQueries(0):
+            self.assertTrue(user.is_research())
+            self.assertEqual(user.info.name, "Member")
+
+    def test_membership_is_refreshed_when_groups_change(self):
+        user = create_user(is_research=False)
+        self.assertFalse(user.is_research())
+
+        user.groups.add(get_research_group_id(create=True))
+        self.assertTrue(user.is_research())
+
+        user.groups.clear()
+        self.assertFalse(user.is_research())
+
+
+class ProfileCacheTests(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        reset_research_group_cache()
+        self.user = create_user()
+
+    def retrieve(self):
+        request = RequestFactory().get('api/v1/users/%s' % self.user.pk)
+        force_authenticate(request, user=self.user)
+        response = RetrieveUpdateUserAPIView.as_view()(request, pk=self.user.pk)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_repeated_retrieve_is_served_from_cache(self):
+        first = self.retrieve()
+        self.assertTrue(first['ETag'])
+        self.assertIn('Last-Modified', first)
+
+        with self.assertNumQueries(0):
+            second = self.retrieve()
+
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.data, first.data)
+
+    def test_related_row_change_invalidates_profile(self):
+        first = self.retrieve()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.settings.locale = "ua"
+            self.user.settings.save()
+
+        second = self.retrieve()
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.data['settings']['locale'], "ua")
+
+    def test_group_change_invalidates_profile(self):
+        self.assertFalse(self.retrieve().data['is_research'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.add(get_research_group_id(create=True))
+
+        self.assertTrue(self.retrieve().data['is_research'])
+
+
+class ConditionalRequestTests(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = create_user()
+
+    def call(self, method, data=None, **headers):
+        request = getattr(RequestFactory(), method)(
+            'api/v1/users/%s' % self.user.pk, data, content_type="application/json", **headers)
+        force_authenticate(request, user=self.user)
+        return RetrieveUpdateUserAPIView.as_view()(request, pk=self.user.pk)
+
+    def test_current_etag_is_not_modified_without_queries(self):
+        etag = self.call('get')['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.call('get', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_patch_requires_matching_etag(self):
+        etag = self.call('get')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.call('patch', {"settings": {"locale": "ua"}}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.call('patch', {"settings": {"locale": "de"}}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.user.settings.refresh_from_db()
+        self.assertEqual(self.user.settings.locale, "ua")
+
+        response = self.call('get', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class MinimalWriteTests(TestCase):
+
+    def setUp(self) -> None:
+        reset_research_group_cache()
+        self.user = create_user()
+
+    def patch(self, data):
+        request = RequestFactory().patch('api/v1/users/%s' % self.user.pk, data, content_type="application/json")
+        force_authenticate(request, user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = RetrieveUpdateUserAPIView.as_view()(request, pk=self.user.pk)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries.captured_queries if query['sql'].startswith(('UPDATE', 'INSERT'))]
+
+    def test_settings_change_is_one_single_column_update(self):
+        writes = self.patch({"settings": {"fcm_token": "token"}})
+
+        self.assertEqual(len(writes), 1)
+        self.assertIn('"user_usersettings"', writes[0])
+        self.assertIn('"fcm_token"', writes[0])
+        self.assertNotIn('"locale"', writes[0])
+        self.assertEqual(UserSettings.objects.get(user=self.user).fcm_token, "token")
+
+    def test_unchanged_values_are_not_written(self):
+        writes = self.patch({"is_research": False, "info": {"name": "Member"}, "settings": {"locale": "en"}})
+
+        self.assertEqual(writes, [])
+
+    def test_user_change_refreshes_updated_at_only_with_changed_columns(self):
+        updated_at = self.user.updated_at
+        writes = self.patch({"email": "renamed@a.com"})
+
+        self.assertEqual(len(writes), 1)
+        self.assertIn('"email"', writes[0])
+        self.assertNotIn('"password"', writes[0])
+        self.assertGreater(User.objects.get(pk=self.user.pk).updated_at, updated_at)
+
+
+class EngagementTests(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        reset_engagement()
+        self.user = create_user()
+
+    def tearDown(self) -> None:
+        reset_engagement()
+
+    def test_flusher_logs_failures(self):
+        flusher = EngagementFlusher(interval=0.01, lock_key='engagement-test-lock')
+        failed = threading.Event()
+
+        def flush_once():
+            failed.set()
+            raise RuntimeError("cache is down")
+
+        with mock.patch.object(flusher, 'flush_once', side_effect=flush_once), \
+                self.assertLogs('user.engagement', 'ERROR') as logs:
+            flusher.ensure_started()
+            self.assertTrue(failed.wait(5))
+            flusher.stop(5)
+        self.assertEqual(str(logs.records[0].exc_info[1]), "cache is down")
+
+    def test_middleware_buffers_engagement_without_queries(self):
+        request = RequestFactory().get('api/v1/users/%s' % self.user.pk)
+        request.user = self.user
+        middleware = EngagementMiddleware(lambda request: HttpResponse())
+
+        with self.assertNumQueries(0):
+            middleware(request)
+            middleware(request)
+
+        self.assertEqual(len(list(iterKeys('engagement'))), 1)
+        self.assertIsNone(UserActivity.objects.get(user=self.user).last_engagement)
+
+    def test_flush_writes_closed_windows_in_one_update(self):
+        other = create_user("other@a.com")
+        now = time.time()
+        record_engagement(self.user.pk, now=now - 60)
+        record_engagement(other.pk, now=now - 60)
+        _recent.clear()
+        record_engagement(self.user.pk, now=now)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(flush_engagement(now=now), 2)
+
+        activity = UserActivity.objects.get(user=self.user)
+        self.assertAlmostEqual(activity.last_engagement.timestamp(), now - 60, places=3)
+        # The record of the open window waits for the next flush.
+        self.assertEqual(len(list(iterKeys('engagement'))), 1)
+
+        call_command('flush_engagement', stdout=StringIO())
+        activity.refresh_from_db()
+        self.assertAlmostEqual(activity.last_engagement.timestamp(), now, places=3)
+        self.assertEqual(list(iterKeys('engagement')), [])
+
+    def test_flush_never_moves_engagement_back(self):
+        now = time.time()
+        record_engagement(self.user.pk, now=now)
+        flush_engagement(force=True)
+        _recent.clear()
+        record_engagement(self.user.pk, now=now - 600)
+        flush_engagement(force=True)
+
+        activity = UserActivity.objects.get(user=self.user)
+        self.assertAlmostEqual(activity.last_engagement.timestamp(), now, places=3)
+
+    def test_many_users_register_the_window_once(self):
+        users = [self.user] + User.objects.bulk_create([User(email='user%d@a.com' % number) for number in range(300)])
+        UserActivity.objects.bulk_create([UserActivity(user=user) for user in users[1:]])
+        now = time.time() - 60
+
+        with mock.patch('user.engagement.registerKey', wraps=registerKey) as register:
+            for user in users:
+                record_engagement(user.pk, now=now)
+        register.assert_called_once()
+
+        with override_settings(ENGAGEMENT={'BATCH_SIZE': 100}), self.assertNumQueries(4):
+            self.assertEqual(flush_engagement(), len(users))
+        self.assertEqual(UserActivity.objects.filter(last_engagement__isnull=False).count(), len(users))
+        self.assertEqual(list(iterKeys('engagement')), [])
+
+
+class StatisticsTests(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        _registered.clear()
+        self.user = create_user()
+
+    def test_events_are_counted_and_rolled_up_per_day(self):
+        now = time.time()
+        record_login(self.user.pk, now=now)
+        record_activity(self.user.pk, now=now)
+        record_activity(self.user.pk, now=now + 120)
+        record_activity(self.user.pk, now=now + 120 + 31 * 60)
+        record_login(self.user.pk, now=now - 2 * 24 * 60 * 60)
+
+        self.assertEqual(rollup_statistics(now=now), 4)
+
+        statistic = UserStatistic.objects.get(user=self.user)
+        self.assertEqual((statistic.sessions, statistic.logins, statistic.engagement_seconds), (2, 2, 120))
+        self.assertEqual(UserDailyStatistic.objects.filter(user=self.user).count(), 2)
+        # Counters of the past day are gone, today's wait at zero for new events.
+        self.assertEqual(rollup_statistics(now=now), 0)
+        self.assertEqual(len(list(iterKeys('stats'))), 3)
+
+        record_login(self.user.pk, now=now)
+        rollup_statistics(now=now)
+        statistic.refresh_from_db()
+        self.assertEqual(statistic.logins, 3)
+
+    def test_counters_of_deleted_users_are_dropped(self):
+        other = create_user("other@a.com")
+        record_login(self.user.pk)
+        record_login(other.pk)
+        other_id = str(other.pk)
+        other.delete()
+
+        self.assertEqual(rollup_statistics(), 1)
+        self.assertEqual(UserStatistic.objects.get(user=self.user).logins, 1)
+        self.assertEqual([key for key in iterKeys('stats') if other_id in key], [])
+        self.assertEqual(rollup_statistics(), 0)
+
+    def test_statistics_are_served_from_rollups(self):
+        record_login(self.user.pk)
+        call_command('rollup_statistics', '--once', stdout=StringIO())
+
+        request = RequestFactory().get('api/v1/users/%s/statistics' % self.user.pk, {"days": 3})
+        force_authenticate(request, user=self.user)
+        with self.assertNumQueries(2):
+            response = UserStatisticAPIView.as_view()(request, pk=self.user.pk)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total']['logins'], 1)
+        self.assertEqual(response.data['week']['logins'], 1)
+        self.assertEqual(len(response.data['days']), 1)
+
+        request = RequestFactory().get('api/v1/users/statistics')
+        force_authenticate(request, user=self.user)
+        self.assertEqual(StatisticSummaryAPIView.as_view()(request).status_code, 403)
+
+        self.user.is_staff = True
+        response = StatisticSummaryAPIView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['users'], 1)
+        self.assertEqual(response.data[0]['logins'], 1)
+
+
+class UserListTests(TestCase):
+
+    def setUp(self) -> None:
+        reset_research_group_cache()
+        self.admin = User.objects.create_superuser("admin@a.com", "jasdjasjd2!")
+        self.users = [create_user("member%d@a.com" % number, is_research=number % 2 == 0) for number in range(5)]
+
+    def list(self, user=None, **params):
+        request = RequestFactory().get('/api/v1/users', params)
+        force_authenticate(request, user=user or self.admin)
+        return RegistrationUserAPIView.as_view()(request)
+
+    def test_pages_follow_the_keyset_with_constant_queries(self):
+        seen = []
+        params = {"page_size": 2}
+        while True:
+            # The page with its one-to-one rows, then the groups of the page.
+            with self.assertNumQueries(2):
+                response = self.list(**params)
+            self.assertEqual(response.status_code, 200)
+            seen += [user['email'] for user in response.data['results']]
+            if response.data['next'] is None:
+                break
+            params = dict(parse_qsl(urlsplit(response.data['next']).query))
+
+        self.assertEqual(seen, ["admin@a.com"] + [user.email for user in self.users])
+
+    def test_filters_over_profile_rows_and_membership(self):
+        response = self.list(is_research="true", os="ios", gender="male", age_min=18, age_max=40, locale="en")
+
+        self.assertEqual([user['email'] for user in response.data['results']],
+                         ["member0@a.com", "member2@a.com", "member4@a.com"])
+        self.assertTrue(all(user['is_research'] for user in response.data['results']))
+
+    def test_listing_is_staff_only(self):
+        self.assertEqual(self.list(user=self.users[0]).status_code, 403)
+        self.assertEqual(self.list(cursor="broken").status_code, 404)
+        not_a_uuid = urlsafe_b64encode(b'2020-01-01T00:00:00|not-a-uuid').decode()
+        self.assertEqual(self.list(cursor=not_a_uuid).status_code, 404)
+
+
+class UserExportTests(TestCase):
+
+    def setUp(self) -> None:
+        reset_research_group_cache()
+        self.admin = User.objects.create_superuser("admin@a.com", "jasdjasjd2!")
+        self.users = [create_user("member%d@a.com" % number, is_research=number % 2 == 0) for number in range(3)]
+
+    def export(self, **params):
+        request = RequestFactory().get('/api/v1/users/export', params)
+        force_authenticate(request, user=self.admin)
+        response = UserExportAPIView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_ndjson_export_of_research_cohort(self):
+        response, content = self.export(research_only="true")
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual([row['email'] for row in rows], ["member0@a.com", "member2@a.com"])
+        self.assertEqual(rows[0]['gender'], "male")
+        self.assertEqual(rows[0]['os'], "ios")
+        self.assertTrue(rows[0]['is_research'])
+
+    def test_gzipped_csv_export(self):
+        response, content = self.export(output="csv", gzip="true")
+
+        self.assertIn('users.csv.gz', response['Content-Disposition'])
+        rows = list(csv.DictReader(StringIO(gzip.decompress(content).decode())))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0]['email'], "admin@a.com")
+        self.assertEqual(rows[0]['age'], "")
+        self.assertEqual(rows[1]['locale'], "en")
+
+    def test_command_writes_export_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'users.ndjson')
+            call_command('export_users', path, stderr=StringIO())
+            with open(path, encoding='utf-8') as export:
+                self.assertEqual(len(export.readlines()), 4)
+
+    def test_export_is_staff_only(self):
+        request = RequestFactory().get('/api/v1/users/export')
+        force_authenticate(request, user=self.users[0])
+        self.assertEqual(UserExportAPIView.as_view()(request).status_code, 403)
+
+
+class UserExportASGITests(TransactionTestCase):
+    # The rows are read by another thread, they have to be committed.
+
+    def setUp(self) -> None:
+        cache.clear()
+        reset_research_group_cache()
+        self.admin = User.objects.create_superuser("admin@a.com", "jasdjasjd2!")
+        create_user("member@a.com")
+
+    async def test_export_streams_under_asgi(self):
+        access = (await sync_to_async(issue_tokens)(self.admin))['access']
+
+        response = await AsyncClient().get('/api/v1/users/export', {'output': 'csv'},
+                                           authorization='Bearer %s' % access)
+
+        self.assertEqual(response.status_code, 200)
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['email'] for row in rows], ["admin@a.com", "member@a.com"])
+
+
+class SnapshotTests(TestCase):
+
+    def setUp(self) -> None:
+        reset_research_group_cache()
+        self.users = [create_user("member%d@a.com" % number) for number in range(3)]
+
+    def test_changed_users_follow_profile_row_changes(self):
+        watermark = timezone.now()
+        self.assertEqual(list(changed_users(watermark)), [])
+
+        settings = self.users[1].settings
+        settings.fcm_token = "token"
+        settings.save_dirty()
+
+        self.assertEqual([row[1] for row in changed_users(watermark)], ["member1@a.com"])
+        self.assertEqual(changed_users().count(), 3)
+
+    @skipIf(connection.vendor != 'sqlite', "reads SQLite's query plan")
+    def test_changed_users_read_the_updated_at_indexes(self):
+        plan = changed_users(timezone.now()).explain()
+
+        self.assertNotIn('SCAN user_', plan)
+        for table in ('user_user', 'user_userinfo', 'user_usersettings', 'user_usersysteminfo'):
+            self.assertRegex(plan, r'SEARCH %s USING INDEX \w+updated_at' % table)
+
+    @skipIf(snapshot.pyarrow is not None, "pyarrow is installed")
+    def test_snapshot_requires_pyarrow(self):
+        with self.assertRaises(CommandError):
+            call_command('snapshot_users', stdout=StringIO())
+
+    @skipIf(snapshot.pyarrow is None, "pyarrow is not installed")
+    def test_snapshot_appends_changed_users(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(SNAPSHOTS={'LAG': 0}):
+            first = snapshot.write_snapshot(directory)
+            self.assertEqual(first['rows'], 3)
+            self.assertIsNone(snapshot.write_snapshot(directory))
+
+            info = self.users[0].info
+            info.age = 31
+            info.save_dirty()
+            second = snapshot.write_snapshot(directory)
+            self.assertEqual(second['rows'], 1)
+
+            manifest = snapshot.read_manifest(directory)
+            self.assertEqual([entry['path'] for entry in manifest['files']], [first['path'], second['path']])
+            table = snapshot.pyarrow.parquet.read_table(os.path.join(directory, second['path']))
+            self.assertEqual(table.column('age').to_pylist(), [31])
+            self.assertTrue(snapshot.pyarrow.types.is_dictionary(table.schema.field('gender').type))
+
+
+class EmailNormalizationTests(TestCase):
+
+    def test_emails_are_stored_and_looked_up_lowercase(self):
+        user = create_user(" Mixed@Case.COM")
+        self.assertEqual(user.email, "mixed@case.com")
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(authenticate(username="MIXED@case.com", password="jasdjasjd2!"), user)
+        self.assertIn('LOWER(', queries.captured_queries[0]['sql'])
+
+        serializer = UserSerializer(data={"email": "mixed@CASE.com"})
+        serializer.is_valid()
+        self.assertIn('email', serializer.errors)
+
+    def test_lowercase_index_rejects_case_variants(self):
+        create_user("member@a.com")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.bulk_create([User(email="Member@A.com")])
+
+
+class EmailFilterTests(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        reset_email_filter()
+        create_user("member@a.com")
+        rebuild_email_filter()
+
+    def tearDown(self) -> None:
+        cache.clear()
+        reset_email_filter()
+
+    def test_new_email_skips_the_existence_query(self):
+        self.assertTrue(email_may_exist("Member@a.com"))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(UserSerializer().validate_email("new@a.com"), "new@a.com")
+        with self.assertRaises(serializers.ValidationError):
+            UserSerializer().validate_email("member@a.com")
+
+    def test_created_and_bulk_emails_are_shared_until_the_next_rebuild(self):
+        create_user("created@a.com")
+        reset_email_filter()
+        self.assertTrue(email_may_exist("created@a.com"))
+
+        remember_emails(["bulk@a.com"])
+        reset_email_filter()
+        self.assertTrue(email_may_exist("bulk@a.com"))
+
+    def test_sync_fetches_only_emails_added_since_the_last_one(self):
+        email_may_exist("new@a.com")
+        remember_emails(["one@a.com", "two@a.com"])
+
+        with override_settings(EMAIL_FILTER={'SYNC_INTERVAL': 0}), \
+                mock.patch('user.email_filter.get_many', wraps=get_many) as fetch:
+            self.assertTrue(email_may_exist("two@a.com"))
+            self.assertTrue(email_may_exist("one@a.com"))
+        self.assertEqual(sum(len(call.args[0]) for call in fetch.call_args_list), 2)
+
+    def test_unique_index_rejects_email_the_filter_missed(self):
+        # As if another worker registered it since this one synced.
+        User.objects.filter(email="member@a.com").update(email="other@a.com")
+        cache.clear()
+        rebuild_email_filter()
+        User.objects.filter(email="other@a.com").update(email="member@a.com")
+
+        serializer = UserSerializer(data={
+            "email": "member@a.com",
+            "password": "jasdjasjd2!",
+            "is_research": False,
+            "info": {"name": "Member", "age": 30, "gender": "male"},
+            "settings": {"locale": "en"},
+            "system_info": {"os": "ios"},
+        })
+        serializer.is_valid(raise_exception=True)
+        with self.assertRaises(serializers.ValidationError) as error:
+            serializer.save()
+        self.assertIn('email', error.exception.detail)
+
+    def test_deletions_trigger_an_early_rebuild(self):
+        self.assertFalse(needs_rebuild())
+        with override_settings(EMAIL_FILTER={'DELETIONS_REBUILD': 1}):
+            User.objects.get(email="member@a.com").delete()
+            self.assertTrue(needs_rebuild())
+            call_command('rebuild_email_filter', '--once', stdout=StringIO())
+            self.assertFalse(needs_rebuild())
+
+
+class BulkRegistrationTests(TestCase):
+
+    def setUp(self) -> None:
+        reset_research_group_cache()
+        self.admin = User.objects.create_superuser("admin@a.com", "jasdjasjd2!")
+
+    def payload(self, email, is_research=False):
+        return {
+            "email": email,
+            "password": "jasdjasjd2!",
+            "is_research": is_research,
+            "info": {"name": "Cohort", "age": 40, "gender": "female"},
+            "settings": {"locale": "ua"},
+            "system_info": {"os": "android"},
+        }
+
+    def test_bulk_register_reports_rows(self):
+        create_user("taken@a.com")
+        userdata = [
+            self.payload("one@a.com", is_research=True),
+            self.payload("TAKEN@a.com"),
+            {"email": "broken"},
+            self.payload("two@a.com"),
+            self.payload("one@a.com"),
+        ]
+
+        request = RequestFactory().post('api/v1/users/bulk', userdata, content_type="application/json")
+        force_authenticate(request, user=self.admin)
+        response = BulkRegistrationUserAPIView.as_view()(request)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([row['index'] for row in response.data['created']], [0, 3])
+        self.assertEqual([row['index'] for row in response.data['errors']], [1, 2, 4])
+        self.assertEqual(response.data['errors'][0]['fields']['email']['code'], 'email_exist')
+        self.assertEqual(response.data['errors'][1]['fields']['info']['code'], 'required')
+
+        one = User.objects.select_related("info", "settings", "system_info", "activity", "statistic").get(email="one@a.com")
+        self.assertTrue(one.is_research())
+        self.assertTrue(one.check_password("jasdjasjd2!"))
+        self.assertEqual(one.info.name, "Cohort")
+        self.assertFalse(User.objects.get(email="two@a.com").is_research())
+
+    def test_email_registered_during_the_batch_is_a_row_error(self):
+        def make_passwords(passwords):
+            # Another request registers the same email before the insert.
+            create_user("race@a.com")
+            return [PBKDF2PasswordHasher().encode(password, "salt", 1000) for password in passwords]
+
+        with mock.patch('user.bulk.make_passwords', side_effect=make_passwords):
+            created, errors = register_users([self.payload("one@a.com"), self.payload("race@a.com")])
+
+        self.assertEqual([row['index'] for row in created], [0])
+        self.assertEqual([(error['index'], error['fields']['email']['code']) for error in errors], [(1, 'email_exist')])
+        self.assertEqual(User.objects.get(email="one@a.com").info.name, "Cohort")
+        self.assertEqual(User.objects.filter(email="race@a.com").count(), 1)
+
+    def test_bulk_register_requires_staff(self):
+        user = create_user()
+        request = RequestFactory().post('api/v1/users/bulk', [self.payload("one@a.com")], content_type="application/json")
+        force_authenticate(request, user=user)
+        response = BulkRegistrationUserAPIView.as_view()(request)
+        self.assertEqual(response.status_code, 403)
+
+
+class BrokenTransport:
+
+    def __init__(self, options):
+        pass
+
+    def publish_batch(self, bodies):
+        raise ConnectionError("broker is down")
+
+    def close(self):
+        pass
+
+
+@override_settings(RABBITMQ={'TRANSPORT': 'user.publisher.LocalTransport', 'QUEUE': 'test.email'})
+class OutboxTests(TestCase):
+
+    def setUp(self) -> None:
+        LocalTransport.queues.clear()
+
+    def request_code(self, email):
+        request = RequestFactory().post('api/v1/users/forgot-password', {"email": email}, content_type="application/json")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = RequestPasswordResetEmail.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+
+    def test_forgot_password_writes_event_and_relay_delivers_it(self):
+        create_user("forgot@a.com")
+        self.request_code("forgot@a.com")
+
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.payload['code'], getKey(reset_code_key("forgot@a.com")))
+
+        self.assertEqual(relay_once(), (1, 0))
+        message = json.loads(LocalTransport.queues['email.send'][0])
+        self.assertEqual(message, event.payload)
+        self.assertEqual(OutboxEvent.objects.get().status, OutboxEvent.StatusChoices.delivered)
+        self.assertEqual(OutboxEvent.objects.get().payload, {})
+        self.assertEqual(relay_once(), (0, 0))
+
+    def test_purge_drops_old_delivered_and_failed_events(self):
+        statuses = OutboxEvent.StatusChoices
+        old = [OutboxEvent.objects.create(topic='email.send', payload={}, status=status)
+               for status in (statuses.delivered, statuses.failed, statuses.pending)]
+        OutboxEvent.objects.filter(pk__in=[event.pk for event in old]).update(
+            created_at=timezone.now() - timedelta(days=8))
+        recent = OutboxEvent.objects.create(topic='email.send', payload={}, status=statuses.delivered)
+
+        self.assertEqual(purge_events(retention_days=7), 2)
+        self.assertEqual(set(OutboxEvent.objects.values_list('pk', flat=True)), {old[2].pk, recent.pk})
+
+    @override_settings(RABBITMQ={'TRANSPORT': 'user.tests.BrokenTransport'})
+    def test_relay_backs_off_failed_events(self):
+        create_user("forgot@a.com")
+        self.request_code("forgot@a.com")
+
+        self.assertEqual(relay_once(), (0, 1))
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.attempts, 1)
+        self.assertEqual(event.status, OutboxEvent.StatusChoices.pending)
+        self.assertGreater(event.available_at, event.created_at)
+        # Not due again until the backoff has passed.
+        self.assertEqual(relay_once(), (0, 0))
+
+
+class AsyncViewTests(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        reset_email_filter()
+        reset_research_group_cache()
+        self.user = create_user()
+
+    def test_async_views_are_coroutines(self):
+        view = AsyncRetrieveUpdateUserAPIView.as_view()
+        self.assertTrue(asyncio.iscoroutinefunction(view))
+        self.assertTrue(view.csrf_exempt)
+        self.assertIs(view.cls, AsyncRetrieveUpdateUserAPIView)
+        self.assertEqual(AsyncRetrieveUpdateUserAPIView.get._swagger_auto_schema['operation_id'], 'Get user')
+
+    async def test_registration(self):
+        payload = {
+            "email": "Async@a.com",
+            "password": "jasdjasjd2!",
+            "is_research": True,
+            "info": {"name": "Async", "age": 30, "gender": "male"},
+            "settings": {"locale": "en"},
+            "system_info": {"os": "ios"},
+        }
+        view = AsyncRegistrationUserAPIView.as_view()
+        response = await view(AsyncRequestFactory().post('api/v1/users', payload, content_type="application/json"))
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['is_research'])
+        self.assertIn('access', response.data['tokens'])
+
+        user = await aget(User.objects.by_email("async@a.com"))
+        self.assertTrue(await sync_to_async(user.check_password)("jasdjasjd2!"))
+
+        response = await view(AsyncRequestFactory().post('api/v1/users', payload, content_type="application/json"))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error']['fields']['email']['message'], 'Email is exist')
+
+    async def test_registration_checks_the_email_off_the_event_loop(self):
+        def email_may_exist(email):
+            with self.assertRaises(RuntimeError):
+                asyncio.get_running_loop()
+            return True
+
+        payload = {
+            "email": "member@a.com",
+            "password": "jasdjasjd2!",
+            "is_research": False,
+            "info": {"name": "Async", "age": 30, "gender": "male"},
+            "settings": {"locale": "en"},
+            "system_info": {"os": "ios"},
+        }
+        with mock.patch('user.views.email_may_exist', side_effect=email_may_exist) as check:
+            response = await AsyncRegistrationUserAPIView.as_view()(
+                AsyncRequestFactory().post('api/v1/users', payload, content_type="application/json"))
+        self.assertEqual(response.status_code, 400)
+        check.assert_called_once_with("member@a.com")
+
+    async def test_profile_get_and_patch(self):
+        view = AsyncRetrieveUpdateUserAPIView.as_view()
+        request = AsyncRequestFactory().get('api/v1/users/%s' % self.user.pk)
+        force_authenticate(request, user=self.user)
+        response = await view(request, pk=self.user.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['info']['name'], 'Member')
+
+        request = AsyncRequestFactory().patch(
+            'api/v1/users/%s' % self.user.pk, {"info": {"name": "Renamed"}}, content_type="application/json",
+            HTTP_IF_MATCH=response['ETag'])
+        force_authenticate(request, user=self.user)
+        response = await view(request, pk=self.user.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['info']['name'], 'Renamed')
+
+    async def test_profile_of_another_user_is_forbidden(self):
+        other = await sync_to_async(create_user)("other@a.com")
+        request = AsyncRequestFactory().get('api/v1/users/%s' % other.pk)
+        force_authenticate(request, user=self.user)
+        response = await AsyncRetrieveUpdateUserAPIView.as_view()(request, pk=other.pk)
+        self.assertEqual(response.status_code, 403)
+
+    async def test_forgot_password(self):
+        view = AsyncRequestPasswordResetEmail.as_view()
+        response = await view(AsyncRequestFactory().post(
+            'api/v1/users/forgot-password', {"email": "Member@a.com"}, content_type="application/json"))
+        self.assertEqual(response.status_code, 200)
+
+        event = await aget(OutboxEvent.objects.all())
+        self.assertEqual(event.payload['to'], "member@a.com")
+        self.assertEqual(event.payload['code'], getKey(reset_code_key("member@a.com")))
+
+        response = await view(AsyncRequestFactory().post(
+            'api/v1/users/forgot-password', {"email": "nobody@a.com"}, content_type="application/json"))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error']['fields']['email']['code'], 'email_is_not_exist')
+
+    async def test_middleware_records_engagement_of_async_views(self):
+        reset_engagement()
+        request = AsyncRequestFactory().get('api/v1/users/%s' % self.user.pk)
+        request.user = self.user
+
+        async def get_response(request):
+            return HttpResponse()
+
+        middleware = EngagementMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        await middleware(request)
+        self.assertEqual(len(list(iterKeys('engagement'))), 1)
+        reset_engagement()
+
+
+class UserJSONRendererTests(TestCase):
+
+    def test_namespaces_the_user(self):
+        renderer = UserJSONRenderer()
+
+        self.assertEqual(json.loads(renderer.render({'email': 'a@a.com', 'token': b'abc'})),
+                         {'user': {'email': 'a@a.com', 'token': 'abc'}})
+        self.assertEqual(json.loads(renderer.render({'errors': {'email': ['Invalid.']}})),
+                         {'errors': {'email': ['Invalid.']}})
+        self.assertEqual(renderer.render(None), b'')
@@ -1,19 +1,41 @@
+from django.conf import settings
 from django.urls import path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 from .views import (
+    AsyncRegistrationUserAPIView,
+    AsyncRequestPasswordResetEmail,
+    AsyncRetrieveUpdateUserAPIView,
+    BulkRegistrationUserAPIView,
     PasswordTokenCheckAPI,
     RegistrationUserAPIView,
     RequestPasswordResetEmail,
-    RetrieveUpdateUserAPIView
+    RetrieveUpdateUserAPIView,
+    StatisticSummaryAPIView,
+    UserExportAPIView,
+    UserStatisticAPIView
 )
 
 #app_name = 'user'
 
+# ASYNC_VIEWS serves the hot endpoints from coroutines, see researchdt/asgi.py
+if settings.ASYNC_VIEWS:
+    RegistrationView = AsyncRegistrationUserAPIView
+    UserView = AsyncRetrieveUpdateUserAPIView
+    PasswordResetView = AsyncRequestPasswordResetEmail
+else:
+    RegistrationView = RegistrationUserAPIView
+    UserView = RetrieveUpdateUserAPIView
+    PasswordResetView = RequestPasswordResetEmail
+
 urlpatterns = [
     #path('0/', RegistrationAPIView.as_view(), name='register_user'),
-    path('', RegistrationUserAPIView.as_view(), name='get_user'),
-    path('/<uuid:pk>', RetrieveUpdateUserAPIView.as_view(), name='retrieve_update_user'),
-    path('/forgot-password', RequestPasswordResetEmail.as_view(), name='forgot_password'),
+    path('', RegistrationView.as_view(), name='get_user'),
+    path('/bulk', BulkRegistrationUserAPIView.as_view(), name='bulk_register_users'),
+    path('/statistics', StatisticSummaryAPIView.as_view(), name='statistics_summary'),
+    path('/export', UserExportAPIView.as_view(), name='export_users'),
+    path('/<uuid:pk>', UserView.as_view(), name='retrieve_update_user'),
+    path('/<uuid:pk>/statistics', UserStatisticAPIView.as_view(), name='user_statistics'),
+    path('/forgot-password', PasswordResetView.as_view(), name='forgot_password'),
     path('/forgot-password/set', PasswordTokenCheckAPI.as_view(), name='forgot_password_confirm'),
 ]
\ No newline at end of file
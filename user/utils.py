@@ -3,6 +3,8 @@ import string
 from django.core.exceptions import ValidationError
 from django.core.validators import validate_email as django_validate_email
 
+RESET_CODE_NAMESPACE = 'reset_code'
+
 
 def validate_email(value: str) -> tuple[bool, str]:
     """Validate a single email."""
@@ -18,5 +20,14 @@ def validate_email(value: str) -> tuple[bool, str]:
 
     return True, ''
 
+def canonical_email(value: str) -> str:
+    """The stored form of an email, lookups compare against it."""
+    return value.strip().lower()
+
 def id_generator(size=6, chars=string.ascii_uppercase + string.digits):
     return ''.join(random.choice(chars) for _ in range(size))
+
+
+def reset_code_key(email: str) -> str:
+    """Cache key of the password reset code sent to the email."""
+    return '%s:%s' % (RESET_CODE_NAMESPACE, email)
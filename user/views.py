@@ -6,37 +6,85 @@ from django.shortcuts import get_object_or_404, render
 from typing import Any, Optional
 
 from rest_framework import status
-from rest_framework.generics import RetrieveUpdateAPIView, CreateAPIView
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.generics import GenericAPIView, ListCreateAPIView, RetrieveUpdateAPIView, CreateAPIView
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.request import Request
 from rest_framework.response import Response
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from django.utils.encoding import smart_bytes
+from django.utils.http import http_date
+from django.db import transaction
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 
 from rest_framework import serializers, exceptions
-from user.publisher import publish_email
+from asgiref.sync import sync_to_async
+from user.outbox import aenqueue_event, enqueue_event
 
-from user.utils import id_generator
+from user.utils import RESET_CODE_NAMESPACE, id_generator, reset_code_key
+from researchdt.aio import AsyncAPIViewMixin, aexists, iterate_in_thread
 from researchdt.cache import setKey
+from researchdt.passwords import amake_password
 
+from .bulk import BulkUserSerializer, register_users
+from .email_filter import email_may_exist
+from .export import EXPORT_FORMATS, export_filename, export_stream
+from .filters import UserFilter
+from .mixins import ConditionalUserMixin
+from .pagination import UserPagination
 from .permissions import IsOwnerUserObject
+from .profile_cache import get_profile
+from .statistics import get_daily_summary, get_statistics
 from .models import User
 from .serializers import (
     SetNewPasswordByCodeSerializer,
     UserSerializer,
     RetrieveUpdateUserSerializer,
-    ResetPasswordEmailRequestSerializer
+    ResetPasswordEmailRequestSerializer,
+    DailySummarySerializer,
+    ExportQuerySerializer,
+    StatisticQuerySerializer,
+    UserStatisticSerializer
 )
 from drf_yasg.utils import swagger_auto_schema
 from researchdt.swagger import SwaggerResponses
 
-class RegistrationUserAPIView(CreateAPIView):
+class RegistrationUserAPIView(ListCreateAPIView):
     """
-    User registartion
+    User registartion, staff list users
     """
     serializer_class = UserSerializer
     permission_classes = [AllowAny]
-    
+    filterset_class = UserFilter
+    pagination_class = UserPagination
+
+    def get_permissions(self) -> list[Any]:
+        if self.request.method in ('GET', 'HEAD'):
+            return [IsAdminUser()]
+        return super().get_permissions()
+
+    def get_serializer_class(self) -> Any:
+        if self.request is not None and self.request.method in ('GET', 'HEAD'):
+            return RetrieveUpdateUserSerializer
+        return self.serializer_class
+
+    def get_queryset(self) -> Any:
+        return User.objects.with_research().select_related("info", "system_info", "settings").prefetch_related("groups")
+
+    @swagger_auto_schema(
+        operation_id='List users',
+        responses={
+            status.HTTP_200_OK: RetrieveUpdateUserSerializer(many=True),
+            status.HTTP_401_UNAUTHORIZED: SwaggerResponses.get_common_schema('Unathorized', 401, 'bad_credentials'),
+            status.HTTP_403_FORBIDDEN: SwaggerResponses.get_common_schema('Forbidden', 403, 'permission_denied'),
+            status.HTTP_404_NOT_FOUND: SwaggerResponses.get_common_schema('Invalid cursor', 404, 'invalid_cursor'),
+            status.HTTP_500_INTERNAL_SERVER_ERROR: SwaggerResponses.get_common_schema('Internal server error', 500, 'internal_server_error')
+        }
+    )
+    def get(self, request: Request, *args: dict[str, Any], **kwargs: dict[str, Any]) -> Response:
+        """Return a page of users matching the filters, oldest first."""
+        return self.list(request, *args, **kwargs)
+
     @swagger_auto_schema(
         operation_id='Register user',
         security=[],
@@ -60,7 +108,60 @@ class RegistrationUserAPIView(CreateAPIView):
         
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-class RetrieveUpdateUserAPIView(RetrieveUpdateAPIView):
+class AsyncRegistrationUserAPIView(AsyncAPIViewMixin, RegistrationUserAPIView):
+
+    async def post(self, request: Request) -> Response:
+        """Return user response after a successful registration."""
+
+        serializer = self.serializer_class(data=request.data, context={'check_exists': False})
+        serializer.is_valid(raise_exception=True)
+        email = serializer.validated_data['email']
+
+        def email_exists():
+            # The filter reads the cache every SYNC_INTERVAL, the query only
+            # runs for emails it may contain. Both block, so one hop for both.
+            return email_may_exist(email) and User.objects.by_email(email).exists()
+
+        if await sync_to_async(email_exists)():
+            raise serializers.ValidationError({'email': [serializers.ErrorDetail('Email is exist', 'invalid')]})
+        encoded_password = await amake_password(serializer.validated_data['password'])
+
+        def save():
+            serializer.save(encoded_password=encoded_password)
+            return serializer.data
+
+        return Response(await sync_to_async(save)(), status=status.HTTP_201_CREATED)
+
+class BulkRegistrationUserAPIView(CreateAPIView):
+    """
+    Bulk user registration for research cohorts
+    """
+    serializer_class = BulkUserSerializer
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_id='Register users in bulk',
+        request_body=BulkUserSerializer(many=True),
+        responses={
+            status.HTTP_201_CREATED: SwaggerResponses.get_bulk_result_schema('Bulk registration result'),
+            status.HTTP_400_BAD_REQUEST: SwaggerResponses.get_bulk_result_schema('Bulk registration result'),
+            status.HTTP_401_UNAUTHORIZED: SwaggerResponses.get_common_schema('Unathorized', 401, 'bad_credentials'),
+            status.HTTP_403_FORBIDDEN: SwaggerResponses.get_common_schema('Forbidden', 403, 'permission_denied'),
+            status.HTTP_500_INTERNAL_SERVER_ERROR: SwaggerResponses.get_common_schema('Internal server error', 500, 'internal_server_error')
+        }
+    )
+    def post(self, request: Request) -> Response:
+        """Create every valid user of the list, report the invalid ones."""
+
+        if not isinstance(request.data, list):
+            raise serializers.ValidationError({'detail': serializers.ErrorDetail('Expected a list of users.', 'not_a_list')})
+
+        created, errors = register_users(request.data)
+        response_status = status.HTTP_201_CREATED if created or not errors else status.HTTP_400_BAD_REQUEST
+
+        return Response({'created': created, 'errors': errors}, status=response_status)
+
+class RetrieveUpdateUserAPIView(ConditionalUserMixin, RetrieveUpdateAPIView):
     serializer_class = RetrieveUpdateUserSerializer
     permission_classes = [IsAuthenticated, IsOwnerUserObject]
     
@@ -77,17 +178,30 @@ class RetrieveUpdateUserAPIView(RetrieveUpdateAPIView):
     )
     def get(self, request: Request, *args: dict[str, Any], **kwargs: dict[str, Any]) -> Response:
         """Return user on GET request."""
-         
-        try:
-             user = User.objects.select_related("info", "system_info", "settings").get(id=kwargs['pk'])
-             
-        except User.DoesNotExist as e:
-            raise exceptions.NotFound('User not found', 'user_not_found')
-        
-        self.check_object_permissions(self.request, user)
-        serializer = self.serializer_class(user, context={'request': request})
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # Ownership only needs the primary key, the profile may come from cache.
+        self.check_object_permissions(self.request, User(pk=kwargs['pk']))
+        return self.retrieve_profile(request, kwargs['pk'])
+
+    def retrieve_profile(self, request: Request, pk: Any) -> Response:
+        not_modified = self.evaluate_preconditions(request, pk)
+        if not_modified is not None:
+            return not_modified
+
+        def render():
+            try:
+                 user = User.objects.select_related("info", "system_info", "settings").prefetch_related("groups").get(id=pk)
+            except User.DoesNotExist as e:
+                raise exceptions.NotFound('User not found', 'user_not_found')
+            serializer = self.serializer_class(user, context={'request': request})
+            return serializer.data, user.updated_at
+
+        profile = get_profile(pk, render)
+
+        return Response(profile['data'], status=status.HTTP_200_OK, headers={
+            'ETag': profile['etag'],
+            'Last-Modified': http_date(profile['last_modified']),
+        })
 
 
     @swagger_auto_schema(
@@ -98,29 +212,36 @@ class RetrieveUpdateUserAPIView(RetrieveUpdateAPIView):
             status.HTTP_401_UNAUTHORIZED: SwaggerResponses.get_common_schema('Unathorized', 401, 'bad_credentials'),
             status.HTTP_403_FORBIDDEN: SwaggerResponses.get_common_schema('Forbidden', 403, 'permission_denied'),
             status.HTTP_404_NOT_FOUND: SwaggerResponses.get_common_schema('User not found', 404, 'user_not_found'),
+            status.HTTP_412_PRECONDITION_FAILED: SwaggerResponses.get_common_schema('Resource has been modified', 412, 'precondition_failed'),
             status.HTTP_500_INTERNAL_SERVER_ERROR: SwaggerResponses.get_common_schema('Internal server error', 500, 'internal_server_error')
         }
     )
     def patch(self, request: Request, *args: dict[str, Any], **kwargs: dict[str, Any]) -> Response:
         """Return updated user."""
         serializer_data = request.data
-        try:
-             user = User.objects.select_related("info", "system_info", "settings").get(id=kwargs['pk'])
-        except User.DoesNotExist as e:
-            raise exceptions.NotFound('User not found', 'user_not_found')
-        
-        self.check_object_permissions(self.request,user)
-        
-        serializer = self.serializer_class(
-            user, data=serializer_data, partial=True, context={'request': request}
-        )
-        try:
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-        except serializers.ValidationError as e:
-            raise serializers.ValidationError(e.args[0])
-        
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # The row lock keeps If-Match and the write atomic against a concurrent PATCH.
+        with transaction.atomic():
+            try:
+                 user = User.objects.select_for_update(of=("self",)).select_related("info", "system_info", "settings").prefetch_related("groups").get(id=kwargs['pk'])
+            except User.DoesNotExist as e:
+                raise exceptions.NotFound('User not found', 'user_not_found')
+
+            self.check_object_permissions(self.request,user)
+            self.evaluate_preconditions(request, user.pk)
+
+            serializer = self.serializer_class(
+                user, data=serializer_data, partial=True, context={'request': request}
+            )
+            try:
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+            except serializers.ValidationError as e:
+                raise serializers.ValidationError(e.args[0])
+
+        # The stamp is bumped again on commit, an ETag from inside an outer
+        # transaction would already be stale.
+        headers = {} if transaction.get_connection().in_atomic_block else self.get_validator_headers(user.pk)
+        return Response(serializer.data, status=status.HTTP_200_OK, headers=headers)
     
     @swagger_auto_schema(
        auto_schema=None
@@ -128,6 +249,111 @@ class RetrieveUpdateUserAPIView(RetrieveUpdateAPIView):
     def put(self, request: Request, *args: dict[str, Any], **kwargs: dict[str, Any]) -> Response:
         raise exceptions.MethodNotAllowed("PUT")
 
+class AsyncRetrieveUpdateUserAPIView(AsyncAPIViewMixin, RetrieveUpdateUserAPIView):
+
+    async def get(self, request: Request, *args: dict[str, Any], **kwargs: dict[str, Any]) -> Response:
+        """Return user on GET request."""
+
+        self.check_object_permissions(self.request, User(pk=kwargs['pk']))
+        # The stamp, the cached profile and a render on a miss take one hop.
+        return await sync_to_async(self.retrieve_profile)(request, kwargs['pk'])
+
+    async def patch(self, request: Request, *args: dict[str, Any], **kwargs: dict[str, Any]) -> Response:
+        """Return updated user."""
+
+        # The row lock, the preconditions and the write share one transaction,
+        # which cannot span awaits.
+        return await sync_to_async(super().patch)(request, *args, **kwargs)
+
+class UserStatisticAPIView(GenericAPIView):
+    """
+    Engagement statistics of a user, served from the rollups
+    """
+    serializer_class = UserStatisticSerializer
+    permission_classes = [IsAuthenticated, IsOwnerUserObject]
+    filter_backends = []
+
+    @swagger_auto_schema(
+        operation_id='Get user statistics',
+        query_serializer=StatisticQuerySerializer,
+        responses={
+            status.HTTP_200_OK: UserStatisticSerializer,
+            status.HTTP_400_BAD_REQUEST: SwaggerResponses.get_validation_error_schema(),
+            status.HTTP_401_UNAUTHORIZED: SwaggerResponses.get_common_schema('Unathorized', 401, 'bad_credentials'),
+            status.HTTP_403_FORBIDDEN: SwaggerResponses.get_common_schema('Forbidden', 403, 'permission_denied'),
+            status.HTTP_500_INTERNAL_SERVER_ERROR: SwaggerResponses.get_common_schema('Internal server error', 500, 'internal_server_error')
+        }
+    )
+    def get(self, request: Request, *args: dict[str, Any], **kwargs: dict[str, Any]) -> Response:
+        """Return totals, the rolling week and the last days of a user."""
+        self.check_object_permissions(self.request, User(pk=kwargs['pk']))
+        query = StatisticQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        serializer = self.serializer_class(get_statistics(kwargs['pk'], days=query.validated_data['days']))
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+class StatisticSummaryAPIView(GenericAPIView):
+    """
+    Engagement statistics of all users per day, for research dashboards
+    """
+    serializer_class = DailySummarySerializer
+    permission_classes = [IsAdminUser]
+    filter_backends = []
+
+    @swagger_auto_schema(
+        operation_id='Get statistics summary',
+        query_serializer=StatisticQuerySerializer,
+        responses={
+            status.HTTP_200_OK: DailySummarySerializer(many=True),
+            status.HTTP_400_BAD_REQUEST: SwaggerResponses.get_validation_error_schema(),
+            status.HTTP_401_UNAUTHORIZED: SwaggerResponses.get_common_schema('Unathorized', 401, 'bad_credentials'),
+            status.HTTP_403_FORBIDDEN: SwaggerResponses.get_common_schema('Forbidden', 403, 'permission_denied'),
+            status.HTTP_500_INTERNAL_SERVER_ERROR: SwaggerResponses.get_common_schema('Internal server error', 500, 'internal_server_error')
+        }
+    )
+    def get(self, request: Request) -> Response:
+        """Return per-day sums over all users, newest first."""
+        query = StatisticQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        serializer = self.serializer_class(get_daily_summary(days=query.validated_data['days']), many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+class UserExportAPIView(GenericAPIView):
+    """
+    Streaming export of users with their profiles for research analysis
+    """
+    permission_classes = [IsAdminUser]
+    filter_backends = []
+
+    @swagger_auto_schema(
+        operation_id='Export users',
+        query_serializer=ExportQuerySerializer,
+        responses={
+            status.HTTP_200_OK: 'NDJSON or CSV stream, gzip compressed on request',
+            status.HTTP_400_BAD_REQUEST: SwaggerResponses.get_validation_error_schema(),
+            status.HTTP_401_UNAUTHORIZED: SwaggerResponses.get_common_schema('Unathorized', 401, 'bad_credentials'),
+            status.HTTP_403_FORBIDDEN: SwaggerResponses.get_common_schema('Forbidden', 403, 'permission_denied'),
+            status.HTTP_500_INTERNAL_SERVER_ERROR: SwaggerResponses.get_common_schema('Internal server error', 500, 'internal_server_error')
+        }
+    )
+    def get(self, request: Request) -> StreamingHttpResponse:
+        """Stream every user row, rendered while it is read from the database."""
+        query = ExportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        options = query.validated_data
+
+        chunks = export_stream(options['output'], options['research_only'], options['gzip'])
+        if isinstance(request._request, ASGIRequest):
+            chunks = iterate_in_thread(chunks)
+        response = StreamingHttpResponse(
+            chunks,
+            content_type='application/gzip' if options['gzip'] else EXPORT_FORMATS[options['output']][0],
+        )
+        response['Content-Disposition'] = 'attachment; filename="%s"' % export_filename(options['output'], options['gzip'])
+        return response
+
 class RequestPasswordResetEmail(CreateAPIView):
     serializer_class = ResetPasswordEmailRequestSerializer
     
@@ -146,14 +372,36 @@ class RequestPasswordResetEmail(CreateAPIView):
         serializer = self.serializer_class(data=request.data)
         try:
             serializer.is_valid(raise_exception=True)
+            email = serializer.validated_data['email']
             code = id_generator(6)
-            if publish_email({'type':'forgot_password_code', 'to':email, 'code': code}) and setKey(email, code, timeout=180):
-                dataresponse = 'We have sent you a link to reset your password, key lifetime 180 sec'
-                return Response({'success': dataresponse}, status=status.HTTP_200_OK)
+            # The email event and the code are committed together, the
+            # outbox relay delivers the email.
+            with transaction.atomic():
+                enqueue_event({'type':'forgot_password_code', 'to':email, 'code': code})
+                transaction.on_commit(lambda: setKey(reset_code_key(email), code, timeout=180, namespace=RESET_CODE_NAMESPACE))
+            dataresponse = 'We have sent you a link to reset your password, key lifetime 180 sec'
+            return Response({'success': dataresponse}, status=status.HTTP_200_OK)
             
         except serializers.ValidationError as e:
             raise serializers.ValidationError(e.args[0])
     
+class AsyncRequestPasswordResetEmail(AsyncAPIViewMixin, RequestPasswordResetEmail):
+
+    async def post(self, request: Request) -> Response:
+
+        serializer = self.serializer_class(data=request.data, context={'check_exists': False})
+        serializer.is_valid(raise_exception=True)
+        email = serializer.validated_data['email']
+        if not await aexists(User.objects.by_email(email)):
+            raise serializers.ValidationError({'email': serializer.email_not_found().detail})
+
+        code = id_generator(6)
+        # The relay publishes the event, the code is set once it is committed.
+        await aenqueue_event({'type':'forgot_password_code', 'to':email, 'code': code})
+        await sync_to_async(setKey)(reset_code_key(email), code, timeout=180, namespace=RESET_CODE_NAMESPACE)
+        dataresponse = 'We have sent you a link to reset your password, key lifetime 180 sec'
+        return Response({'success': dataresponse}, status=status.HTTP_200_OK)
+    
 class PasswordTokenCheckAPI(CreateAPIView):
     serializer_class = SetNewPasswordByCodeSerializer
 